@@ -1,16 +1,27 @@
 import os
 
-from flask import Flask
+from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from sqlalchemy import event
+from sqlalchemy.exc import InterfaceError, OperationalError
 from sqlalchemy.orm import DeclarativeBase
 
+from user_cache import DatabaseUnavailable, UserCache
+
 class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
 login_manager = LoginManager()
 
+# Signed-in users are loaded from this cache rather than Postgres on every request
+user_cache = UserCache(
+    max_entries=int(os.environ.get("USER_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.environ.get("USER_CACHE_TTL", "60")),
+    retry_after=float(os.environ.get("USER_CACHE_DB_RETRY", "5")),
+)
+
 # create the app
 app = Flask(__name__)
 
@@ -33,7 +44,29 @@ with app.app_context():
     import models
     db.create_all()
 
+    # Profile writes drop the cached snapshot; bulk query.update() calls bypass these
+    @event.listens_for(models.User, "after_update")
+    @event.listens_for(models.User, "after_delete")
+    def invalidate_cached_user(mapper, connection, target):
+        user_cache.invalidate(target.id)
+
+def query_user(user_id):
+    from models import User
+    try:
+        return User.query.get(user_id)
+    except (OperationalError, InterfaceError):
+        db.session.rollback()
+        raise
+
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id), query_user, connection_errors=(OperationalError, InterfaceError))
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    return ("DB001: The database is unavailable. Please try again shortly.", 503,
+            {"Retry-After": str(max(1, round(user_cache.retry_after)))})
+
+@app.route("/health/user-cache")
+def user_cache_stats():
+    return jsonify(user_cache.stats())
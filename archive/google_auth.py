@@ -1,7 +1,12 @@
 import json
+import logging
 import os
+import re
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
 from flask import Blueprint, redirect, request, url_for, flash
 from flask_login import login_required, login_user, logout_user
 from oauthlib.oauth2 import WebApplicationClient
@@ -10,7 +15,18 @@ from app import db
 
 GOOGLE_CLIENT_ID = os.environ["GOOGLE_OAUTH_CLIENT_ID"]
 GOOGLE_CLIENT_SECRET = os.environ["GOOGLE_OAUTH_CLIENT_SECRET"]
-GOOGLE_DISCOVERY_URL = "https://accounts.google.com/.well-known/openid-configuration"
+# Overridable so the flow can run against a local stand-in (stub_identity_provider.py)
+GOOGLE_DISCOVERY_URL = os.environ.get(
+    "GOOGLE_DISCOVERY_URL", "https://accounts.google.com/.well-known/openid-configuration")
+
+# Discovery and signing keys are cached; Cache-Control max-age wins over the default
+PROVIDER_CACHE_TTL = float(os.environ.get("GOOGLE_PROVIDER_CACHE_TTL", "3600"))
+# While Google is unreachable the stale copy is served, retrying this often
+PROVIDER_RETRY_AFTER = 30
+# (connect, read) seconds for every call to Google
+PROVIDER_TIMEOUT = (float(os.environ.get("GOOGLE_CONNECT_TIMEOUT", "3")),
+                    float(os.environ.get("GOOGLE_READ_TIMEOUT", "10")))
+PROVIDER_POOL_SIZE = int(os.environ.get("GOOGLE_POOL_SIZE", "10"))
 
 # Configure redirect URL for Google OAuth
 PRODUCTION_URL = "https://gosolo.nyc"
@@ -18,10 +34,109 @@ CALLBACK_PATH = "/auth/google/callback"
 
 client = WebApplicationClient(GOOGLE_CLIENT_ID)
 google_auth = Blueprint("google_auth", __name__)
+logger = logging.getLogger(__name__)
+
+def make_provider_session():
+    """One keep-alive pool shared by every call to the provider"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=PROVIDER_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+provider_session = make_provider_session()
+
+class CachedDocument:
+    """
+    A JSON document from the provider, kept for its TTL and then revalidated.
+
+    Revalidation sends If-None-Match, so an unchanged document costs a 304.
+    If the provider can't be reached, the stale copy is served instead of
+    failing the sign-in, and the provider is retried every
+    PROVIDER_RETRY_AFTER seconds rather than on every request.
+    """
+
+    def __init__(self, url, default_ttl=PROVIDER_CACHE_TTL):
+        self.url = url
+        self.default_ttl = default_ttl
+        self.document = None
+        self.etag = None
+        self.expires = 0.0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.fetches = 0
+        self.revalidated = 0
+        self.stale_served = 0
+
+    def get(self):
+        if self.document is not None and time.monotonic() < self.expires:
+            self.hits += 1
+            return self.document
+        with self.lock:
+            # Another request may have refreshed it while we waited
+            if self.document is not None and time.monotonic() < self.expires:
+                self.hits += 1
+                return self.document
+            try:
+                self.refresh()
+            except (requests.RequestException, ValueError) as e:
+                if self.document is None:
+                    raise
+                self.stale_served += 1
+                self.expires = time.monotonic() + PROVIDER_RETRY_AFTER
+                logger.warning(f"Serving stale {self.url}: {str(e)}")
+            return self.document
+
+    def refresh(self):
+        headers = {"If-None-Match": self.etag} if self.etag and self.document is not None else {}
+        response = provider_session.get(self.url, headers=headers, timeout=PROVIDER_TIMEOUT)
+        if response.status_code == 304:
+            self.revalidated += 1
+        else:
+            response.raise_for_status()
+            self.document = response.json()
+            self.etag = response.headers.get("ETag")
+            self.fetches += 1
+        self.expires = time.monotonic() + self.ttl_for(response.headers.get("Cache-Control"))
+
+    def ttl_for(self, cache_control):
+        match = re.search(r"max-age=(\d+)", cache_control or "")
+        return int(match.group(1)) if match else self.default_ttl
+
+    def invalidate(self):
+        """Revalidate on the next get(), e.g. after an id token names an unknown key"""
+        self.expires = 0.0
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "cached": self.document is not None,
+            "hits": self.hits,
+            "fetches": self.fetches,
+            "revalidated": self.revalidated,
+            "stale_served": self.stale_served,
+        }
+
+provider_config = CachedDocument(GOOGLE_DISCOVERY_URL)
+_signing_keys = {}  # jwks_uri -> CachedDocument
+
+def get_google_provider_cfg():
+    return provider_config.get()
+
+def get_signing_keys():
+    """Google's JWKS from the discovery document's jwks_uri, cached like the discovery document"""
+    jwks_uri = get_google_provider_cfg()["jwks_uri"]
+    if jwks_uri not in _signing_keys:
+        _signing_keys[jwks_uri] = CachedDocument(jwks_uri)
+    return _signing_keys[jwks_uri].get()
+
+def provider_cache_stats():
+    return [provider_config.stats()] + [keys.stats() for keys in _signing_keys.values()]
 
 @google_auth.route("/auth/google")
 def login():
-    google_provider_cfg = requests.get(GOOGLE_DISCOVERY_URL).json()
+    google_provider_cfg = get_google_provider_cfg()
     authorization_endpoint = google_provider_cfg["authorization_endpoint"]
     callback_url = request.base_url.replace("http://", "https://") + "/callback"
 
@@ -35,7 +150,7 @@ def login():
 @google_auth.route("/auth/google/callback")
 def callback():
     code = request.args.get("code")
-    google_provider_cfg = requests.get(GOOGLE_DISCOVERY_URL).json()
+    google_provider_cfg = get_google_provider_cfg()
     token_endpoint = google_provider_cfg["token_endpoint"]
 
     callback_url = request.base_url.replace("http://", "https://")
@@ -46,18 +161,19 @@ def callback():
         redirect_url=callback_url,
         code=code,
     )
-    token_response = requests.post(
+    token_response = provider_session.post(
         token_url,
         headers=headers,
         data=body,
         auth=(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET),
+        timeout=PROVIDER_TIMEOUT,
     )
 
     client.parse_request_body_response(json.dumps(token_response.json()))
 
     userinfo_endpoint = google_provider_cfg["userinfo_endpoint"]
     uri, headers, body = client.add_token(userinfo_endpoint)
-    userinfo_response = requests.get(uri, headers=headers, data=body)
+    userinfo_response = provider_session.get(uri, headers=headers, data=body, timeout=PROVIDER_TIMEOUT)
 
     userinfo = userinfo_response.json()
     if userinfo.get("email_verified"):
@@ -75,6 +191,11 @@ def callback():
         # If new user, redirect to register page with pre-filled data
         return redirect(f'/register?name={users_name}&email={users_email}')
 
+@google_auth.errorhandler(requests.RequestException)
+def provider_unavailable(e):
+    logger.error(f"Google sign-in failed: {str(e)}")
+    return "Google sign-in is unavailable right now. Please try again.", 503
+
 @google_auth.route("/auth/logout")
 @login_required
 def logout():
@@ -0,0 +1,134 @@
+"""
+Local stand-in for Google's OpenID provider, for exercising google_auth.py.
+Serves a discovery document and JWKS with ETag / max-age, an authorization
+endpoint that redirects straight back with a code, a token endpoint and a
+userinfo endpoint. GET /__stats reports requests per path and connections
+opened, which shows the caching and connection pooling at work.
+
+Usage:
+    python archive/stub_identity_provider.py --port 3960 --max-age 60
+    GOOGLE_DISCOVERY_URL=http://127.0.0.1:3960/.well-known/openid-configuration \
+        OAUTHLIB_INSECURE_TRANSPORT=1 python archive/main.py
+"""
+import argparse
+import hashlib
+import http.server
+import json
+import threading
+from urllib.parse import parse_qs, urlencode, urlparse
+
+DISCOVERY_PATH = '/.well-known/openid-configuration'
+
+class StubIdentityProviderHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so pooled sessions can reuse connections
+
+    # Set from the command line in main()
+    base_url = ''
+    max_age = 60
+    email = 'climber@example.com'
+    given_name = 'Stub'
+
+    lock = threading.Lock()
+    requests = {}
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            StubIdentityProviderHandler.connections += 1
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.count(path)
+        if path == DISCOVERY_PATH:
+            self.send_document({
+                'issuer': self.base_url,
+                'authorization_endpoint': f'{self.base_url}/o/oauth2/v2/auth',
+                'token_endpoint': f'{self.base_url}/token',
+                'userinfo_endpoint': f'{self.base_url}/v1/userinfo',
+                'jwks_uri': f'{self.base_url}/oauth2/v3/certs',
+            })
+        elif path == '/oauth2/v3/certs':
+            self.send_document({'keys': [{'kty': 'RSA', 'kid': 'stub', 'alg': 'RS256', 'use': 'sig',
+                                          'n': 'stub', 'e': 'AQAB'}]})
+        elif path == '/o/oauth2/v2/auth':
+            query = parse_qs(urlparse(self.path).query)
+            location = query['redirect_uri'][0] + '?' + urlencode(
+                {'code': 'stub-code', 'state': query.get('state', [''])[0]})
+            self.respond(302, b'', 'text/plain', [('Location', location)])
+        elif path == '/v1/userinfo':
+            self.respond_json({'sub': '1', 'email': self.email, 'email_verified': True,
+                               'given_name': self.given_name})
+        elif path == '/__stats':
+            with self.lock:
+                self.respond_json({'requests': dict(self.requests), 'connections': self.connections})
+        else:
+            self.respond(404, b'Not found', 'text/plain')
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        self.count(path)
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        if length:
+            self.rfile.read(length)
+        if path == '/token':
+            self.respond_json({'access_token': 'stub-access-token', 'token_type': 'Bearer',
+                               'expires_in': 3600, 'scope': 'openid email profile'})
+        else:
+            self.respond(404, b'Not found', 'text/plain')
+
+    def count(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def send_document(self, document):
+        """A cacheable document: ETag plus max-age, 304 when the client's copy is current"""
+        body = json.dumps(document).encode()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        headers = [('ETag', etag), ('Cache-Control', f'public, max-age={self.max_age}')]
+        if self.headers.get('If-None-Match') == etag:
+            self.respond(304, b'', None, headers)
+        else:
+            self.respond(200, body, 'application/json', headers)
+
+    def respond_json(self, payload):
+        self.respond(200, json.dumps(payload).encode(), 'application/json', [('Cache-Control', 'no-store')])
+
+    def respond(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        for header, value in headers:
+            self.send_header(header, value)
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"[stub idp] {format % args}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3960)
+    parser.add_argument('--max-age', type=int, default=60, help='Cache-Control max-age of discovery and JWKS')
+    parser.add_argument('--email', default='climber@example.com', help='Verified email userinfo returns')
+    args = parser.parse_args()
+
+    StubIdentityProviderHandler.base_url = f'http://{args.host}:{args.port}'
+    StubIdentityProviderHandler.max_age = args.max_age
+    StubIdentityProviderHandler.email = args.email
+
+    with http.server.ThreadingHTTPServer((args.host, args.port), StubIdentityProviderHandler) as httpd:
+        httpd.daemon_threads = True
+        print(f"Stub identity provider on {StubIdentityProviderHandler.base_url} "
+              f"(discovery at {DISCOVERY_PATH}, max-age {args.max_age}s)", flush=True)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+logger = logging.getLogger(__name__)
+
+# Columns a request needs to know who is signed in; password_hash stays in the database
+SNAPSHOT_FIELDS = ("id", "username", "email", "home_gym", "member_since", "profile_photo")
+
+class UserSnapshot(UserMixin):
+    """Detached, read-only copy of a User row, safe to share between requests"""
+
+    def __init__(self, user):
+        for field in SNAPSHOT_FIELDS:
+            setattr(self, field, getattr(user, field))
+
+    def __repr__(self):
+        return f"<UserSnapshot {self.id} {self.username}>"
+
+class DatabaseUnavailable(Exception):
+    """Raised instead of querying while the database is known to be down (DB001)"""
+
+class UserCache:
+    """
+    Bounded TTL cache of UserSnapshots for login_manager.user_loader.
+
+    Entries are dropped when the user row is updated or deleted (see
+    invalidate()). When loading fails because the database can't be reached,
+    cached snapshots are served past their TTL and misses fail fast with
+    DatabaseUnavailable for `retry_after` seconds, so an outage costs one
+    connection attempt per window rather than one per request.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60.0, retry_after=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.entries = OrderedDict()  # user_id -> (snapshot, expires)
+        self.lock = threading.Lock()
+        self.db_down_until = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.invalidations = 0
+        self.db_errors = 0
+        self.fast_failures = 0
+
+    def get(self, user_id, load, connection_errors=()):
+        """
+        The snapshot for user_id, calling load(user_id) on a miss.
+
+        Args:
+            user_id: Primary key of the user
+            load: Returns the User row or None
+            connection_errors: Exception types meaning the database is unreachable
+        """
+        now = time.monotonic()
+        with self.lock:
+            cached = self.entries.get(user_id)
+            if cached is not None and (now < cached[1] or now < self.db_down_until):
+                self.entries.move_to_end(user_id)
+                if now < cached[1]:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+                return cached[0]
+            if now < self.db_down_until:
+                self.fast_failures += 1
+                raise DatabaseUnavailable(f"Database unavailable, retrying in {self.db_down_until - now:.1f}s")
+            self.misses += 1
+
+        try:
+            user = load(user_id)
+        except connection_errors as e:
+            with self.lock:
+                self.db_errors += 1
+                self.db_down_until = time.monotonic() + self.retry_after
+                cached = self.entries.get(user_id)
+            logger.critical(f"DB001 Database connection failed while loading user {user_id}; "
+                            f"serving cached users only for {self.retry_after}s: {str(e)}")
+            if cached is not None:
+                return cached[0]
+            raise DatabaseUnavailable(str(e)) from e
+
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        snapshot = UserSnapshot(user)
+        with self.lock:
+            self.entries[user_id] = (snapshot, time.monotonic() + self.ttl)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self.lock:
+            if self.entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.stale_hits) / lookups, 3) if lookups else None,
+                "invalidations": self.invalidations,
+                "db_errors": self.db_errors,
+                "fast_failures": self.fast_failures,
+                "db_available": time.monotonic() >= self.db_down_until,
+            }
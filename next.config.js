@@ -1,6 +1,8 @@
 /** @type {import('next').NextConfig} */
 const nextConfig = {
   reactStrictMode: true,
+  // Each extra proxy-supervised dev worker builds into its own directory
+  distDir: process.env.NEXT_DIST_DIR || '.next',
   // swcMinify is deprecated in Next.js 13+
   images: {
     domains: ['res.cloudinary.com'],
@@ -6,68 +6,875 @@ This server forwards requests to a Next.js server and handles static files
 import os
 import sys
 import json
+import signal
+import socket
+import asyncio
 import mimetypes
+import http.client
 import http.server
 import socketserver
 import subprocess
 import threading
 import time
-import urllib.request
-import urllib.error
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from functools import partial
+from http import HTTPStatus
 from urllib.parse import urlparse, parse_qs
 
-PORT = 5000
-NEXT_SERVER_PORT = 3000  # Internal Next.js server port
+from src.server.utils import avatars
+from src.server.utils.access_log import (REQUEST_ID_HEADER, AccessLog, RotatingFile, SlowRequestLog, new_request_id,
+                                         request_id_for)
+from src.server.utils.admission import AdmissionController, RateLimiter, retry_after
+from src.server.utils.avatars import AvatarCache, avatar_etag, parse_avatar_request
+from src.server.utils.balancer import UpstreamGroup, UpstreamWorker
+from src.server.utils.compression import (StreamCompressor, VariantCache, compress, is_compressible,
+                                          negotiate_encoding, variant_etag)
+from src.server.utils.errors import (async_logging_stats, configure_async_logging, configure_error_aggregation,
+                                     error_window_stats)
+from src.server.utils.metrics import ConnectionStats, CountingWriter, ProxyMetrics, RequestSample, TunnelStats
+from src.server.utils.readiness import UpstreamReadiness
+from src.server.utils.resilience import BREAKER_STATES, CircuitBreaker, LatencyWindow, RetryBudget
+from src.server.utils.resource_monitor import ResourceMonitor
+from src.server.utils.response_cache import FRESH, ResponseCache
+from src.server.utils.responsive_images import NEGOTIATED_HEADERS, ResponsiveImageIndex, width_hint
+from src.server.utils.static_files import IMMUTABLE_CACHE_CONTROL, StaticFileIndex, etag_matches, plan_static_response
+from src.server.utils.tunnel import (is_event_stream, is_upgrade, read_refusal_body, read_refusal_body_async,
+                                    read_response_head, refusal_response, relay_sockets, relay_streams,
+                                    response_status)
+from src.server.utils.upstream_pool import PoolTimeout, UpstreamConnectionPool, set_read_timeout
+from src.server.utils.warmup import pick_warmup_routes, warm_routes
+
+PORT = int(os.environ.get('PROXY_PORT', '5000'))
+NEXT_SERVER_PORT = int(os.environ.get('NEXT_SERVER_PORT', '3000'))  # Internal Next.js server port
+# Proxy to upstreams that are already running (e.g. the benchmark's stub)
+# instead of starting and supervising Next.js ourselves
+NEXT_EXTERNAL = os.environ.get('NEXT_EXTERNAL', '0') == '1'
 STATIC_DIR = os.path.join(os.getcwd(), 'public')
 
+# Seconds to wait on the Next.js server: to connect, then for each read
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', '2'))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', '10'))
+
+# A worker's circuit opens after UPSTREAM_BREAKER_FAILURES failures or timeouts in a
+# row; its requests then fail fast until, UPSTREAM_BREAKER_RESET seconds later, a probe
+# request succeeds. Idempotent requests without a body are retried on another worker
+# up to UPSTREAM_RETRIES times, within a budget of UPSTREAM_RETRY_BUDGET of recent
+# requests. UPSTREAM_HEDGE=1 sends a second copy of a GET still unanswered after the
+# UPSTREAM_HEDGE_PERCENTILE of recent response times, drawing on the same budget
+UPSTREAM_BREAKER_FAILURES = int(os.environ.get('UPSTREAM_BREAKER_FAILURES', '5'))
+UPSTREAM_BREAKER_RESET = float(os.environ.get('UPSTREAM_BREAKER_RESET', '5'))
+UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', '1'))
+UPSTREAM_RETRY_BUDGET = float(os.environ.get('UPSTREAM_RETRY_BUDGET', '0.1'))
+UPSTREAM_RETRY_MIN_PER_SECOND = float(os.environ.get('UPSTREAM_RETRY_MIN_PER_SECOND', '1'))
+UPSTREAM_HEDGE = os.environ.get('UPSTREAM_HEDGE', '0') == '1'
+UPSTREAM_HEDGE_PERCENTILE = float(os.environ.get('UPSTREAM_HEDGE_PERCENTILE', '0.95'))
+UPSTREAM_HEDGE_MIN_DELAY = float(os.environ.get('UPSTREAM_HEDGE_MIN_DELAY', '0.05'))
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+# Serving engine: 'threaded' (worker pool), 'asyncio' (event loop) or
+# 'legacy' (the original one-request-at-a-time TCPServer, kept for comparison)
+PROXY_MODE = os.environ.get('PROXY_MODE', 'threaded').lower()
+PROXY_WORKERS = int(os.environ.get('PROXY_WORKERS', '64'))  # threaded mode
+PROXY_MAX_CONCURRENCY = int(os.environ.get('PROXY_MAX_CONCURRENCY', '1000'))  # asyncio mode
+PROXY_MODES = ('threaded', 'asyncio', 'legacy')
+
+# Bodies are relayed in pieces of this size so per-request memory stays flat
+PROXY_CHUNK_SIZE = int(os.environ.get('PROXY_CHUNK_SIZE', str(64 * 1024)))
+
+# Threaded mode keeps client connections open (HTTP/1.1 keep-alive) for up to
+# PROXY_KEEPALIVE_MAX_REQUESTS requests, closing them after PROXY_KEEPALIVE_TIMEOUT idle
+# seconds. An idle connection holds a worker thread, so it is closed straight away
+# while accepted connections are waiting for one
+PROXY_KEEPALIVE = os.environ.get('PROXY_KEEPALIVE', '1') != '0'
+PROXY_KEEPALIVE_TIMEOUT = float(os.environ.get('PROXY_KEEPALIVE_TIMEOUT', '5'))
+PROXY_KEEPALIVE_MAX_REQUESTS = int(os.environ.get('PROXY_KEEPALIVE_MAX_REQUESTS', '100'))
+
+# WebSocket upgrades (e.g. Next.js HMR) are tunneled as raw bytes and Server-Sent Event
+# responses streamed without a deadline. Either closes after TUNNEL_IDLE_TIMEOUT seconds
+# without traffic, buffers at most TUNNEL_BUFFER_BYTES per direction, and at most
+# TUNNEL_MAX_OPEN are open at once (each holds a worker thread in threaded mode)
+TUNNEL_IDLE_TIMEOUT = float(os.environ.get('TUNNEL_IDLE_TIMEOUT', '300'))
+TUNNEL_BUFFER_BYTES = int(os.environ.get('TUNNEL_BUFFER_BYTES', str(256 * 1024)))
+TUNNEL_MAX_OPEN = int(os.environ.get('TUNNEL_MAX_OPEN', str(max(1, PROXY_WORKERS // 2))))
+
+# Next.js workers listen on consecutive ports from NEXT_SERVER_PORT ('auto' = one per CPU)
+# and are picked per request by 'least-connections' or 'p2c' (power of two choices)
+NEXT_WORKERS = os.environ.get('NEXT_WORKERS', '1')
+NEXT_WORKERS = (os.cpu_count() or 1) if NEXT_WORKERS == 'auto' else int(NEXT_WORKERS)
+UPSTREAM_BALANCE = os.environ.get('UPSTREAM_BALANCE', 'least-connections')
+WORKER_RESTART_BACKOFF_MAX = 30  # Seconds between restarts of a crash-looping worker
+
+# 'development' runs `next dev`, which compiles each page on its first request.
+# 'production' runs `next build` once and serves the result with `next start`; each
+# worker is sent the busiest routes (NEXT_WARMUP_ROUTES, else the access log at
+# NEXT_WARMUP_ACCESS_LOG or ACCESS_LOG, else what this proxy has served) before it counts as ready.
+# SIGHUP then rebuilds and starts new workers next to the old ones, switches over once
+# they are warm and stops the old ones after their in-flight requests finish
+NEXT_MODE = os.environ.get('NEXT_MODE', 'development').lower()
+NEXT_BUILD_TIMEOUT = float(os.environ.get('NEXT_BUILD_TIMEOUT', '900'))
+NEXT_WARMUP_ROUTES = [route.strip() for route in os.environ.get('NEXT_WARMUP_ROUTES', '').split(',')]
+NEXT_WARMUP_ACCESS_LOG = os.environ.get('NEXT_WARMUP_ACCESS_LOG', '')
+NEXT_WARMUP_LIMIT = int(os.environ.get('NEXT_WARMUP_LIMIT', '20'))
+NEXT_WARMUP_TIMEOUT = float(os.environ.get('NEXT_WARMUP_TIMEOUT', '30'))  # Per route
+NEXT_SWITCHOVER_TIMEOUT = float(os.environ.get('NEXT_SWITCHOVER_TIMEOUT', '300'))  # New workers must be warm by then
+NEXT_DRAIN_TIMEOUT = float(os.environ.get('NEXT_DRAIN_TIMEOUT', '30'))
+NEXT_PORT_BANK_OFFSET = 100  # Consecutive deploys alternate between two port ranges
+NEXT_MODES = ('development', 'production')
+
+# Keep-alive pool to each Next.js worker; idle sockets are dropped before Node's 5s keep-alive timeout
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', str(PROXY_WORKERS)))
+UPSTREAM_POOL_IDLE_TIMEOUT = float(os.environ.get('UPSTREAM_POOL_IDLE_TIMEOUT', '4'))
+
+# public/ files are answered directly from an in-memory index rescanned this often
+STATIC_FAST_PATH = os.environ.get('STATIC_FAST_PATH', '1') != '0'
+STATIC_INDEX_REFRESH = float(os.environ.get('STATIC_INDEX_REFRESH', '2'))
+
+# WebP/AVIF variants of public/images written by utils/icon_generator.py; requests for
+# an original are answered with the variant that best fits Accept and the width hint
+RESPONSIVE_IMAGES = os.environ.get('RESPONSIVE_IMAGES', '1') != '0'
+RESPONSIVE_IMAGE_MANIFEST = os.path.join(STATIC_DIR, 'images', '_variants', 'manifest.json')
+
+# Optional shared cache for upstream GET responses that are marked cacheable
+PROXY_CACHE = os.environ.get('PROXY_CACHE', '0') == '1'
+PROXY_CACHE_MAX_BYTES = int(os.environ.get('PROXY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+PROXY_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('PROXY_CACHE_MAX_ENTRY_BYTES', str(1024 * 1024)))
+PROXY_CACHE_STALE_WHILE_REVALIDATE = int(os.environ.get('PROXY_CACHE_STALE_WHILE_REVALIDATE', '0'))
+
+# Readiness comes from probing Next.js; requests arriving before it is ready
+# wait in a bounded queue for up to STARTUP_QUEUE_TIMEOUT seconds
+HEALTH_CHECK_PATH = os.environ.get('HEALTH_CHECK_PATH', '/api/health')
+HEALTH_CHECK_INTERVAL = float(os.environ.get('HEALTH_CHECK_INTERVAL', '5'))
+HEALTH_CHECK_TIMEOUT = float(os.environ.get('HEALTH_CHECK_TIMEOUT', '5'))
+STARTUP_QUEUE_SIZE = int(os.environ.get('STARTUP_QUEUE_SIZE', '32'))
+STARTUP_QUEUE_TIMEOUT = float(os.environ.get('STARTUP_QUEUE_TIMEOUT', '20'))
+
+# Admission control for requests bound for Next.js (0 disables each part). With
+# RATE_LIMIT_RPS set, each client gets a token bucket of that many requests a second
+# with bursts of RATE_LIMIT_BURST, keyed by address or by RATE_LIMIT_KEY=cookie:<name> /
+# header:<name> when present; X-Forwarded-For is only believed with
+# RATE_LIMIT_TRUST_FORWARDED=1. It is off by default: behind a reverse proxy (as on
+# Replit) every visitor has the same address and would share one bucket. At most
+# ADMISSION_MAX_CONCURRENT requests reach Next.js at once, and the overflow waits
+# in a short queue before being shed with a 503
+RATE_LIMIT_RPS = float(os.environ.get('RATE_LIMIT_RPS', '0'))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', '60'))
+RATE_LIMIT_KEY = os.environ.get('RATE_LIMIT_KEY', 'ip')
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get('RATE_LIMIT_TRUST_FORWARDED', '0') == '1'
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', '10000'))
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', str(32 * NEXT_WORKERS)))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', '64'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '1'))
+ADMISSION_PRIORITY_RESERVE = int(os.environ.get('ADMISSION_PRIORITY_RESERVE', '4'))
+# Health checks and build assets: never rate limited, and first in line under overload
+PRIORITY_PATHS = (HEALTH_CHECK_PATH, '/_next/static/', '/_next/image', '/favicon.ico')
+
+# gzip/brotli for text-like bodies of at least COMPRESSION_MIN_SIZE bytes. Streamed
+# responses use the faster levels; static files and cached responses are compressed
+# once and kept in memory, at the higher PRECOMPRESS levels up to
+# COMPRESSION_PRECOMPRESS_MAX_SIZE bytes (brotli 11 takes seconds on a few MB)
+COMPRESSION = os.environ.get('COMPRESSION', '1') != '0'
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_LEVEL = int(os.environ.get('COMPRESSION_BROTLI_LEVEL', '4'))
+COMPRESSION_PRECOMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESSION_PRECOMPRESS_GZIP_LEVEL', '9'))
+COMPRESSION_PRECOMPRESS_BROTLI_LEVEL = int(os.environ.get('COMPRESSION_PRECOMPRESS_BROTLI_LEVEL', '11'))
+COMPRESSION_PRECOMPRESS_MAX_SIZE = int(os.environ.get('COMPRESSION_PRECOMPRESS_MAX_SIZE', str(256 * 1024)))
+COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get('COMPRESSION_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+COMPRESSION_STATIC_MAX_SIZE = 8 * 1024 * 1024  # Larger static files are sent as is
+
+# log_error output: 'sync' writes on the calling thread, 'async' queues JSON lines for
+# a background writer; ERROR_LOG_OVERFLOW (drop-newest, drop-oldest or block) says
+# what happens when the queue is full
+ERROR_LOG_MODE = os.environ.get('ERROR_LOG_MODE', 'sync')
+ERROR_LOG_QUEUE_SIZE = int(os.environ.get('ERROR_LOG_QUEUE_SIZE', '10000'))
+ERROR_LOG_OVERFLOW = os.environ.get('ERROR_LOG_OVERFLOW', 'drop-newest')
+
+# Repeats of the same error within the window are logged once as a summary (0 disables);
+# ERROR_SAMPLE_RATES still lets a share of repeats through, e.g. "DB002=0.1,CACHE001=0"
+ERROR_AGGREGATION_WINDOW = float(os.environ.get('ERROR_AGGREGATION_WINDOW', '10'))
+ERROR_SAMPLE_RATES = {code.strip(): float(rate) for code, _, rate in
+                      (item.partition('=') for item in os.environ.get('ERROR_SAMPLE_RATES', '').split(',') if item)}
+
+# Access log: one JSON line per request (with its X-Request-ID, also passed to Next.js),
+# written in batches by a background thread to ACCESS_LOG ('-' for stdout, 'off' for
+# none). The file is rotated at ACCESS_LOG_MAX_BYTES or every ACCESS_LOG_ROTATE_SECONDS
+# (0 disables either), keeping ACCESS_LOG_BACKUPS old files. Successful requests faster
+# than ACCESS_LOG_SLOW_SECONDS are logged at ACCESS_LOG_SAMPLE_RATE; slower ones are
+# also kept in memory, the last ACCESS_LOG_SLOW_KEPT of them, for /__proxy/slow
+ACCESS_LOG = os.environ.get('ACCESS_LOG', '-')
+ACCESS_LOG_MAX_BYTES = int(os.environ.get('ACCESS_LOG_MAX_BYTES', str(64 * 1024 * 1024)))
+ACCESS_LOG_ROTATE_SECONDS = float(os.environ.get('ACCESS_LOG_ROTATE_SECONDS', '0'))
+ACCESS_LOG_BACKUPS = int(os.environ.get('ACCESS_LOG_BACKUPS', '5'))
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '1'))
+ACCESS_LOG_QUEUE_SIZE = int(os.environ.get('ACCESS_LOG_QUEUE_SIZE', '10000'))
+ACCESS_LOG_SLOW_SECONDS = float(os.environ.get('ACCESS_LOG_SLOW_SECONDS', '1'))
+ACCESS_LOG_SLOW_KEPT = int(os.environ.get('ACCESS_LOG_SLOW_KEPT', '100'))
+
+# /proc sampling of the proxy, its Next.js workers and the host (0 disables); the
+# thresholds log RES001-RES004 and are percentages except the network one (bytes/s)
+RESOURCE_MONITOR_INTERVAL = float(os.environ.get('RESOURCE_MONITOR_INTERVAL', '5'))
+RESOURCE_HISTORY = int(os.environ.get('RESOURCE_HISTORY', '720'))  # Samples kept
+RESOURCE_THRESHOLDS = {
+    'cpu_percent': float(os.environ.get('RESOURCE_CPU_THRESHOLD', '85')),
+    'memory_percent': float(os.environ.get('RESOURCE_MEMORY_THRESHOLD', '90')),
+    'disk_percent': float(os.environ.get('RESOURCE_DISK_THRESHOLD', '90')),
+    'network_bytes_per_second': float(os.environ.get('RESOURCE_NETWORK_THRESHOLD', str(100 * 1024 * 1024))),
+}
+
+# Avatars rendered on request under /avatars/ (needs numpy and Pillow)
+AVATAR_CACHE_MAX_BYTES = int(os.environ.get('AVATAR_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+
+PROXY_STATS_PATH = '/__proxy/stats'
+PROXY_READY_PATH = '/__proxy/ready'
+PROXY_LIVE_PATH = '/__proxy/live'
+PROXY_METRICS_PATH = '/__proxy/metrics'
+PROXY_RESOURCES_PATH = '/__proxy/resources'
+PROXY_SLOW_PATH = '/__proxy/slow'
+PROXY_ENDPOINTS = (PROXY_STATS_PATH, PROXY_READY_PATH, PROXY_LIVE_PATH, PROXY_METRICS_PATH, PROXY_RESOURCES_PATH,
+                   PROXY_SLOW_PATH)
+HOP_BY_HOP_HEADERS = ('connection', 'keep-alive', 'proxy-connection', 'te',
+                      'trailer', 'transfer-encoding', 'upgrade')
+
+STARTING_UP_BODY = b"<html><body><h1>Service Unavailable</h1><p>The Next.js server is starting up. Please try again in a moment.</p></body></html>"
+RATE_LIMITED_BODY = b"<html><body><h1>Too Many Requests</h1><p>Please slow down and try again in a moment.</p></body></html>"
+OVERLOADED_BODY = b"<html><body><h1>Service Unavailable</h1><p>The server is busy. Please try again in a moment.</p></body></html>"
+
 # Ensure proper MIME types are registered
-mimetypes.add_type('application/javascript', '.js')
-mimetypes.add_type('text/css', '.css')
-mimetypes.add_type('image/svg+xml', '.svg')
-mimetypes.add_type('application/json', '.json')
+REGISTERED_MIME_TYPES = {
+    '.js': 'application/javascript',
+    '.css': 'text/css',
+    '.svg': 'image/svg+xml',
+    '.json': 'application/json',
+}
+for extension, mime_type in REGISTERED_MIME_TYPES.items():
+    mimetypes.add_type(mime_type, extension)
+# Responsive image variants; already compressed, so not in REGISTERED_MIME_TYPES
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/avif', '.avif')
+
+# These, along with every text/* type, are compressed for clients that accept it
+COMPRESSIBLE_TYPES = frozenset(REGISTERED_MIME_TYPES.values())
+
+def probe_upstream(port):
+    """Health check against a Next.js worker; any non-5xx answer means it is serving"""
+    conn = http.client.HTTPConnection('localhost', port, timeout=HEALTH_CHECK_TIMEOUT)
+    try:
+        conn.request('GET', HEALTH_CHECK_PATH)
+        response = conn.getresponse()
+        response.read()
+        return response.status < 500
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        conn.close()
+
+def make_upstream_worker(index, port, generation=0, dist_dir=None):
+    """Build a worker with its own keep-alive pool and health check"""
+    def report_readiness(ready):
+        if ready:
+            print(f"✅ Next.js worker {index} ready on internal port {port}")
+        elif not worker.retired:
+            print(f"❌ Next.js worker {index} on port {port} is out of rotation")
+        upstream_readiness.mark(upstream.any_ready())
+
+    def probe():
+        # In production a worker is only ready once its busiest routes are rendered
+        if not probe_upstream(port):
+            return False
+        if NEXT_MODE == 'production' and worker.warmup is None:
+            warm_worker(worker)
+        return True
+
+    pool = UpstreamConnectionPool('localhost', port,
+                                  max_size=UPSTREAM_POOL_SIZE,
+                                  idle_timeout=UPSTREAM_POOL_IDLE_TIMEOUT,
+                                  timeout=UPSTREAM_READ_TIMEOUT,
+                                  connect_timeout=UPSTREAM_CONNECT_TIMEOUT)
+    readiness = UpstreamReadiness(probe, interval=HEALTH_CHECK_INTERVAL, on_change=report_readiness)
+    breaker = CircuitBreaker(f'next-worker-{index}-port-{port}', failure_threshold=UPSTREAM_BREAKER_FAILURES,
+                             reset_timeout=UPSTREAM_BREAKER_RESET)
+    worker = UpstreamWorker(index, port, pool, readiness, generation=generation, dist_dir=dist_dir, breaker=breaker)
+    return worker
+
+def warm_worker(worker):
+    access_log_path = NEXT_WARMUP_ACCESS_LOG or (ACCESS_LOG if ACCESS_LOG not in ('-', 'off') else None)
+    routes = pick_warmup_routes(NEXT_WARMUP_ROUTES, access_log_path,
+                                metrics.top_routes(NEXT_WARMUP_LIMIT * 2), NEXT_WARMUP_LIMIT)
+    print(f"🔥 Warming Next.js worker {worker.index} (port {worker.port}): {', '.join(routes)}")
+    worker.warmup = warm_routes(worker.port, routes, timeout=NEXT_WARMUP_TIMEOUT)
+    slowest = max(worker.warmup['routes'], key=lambda result: result['seconds'])
+    print(f"🔥 Worker {worker.index} warmed {len(routes)} routes in {worker.warmup['seconds']}s "
+          f"(slowest {slowest['route']}: {slowest['seconds']}s)")
+
+def production_dist_dir(generation):
+    # Two alternating build directories: one being served, one for the next build
+    return f'.next-prod-{generation % 2}'
+
+def worker_port(index, generation=0):
+    return NEXT_SERVER_PORT + (generation % 2) * NEXT_PORT_BANK_OFFSET + index
+
+upstream = UpstreamGroup([make_upstream_worker(i, worker_port(i),
+                                               dist_dir=production_dist_dir(0) if NEXT_MODE == 'production' else None)
+                          for i in range(NEXT_WORKERS)],
+                         strategy=UPSTREAM_BALANCE)
+
+# Ready while any worker is; this is also where not-yet-ready requests queue
+upstream_readiness = UpstreamReadiness(lambda: upstream.any_ready(), interval=HEALTH_CHECK_INTERVAL,
+                                       max_waiters=STARTUP_QUEUE_SIZE)
+
+static_index = StaticFileIndex(STATIC_DIR, refresh_interval=STATIC_INDEX_REFRESH)
+responsive_images = ResponsiveImageIndex(RESPONSIVE_IMAGE_MANIFEST, refresh_interval=STATIC_INDEX_REFRESH)
+
+rate_limiter = RateLimiter(RATE_LIMIT_RPS, RATE_LIMIT_BURST, RATE_LIMIT_MAX_CLIENTS) if RATE_LIMIT_RPS > 0 else None
+admission = AdmissionController(ADMISSION_MAX_CONCURRENT, max_queue=ADMISSION_QUEUE_SIZE,
+                                queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+                                priority_reserve=ADMISSION_PRIORITY_RESERVE) if ADMISSION_MAX_CONCURRENT > 0 else None
+
+def request_lane(path):
+    return 'priority' if path.split('?', 1)[0].startswith(PRIORITY_PATHS) else 'default'
+
+def client_key(address, get_header):
+    """Who a request counts against for rate limiting"""
+    source, _, name = RATE_LIMIT_KEY.partition(':')
+    if source == 'header' and get_header(name):
+        return f"{name}={get_header(name)}"
+    if source == 'cookie':
+        for cookie in (get_header('Cookie') or '').split(';'):
+            cookie_name, _, value = cookie.strip().partition('=')
+            if cookie_name == name and value:
+                return f"{name}={value}"
+    if RATE_LIMIT_TRUST_FORWARDED and get_header('X-Forwarded-For'):
+        return get_header('X-Forwarded-For').split(',', 1)[0].strip()
+    return address
+
+def rate_limit_wait(path, address, get_header):
+    """Seconds the client must wait before this request may be proxied; 0 to go ahead"""
+    if rate_limiter is None or request_lane(path) == 'priority':
+        return 0
+    return rate_limiter.check(client_key(address, get_header), path=path.split('?', 1)[0])
+
+def negotiate_image(path, entry, get_header):
+    """
+    The static entry to send for `path`, plus headers to add.
+
+    An image with responsive variants is answered with the best one for the
+    client. The original URL's Cache-Control is kept, since what it returns
+    now depends on the request headers.
+    """
+    if not RESPONSIVE_IMAGES:
+        return entry, []
+    variants = responsive_images.variants(path)
+    if variants is None:
+        return entry, []
+    variant = responsive_images.choose(variants, get_header('Accept'), width_hint(path, get_header))
+    if variant is not None:
+        variant_entry = static_index.lookup(variant.url)
+        if variant_entry is not None:
+            entry = variant_entry._replace(cache_control=entry.cache_control)
+    return entry, [('Vary', NEGOTIATED_HEADERS)]
+
+retry_budget = RetryBudget(UPSTREAM_RETRY_BUDGET, UPSTREAM_RETRY_MIN_PER_SECOND)
+upstream_latency = LatencyWindow()
+hedge_executor = ThreadPoolExecutor(max_workers=PROXY_WORKERS, thread_name_prefix='upstream-hedge') if UPSTREAM_HEDGE else None
+
+class UpstreamUnavailable(ConnectionError):
+    """No worker can take a request: none is healthy, or every healthy one's circuit is open"""
+
+    def __init__(self, circuit_open):
+        super().__init__("Every Next.js worker's circuit is open" if circuit_open else "No healthy Next.js worker")
+        self.circuit_open = circuit_open
+
+def request_upstream(method, path, body, headers):
+    """
+    Send a request to a Next.js worker and wait for the response head.
+
+    Idempotent requests without a body are retried on another worker while
+    the retry budget allows, and GETs are hedged when UPSTREAM_HEDGE is on.
+    Every failed attempt is counted in proxy_upstream_errors_total.
+
+    Returns:
+        tuple: (worker, connection, response); the caller hands back the worker
+        with upstream.release() and the connection with worker.pool.release()
+    """
+    retry_budget.record_request()
+    replayable = method in IDEMPOTENT_METHODS and body is None
+    tried = None
+    for attempt in range(UPSTREAM_RETRIES + 1):
+        worker = upstream.acquire(avoid=tried)
+        if worker is None:
+            circuit_open = upstream.circuit_open()
+            metrics.upstream_error('circuit_open' if circuit_open else 'unavailable')
+            raise UpstreamUnavailable(circuit_open)
+        try:
+            if method == 'GET' and replayable and hedge_executor is not None:
+                delay = upstream_latency.percentile(UPSTREAM_HEDGE_PERCENTILE)
+                if delay is not None:
+                    return hedged_request(worker, path, headers, max(UPSTREAM_HEDGE_MIN_DELAY, delay))
+            return timed_request(worker, method, path, headers, body)
+        except Exception as e:
+            attempt_failed(worker, e)
+            if not (replayable and attempt < UPSTREAM_RETRIES and retry_budget.try_spend()):
+                raise
+            tried = worker
+
+def timed_request(worker, method, path, headers, body=None):
+    started = time.perf_counter()
+    conn, response = worker.pool.request(method, path, body=body, headers=headers)
+    if method == 'GET':
+        upstream_latency.observe(time.perf_counter() - started)
+    return worker, conn, response
+
+def attempt_failed(worker, error):
+    """Count a failed upstream attempt against its worker"""
+    if isinstance(error, ConnectionRefusedError):
+        # The process is gone; stop routing to it until it passes a health check
+        worker.eject()
+    metrics.upstream_error(upstream_error_kind(error))
+    upstream.release(worker, failed=True)
+
+def discard_attempt(worker, future):
+    """Clean up after the losing half of a hedged GET, whenever it finishes"""
+    try:
+        _, conn, response = future.result()
+    except Exception as e:
+        attempt_failed(worker, e)
+        return
+    response.close()
+    worker.pool.release(conn, reusable=False)
+    upstream.release(worker)
+
+def hedged_request(worker, path, headers, delay):
+    """
+    GET from `worker` and, if no response head has arrived after `delay`,
+    send a copy to another worker; the first response wins and the other is
+    discarded. Like timed_request(), raises with `worker` still the caller's.
+    """
+    primary = hedge_executor.submit(timed_request, worker, 'GET', path, headers)
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeout:
+        pass
+    # A copy to the same slow worker would only add to its load
+    second = None
+    if upstream.has_alternative(worker) and retry_budget.try_spend('hedge'):
+        second = upstream.acquire(exclude=worker)
+    if second is None:
+        return primary.result()
+    hedge = hedge_executor.submit(timed_request, second, 'GET', path, headers)
+    owners = {primary: worker, hedge: second}
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winner = next((future for future in done if future.exception() is None), None)
+        if winner is not None:
+            if winner is hedge:
+                retry_budget.hedge_won()
+            for future in owners:
+                if future is not winner:
+                    future.add_done_callback(partial(discard_attempt, owners[future]))
+            return winner.result()
+    # Both failed
+    attempt_failed(second, hedge.exception())
+    return primary.result()
+
+def fetch_upstream(path, headers):
+    """Buffered GET against Next.js, used for background cache revalidation"""
+    headers = dict(headers, **{REQUEST_ID_HEADER: new_request_id()})
+    worker, conn, response = request_upstream('GET', path, None, headers)
+    failed = True
+    try:
+        reusable = False
+        try:
+            body = response.read()
+            reusable = not response.will_close
+            response_headers = [(header, value) for header, value in response.getheaders()
+                                if header.lower() not in HOP_BY_HOP_HEADERS]
+            failed = False
+            return response.status, response_headers, body
+        finally:
+            worker.pool.release(conn, reusable)
+    finally:
+        upstream.release(worker, failed)
+
+response_cache = ResponseCache(PROXY_CACHE_MAX_BYTES, PROXY_CACHE_MAX_ENTRY_BYTES, fetch_upstream,
+                               default_stale_while_revalidate=PROXY_CACHE_STALE_WHILE_REVALIDATE) if PROXY_CACHE else None
+
+compressed_variants = VariantCache(COMPRESSION_CACHE_MAX_BYTES)
+
+def compression_level(encoding, precompress=False):
+    if encoding == 'br':
+        return COMPRESSION_PRECOMPRESS_BROTLI_LEVEL if precompress else COMPRESSION_BROTLI_LEVEL
+    return COMPRESSION_PRECOMPRESS_GZIP_LEVEL if precompress else COMPRESSION_GZIP_LEVEL
+
+def compress_variant(data, encoding):
+    """Compress a body kept in memory; large ones at the on-the-fly level"""
+    precompress = len(data) <= COMPRESSION_PRECOMPRESS_MAX_SIZE
+    return compress(data, encoding, compression_level(encoding, precompress))
+
+def compression_eligible(content_type, size):
+    """Whether a body could be compressed; size is None when it isn't known up front"""
+    if not COMPRESSION or (size is not None and size < COMPRESSION_MIN_SIZE):
+        return False
+    return is_compressible(content_type, COMPRESSIBLE_TYPES)
+
+def without_range(get_header):
+    """Request header lookup that hides Range and If-Range"""
+    return lambda name: None if name.lower() in ('range', 'if-range') else get_header(name)
+
+def merge_vary(value):
+    """Add Accept-Encoding to a Vary header value"""
+    if not value:
+        return 'Accept-Encoding'
+    if 'accept-encoding' in value.lower() or value.strip() == '*':
+        return value
+    return f"{value}, Accept-Encoding"
+
+resource_monitor = ResourceMonitor(
+    interval=RESOURCE_MONITOR_INTERVAL, history=RESOURCE_HISTORY, disk_path=os.getcwd(),
+    thresholds=RESOURCE_THRESHOLDS,
+    processes=lambda: {f'next-worker-{worker.index}': worker.process.pid for worker in upstream.workers
+                       if worker.process is not None and worker.process.poll() is None})
+
+avatar_cache = AvatarCache(AVATAR_CACHE_MAX_BYTES)
+
+def avatar_for(path):
+    """(rgb, size) when path is a renderable avatar request, else None"""
+    if not avatars.available() or not path.startswith('/avatars/'):
+        return None
+    parsed = urlparse(path)
+    return parse_avatar_request(parsed.path, parse_qs(parsed.query).get('size', [None])[0])
 
-# Global flag to track if Next.js server is ready
-next_server_ready = False
+def avatar_response(request, if_none_match):
+    """Status, headers and body for an avatar request"""
+    color, size = request
+    etag = avatar_etag(color, size)
+    headers = [('ETag', etag), ('Cache-Control', IMMUTABLE_CACHE_CONTROL)]
+    if if_none_match and etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        return 304, headers, b''
+    body = avatar_cache.get(color, size)
+    headers += [('Content-Type', 'image/png'), ('Content-Length', str(len(body)))]
+    return 200, headers, body
+
+def resource_report():
+    """Payload for /__proxy/resources: current state plus the last five minutes"""
+    return dict(resource_monitor.stats(), history=resource_monitor.history(300))
+
+def proxy_stats():
+    """Snapshot of the proxy's internal counters for the stats endpoint"""
+    return {
+        'mode': PROXY_MODE,
+        'readiness': upstream_readiness.stats(),
+        'upstream': upstream.stats(),
+        'upstream_resilience': {
+            'connect_timeout_seconds': UPSTREAM_CONNECT_TIMEOUT,
+            'read_timeout_seconds': UPSTREAM_READ_TIMEOUT,
+            'retry_budget': retry_budget.stats(),
+            'hedging': UPSTREAM_HEDGE,
+            'latency': upstream_latency.stats(),
+        },
+        'deploy': deploy.stats(),
+        'admission': {
+            'rate_limit': rate_limiter.stats() if rate_limiter is not None else None,
+            'concurrency': admission.stats() if admission is not None else None,
+        },
+        'client_connections': client_connections.stats(),
+        'tunnels': tunnels.stats(),
+        'static_files': static_index.stats(),
+        'responsive_images': responsive_images.stats(),
+        'response_cache': response_cache.stats() if response_cache is not None else None,
+        'compression': compressed_variants.stats(),
+        'avatars': avatar_cache.stats(),
+        'access_log': access_log.stats() if access_log is not None else None,
+        'slow_requests': {'threshold_seconds': slow_requests.threshold, 'captured': slow_requests.captured},
+        'error_log': async_logging_stats(),
+        'errors': error_window_stats(),
+    }
+
+# Keep-alive reuse of client connections (threaded mode)
+client_connections = ConnectionStats()
+
+tunnels = TunnelStats(TUNNEL_MAX_OPEN)
+
+def open_access_log():
+    if ACCESS_LOG == 'off':
+        return None
+    stream = sys.stdout if ACCESS_LOG == '-' else RotatingFile(
+        ACCESS_LOG, max_bytes=ACCESS_LOG_MAX_BYTES, max_age=ACCESS_LOG_ROTATE_SECONDS, backups=ACCESS_LOG_BACKUPS)
+    return AccessLog(stream, sample_rate=ACCESS_LOG_SAMPLE_RATE, slow_seconds=ACCESS_LOG_SLOW_SECONDS,
+                     max_queue=ACCESS_LOG_QUEUE_SIZE)
+
+access_log = open_access_log()
+slow_requests = SlowRequestLog(ACCESS_LOG_SLOW_SECONDS, ACCESS_LOG_SLOW_KEPT)
+
+def record_access(sample, method, path, route, status, seconds, client, bytes_out, get_header):
+    """Hand a finished request to the access log and the slow-request ring"""
+    entry = {
+        'time': time.time(),
+        'id': sample.request_id or request_id_for(get_header),
+        'client': client,
+        'method': method,
+        'path': path,
+        'route': route,
+        'status': status,
+        'upstream_status': sample.upstream_status,
+        'worker': sample.worker,
+        'seconds': seconds,
+        'queue_seconds': sample.queue_seconds,
+        'upstream_seconds': sample.upstream_seconds,
+        'bytes_in': sample.bytes_in,
+        'bytes_out': bytes_out,
+        'user_agent': get_header('User-Agent') if get_header is not None else None,
+    }
+    slow_requests.observe(entry)
+    if access_log is not None:
+        access_log.record(entry)
+
+# Prometheus metrics; the per-worker gauges are read from the group at scrape time
+metrics = ProxyMetrics()
+metrics.register_gauge('proxy_client_connections_open', 'Client connections currently open.',
+                       lambda: [({}, client_connections.open)])
+metrics.register_gauge('proxy_client_connection_reuse_ratio',
+                       'Share of requests that arrived on an already used connection.',
+                       lambda: [({}, client_connections.stats()['reuse_rate'] or 0.0)])
+metrics.register_gauge('proxy_tunnels_open', 'Open WebSocket tunnels and Server-Sent Event streams.',
+                       lambda: [({'kind': kind}, count) for kind, count in tunnels.open.items()])
+metrics.register_gauge('proxy_upstream_in_flight', 'Requests in flight per Next.js worker.',
+                       lambda: [({'worker': worker.index}, worker.in_flight) for worker in upstream.workers])
+metrics.register_gauge('proxy_upstream_healthy', 'Whether each Next.js worker passes its health check.',
+                       lambda: [({'worker': worker.index}, int(worker.healthy)) for worker in upstream.workers])
+metrics.register_gauge('proxy_upstream_circuit_state',
+                       'Circuit breaker state per Next.js worker: 0 closed, 1 half-open, 2 open.',
+                       lambda: [({'worker': worker.index}, BREAKER_STATES.index(worker.breaker.state))
+                                for worker in upstream.workers])
+metrics.register_counter('proxy_upstream_retries_total', 'Retries and hedged requests sent to Next.js.',
+                         lambda: [({'kind': kind}, count) for kind, count in retry_budget.stats()['spent'].items()])
+metrics.register_gauge('proxy_startup_queue_waiting', 'Requests waiting for Next.js to become ready.',
+                       lambda: [({}, upstream_readiness.waiting)])
+if admission is not None:
+    metrics.register_gauge('proxy_admission_in_flight', 'Requests holding an upstream admission slot.',
+                           lambda: [({}, admission.in_flight)])
+    metrics.register_gauge('proxy_admission_waiting', 'Requests queued for an upstream admission slot, per lane.',
+                           lambda: [({'lane': lane}, waiting) for lane, waiting in admission.waiting.items()])
+    metrics.register_counter('proxy_admission_shed_total', 'Requests shed for lack of an upstream slot.',
+                             lambda: [({'lane': lane, 'reason': reason}, count)
+                                      for lane, reasons in admission.shed.items() for reason, count in reasons.items()])
+if access_log is not None:
+    metrics.register_counter('proxy_access_log_records_total', 'Access log records since start, by outcome.',
+                             lambda: [({'outcome': outcome}, getattr(access_log, outcome))
+                                      for outcome in ('written', 'sampled_out', 'dropped')])
+if rate_limiter is not None:
+    metrics.register_counter('proxy_rate_limited_total', 'Requests refused by the per-client rate limit.',
+                             lambda: [({}, rate_limiter.limited)])
+
+def upstream_error_kind(error):
+    """Classify an upstream failure for proxy_upstream_errors_total"""
+    if isinstance(error, (TimeoutError, PoolTimeout, asyncio.TimeoutError)):
+        return 'timeout'
+    if isinstance(error, ConnectionRefusedError):
+        return 'refused'
+    return 'error'
+
+def iter_body(rfile, length, chunk_size=PROXY_CHUNK_SIZE):
+    """Yield exactly `length` bytes from rfile in pieces of at most chunk_size"""
+    remaining = length
+    while remaining > 0:
+        chunk = rfile.read(min(chunk_size, remaining))
+        if not chunk:
+            raise ConnectionError("Client closed the connection mid-body")
+        remaining -= len(chunk)
+        yield chunk
+
+def iter_chunked_body(rfile, chunk_size=PROXY_CHUNK_SIZE):
+    """Decode a chunked transfer-encoded body from rfile, yielding its data"""
+    while True:
+        size_line = rfile.readline(1024)
+        if not size_line:
+            raise ConnectionError("Client closed the connection mid-body")
+        size = int(size_line.split(b';', 1)[0].strip(), 16)
+        if size == 0:
+            # Skip any trailers up to the terminating blank line
+            while rfile.readline(1024) not in (b'\r\n', b'\n', b''):
+                pass
+            return
+        yield from iter_body(rfile, size, chunk_size)
+        rfile.readline(1024)
 
 class NextJsProxyHandler(http.server.SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=STATIC_DIR, **kwargs)
-    
+
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+        self.request_started_at = None
+        # Only a pooled server can afford to park a thread on an idle connection
+        self.keepalive = PROXY_KEEPALIVE and isinstance(self.server, ThreadPoolHTTPServer)
+        self.protocol_version = 'HTTP/1.1' if self.keepalive else 'HTTP/1.0'
+        self.requests_on_connection = 0
+        self.close_reason = 'client'
+
+    def handle(self):
+        """Serve requests until the connection is closed, idle or used up"""
+        client_connections.connection_opened()
+        try:
+            self.close_connection = True
+            self.handle_one_request()
+            while not self.close_connection and self.wait_for_request():
+                self.handle_one_request()
+        finally:
+            client_connections.connection_closed(self.close_reason)
+
+    def wait_for_request(self):
+        """
+        Wait up to the idle timeout for the next request on a kept-alive connection.
+
+        A pipelined request is already buffered and is served straight away.
+        """
+        busy = self.server.backlogged()
+        self.connection.settimeout(0.05 if busy else PROXY_KEEPALIVE_TIMEOUT)
+        try:
+            if self.rfile.peek(1):
+                return True
+            self.close_reason = 'client'
+        except (TimeoutError, BlockingIOError):
+            self.close_reason = 'busy' if busy else 'idle'
+        except OSError:
+            self.close_reason = 'error'
+        finally:
+            self.connection.settimeout(self.timeout)
+        self.close_connection = True
+        return False
+
+    def parse_request(self):
+        # The request line has just arrived, so keep-alive idle time isn't measured
+        self.request_started_at = time.perf_counter()
+        self.response_status = None
+        self.response_bytes_at_start = self.wfile.bytes
+        self.connection_header_sent = False
+        self.body_consumed = False
+        self.sample = RequestSample()
+        metrics.request_started()
+        self.requests_on_connection += 1
+        client_connections.request(reused=self.requests_on_connection > 1)
+        if not super().parse_request():
+            self.close_reason = 'error'
+            return False
+        if self.close_connection:
+            self.close_reason = 'client'
+        elif self.requests_on_connection >= PROXY_KEEPALIVE_MAX_REQUESTS:
+            self.close_connection = True
+            self.close_reason = 'max_requests'
+        return True
+
+    def has_unread_body(self):
+        """True while a request body is still on the socket, in the way of the next request"""
+        if getattr(self, 'body_consumed', True) or not hasattr(self, 'headers'):
+            return False
+        return (int(self.headers.get('Content-Length', 0) or 0) > 0
+                or 'chunked' in self.headers.get('Transfer-Encoding', '').lower())
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        finally:
+            if self.request_started_at is not None:
+                self.record_metrics()
+                self.request_started_at = None
+
+    def send_response(self, code, message=None):
+        self.response_status = code
+        if self.has_unread_body():
+            # Answered without reading the body (e.g. a 503 while starting up)
+            self.close_connection = True
+            self.close_reason = 'error'
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'connection':
+            self.connection_header_sent = True
+        super().send_header(keyword, value)
+
+    def end_headers(self):
+        # Say explicitly when a kept-alive connection ends, or (for HTTP/1.0 clients) continues
+        if not getattr(self, 'connection_header_sent', True) and self.keepalive:
+            if self.close_connection and self.request_version == 'HTTP/1.1':
+                self.send_header('Connection', 'close')
+            elif not self.close_connection and self.request_version == 'HTTP/1.0':
+                self.send_header('Connection', 'keep-alive')
+        super().end_headers()
+
+    def record_metrics(self):
+        # 499 (client closed request, as nginx logs it) when nothing was sent back
+        route = self.sample.route or metrics.route_for(getattr(self, 'path', None) or '/')
+        seconds = time.perf_counter() - self.request_started_at
+        bytes_out = self.wfile.bytes - self.response_bytes_at_start
+        metrics.request_finished(self.command or '-', route, self.response_status or 499, seconds,
+                                 upstream_seconds=self.sample.upstream_seconds,
+                                 bytes_in=self.sample.bytes_in, bytes_out=bytes_out)
+        headers = getattr(self, 'headers', None)
+        record_access(self.sample, self.command or '-', getattr(self, 'path', None), route,
+                      self.response_status or 499, seconds, self.client_address[0], bytes_out,
+                      headers.get if headers is not None else None)
+
+    def count_body(self, chunks):
+        """Pass a request body through, counting it for proxy_request_bytes_total"""
+        for chunk in chunks:
+            self.sample.bytes_in += len(chunk)
+            yield chunk
+        self.body_consumed = True
+
+    def send_starting_up(self):
+        """Answer with a 503 while the Next.js server is still booting"""
+        self.send_response(503)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(STARTING_UP_BODY)))
+        self.send_header('Retry-After', '5')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(STARTING_UP_BODY)
+
+    def send_shed(self, status, wait):
+        """Refuse a request with a 429 (rate limited) or 503 (overloaded) and Retry-After"""
+        body = RATE_LIMITED_BODY if status == 429 else OVERLOADED_BODY
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Retry-After', str(retry_after(wait)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
     def do_GET(self):
-        if not next_server_ready:
-            self.send_response(503)
-            self.send_header('Content-Type', 'text/html')
-            self.end_headers()
-            self.wfile.write(b"<html><body><h1>Service Unavailable</h1><p>The Next.js server is starting up. Please try again in a moment.</p></body></html>")
+        if self.path in PROXY_ENDPOINTS:
+            self.sample.route = self.path
+        if self.path == PROXY_METRICS_PATH:
+            self.send_metrics()
             return
-            
-        # Try to proxy to Next.js server
-        try:
-            url = f"http://localhost:{NEXT_SERVER_PORT}{self.path}"
-            req = urllib.request.Request(url, headers=dict(self.headers))
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
-                self.send_response(response.status)
-                
-                # Forward response headers
-                for header in response.headers:
-                    if header.lower() not in ('transfer-encoding', 'connection'):
-                        self.send_header(header, response.headers[header])
-                
-                self.end_headers()
-                
-                # Forward response body
-                self.wfile.write(response.read())
-                
-        except urllib.error.HTTPError as e:
-            self.send_response(e.code)
-            self.send_header('Content-Type', 'text/html')
-            self.end_headers()
-            self.wfile.write(e.read())
-            
-        except Exception as e:
-            self.send_error(500, f"Error proxying request: {str(e)}")
-    
+        if self.path == PROXY_STATS_PATH:
+            self.send_json(proxy_stats())
+            return
+        if self.path == PROXY_READY_PATH:
+            self.send_json(upstream_readiness.stats(), status=200 if upstream_readiness.ready else 503)
+            return
+        if self.path == PROXY_LIVE_PATH:
+            self.send_json({'alive': True})
+            return
+        if self.path == PROXY_RESOURCES_PATH:
+            self.send_json(resource_report())
+            return
+        if self.path == PROXY_SLOW_PATH:
+            self.send_json(slow_requests.report())
+            return
+        if self.serve_avatar() or self.serve_static():
+            return
+        self.do_proxy_request('GET')
+
+    def do_HEAD(self):
+        if self.serve_avatar() or self.serve_static():
+            return
+        self.do_proxy_request('HEAD')
+
     def do_POST(self):
         self.do_proxy_request('POST')
         
@@ -78,110 +885,1259 @@ class NextJsProxyHandler(http.server.SimpleHTTPRequestHandler):
         self.do_proxy_request('DELETE')
         
     def do_proxy_request(self, method):
-        if not next_server_ready:
-            self.send_response(503)
-            self.send_header('Content-Type', 'text/html')
-            self.end_headers()
-            self.wfile.write(b"<html><body><h1>Service Unavailable</h1><p>The Next.js server is starting up. Please try again in a moment.</p></body></html>")
+        wait = rate_limit_wait(self.path, self.client_address[0], self.headers.get)
+        if wait:
+            self.send_shed(429, wait)
             return
-            
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length) if content_length > 0 else None
-        
+
+        # Hold the request while Next.js is starting, up to the queue deadline
+        queued_at = time.perf_counter()
+        ready = upstream_readiness.wait_ready(STARTUP_QUEUE_TIMEOUT)
+        self.sample.queue_seconds += time.perf_counter() - queued_at
+        if not ready:
+            self.send_starting_up()
+            return
+
+        # Tunnels are capped by TUNNEL_MAX_OPEN rather than holding an admission slot
+        if method == 'GET' and is_upgrade(self.headers.get):
+            self.tunnel_upgrade()
+            return
+
+        # GET/HEAD may be answered from the response cache; concurrent GET misses
+        # for the same key wait for a single upstream fetch
+        cache_key = None
+        if response_cache is not None:
+            if method in ('GET', 'HEAD'):
+                cache_key = response_cache.key_for(self.path, self.headers.get)
+                if self.serve_cached(cache_key):
+                    return
+                if method == 'GET':
+                    flight = response_cache.begin_fetch(cache_key)
+                    if flight is not None:
+                        flight.done.wait(UPSTREAM_READ_TIMEOUT)
+                        if self.serve_cached(cache_key):
+                            return
+                        cache_key = None
+                else:
+                    cache_key = None
+            else:
+                response_cache.invalidate(self.path, reason=f"{method} request")
+
         try:
-            url = f"http://localhost:{NEXT_SERVER_PORT}{self.path}"
-            req = urllib.request.Request(url, data=body, method=method)
-            
-            # Copy request headers
-            for header in self.headers:
-                if header.lower() not in ('host', 'content-length'):
-                    req.add_header(header, self.headers[header])
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
+            if admission is None:
+                self.forward_request(method, store_key=cache_key)
+                return
+            queued_at = time.perf_counter()
+            admitted = admission.acquire(request_lane(self.path))
+            self.sample.queue_seconds += time.perf_counter() - queued_at
+            if admitted:
+                self.admission_slot = True
+                try:
+                    self.forward_request(method, store_key=cache_key)
+                finally:
+                    self.release_admission()
+            else:
+                self.send_shed(503, ADMISSION_QUEUE_TIMEOUT)
+        finally:
+            if cache_key is not None:
+                response_cache.end_fetch(cache_key)
+
+    def release_admission(self):
+        """Give back the request's admission slot, if it still holds one"""
+        if getattr(self, 'admission_slot', False):
+            self.admission_slot = False
+            admission.release()
+
+    def tunnel_upgrade(self):
+        """Pass an Upgrade request (WebSocket) to Next.js and relay raw bytes both ways until either side is done"""
+        if not isinstance(self.server, ThreadPoolHTTPServer):
+            # The legacy server has one thread; a tunnel would stall every other request
+            self.send_error(501, "Upgrades need PROXY_MODE=threaded or asyncio")
+            return
+        worker = upstream.acquire()
+        if worker is None:
+            metrics.upstream_error('unavailable')
+            self.send_starting_up()
+            return
+        if not tunnels.try_open('websocket'):
+            upstream.release(worker)
+            self.send_shed(503, 1)
+            return
+
+        self.sample.worker = worker.index
+        self.close_connection = True
+        reason, sent_upstream, sent_client = 'error', 0, 0
+        failed = True
+        refused = False
+        try:
+            sock = socket.create_connection(('localhost', worker.port), timeout=UPSTREAM_CONNECT_TIMEOUT)
+            sock.settimeout(UPSTREAM_READ_TIMEOUT)
+            with sock:
+                # The handshake goes through as received, Connection and Upgrade included
+                lines = [self.requestline] + [f"{header}: {value}" for header, value in self.headers.items()
+                                              if header.lower() not in ('keep-alive', 'proxy-connection')]
+                sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+                head, to_client = read_response_head(sock)
+                failed = False
+                self.response_status = self.sample.upstream_status = response_status(head)
+                if self.response_status != 101:
+                    # Refused (404, 426, ...): an ordinary response, and no tunnel to hold a slot for
+                    refused = True
+                    response = refusal_response(head, read_refusal_body(sock, head, to_client))
+                    self.wfile.write(response)
+                    return
+                self.wfile.write(head)
+
+                # Frames the client sent right after its handshake may already be buffered
+                self.connection.setblocking(False)
+                to_upstream = self.rfile.read(len(self.rfile.peek()))
+                reason, sent_upstream, sent_client = relay_sockets(
+                    self.connection, sock, TUNNEL_IDLE_TIMEOUT, TUNNEL_BUFFER_BYTES,
+                    to_upstream=to_upstream, to_client=to_client, chunk_size=PROXY_CHUNK_SIZE)
+                self.sample.bytes_in += sent_upstream
+                self.wfile.bytes += sent_client
+        except OSError as e:
+            if isinstance(e, ConnectionRefusedError):
+                worker.eject()
+            metrics.upstream_error(upstream_error_kind(e))
+            if failed:
+                self.send_error(502, f"Error opening tunnel: {str(e)}")
+        finally:
+            if refused:
+                tunnels.cancel('websocket')
+            else:
+                tunnels.tunnel_closed('websocket', reason, sent_upstream, sent_client)
+            upstream.release(worker, failed)
+
+    def forward_request(self, method, store_key=None):
+        """
+        Relay the request to Next.js and stream the response back.
+
+        With a store_key the response body is also captured, up to the cache's
+        entry limit, and stored if the upstream marked it cacheable.
+        """
+        # Stream the request body instead of buffering it
+        content_length = int(self.headers.get('Content-Length', 0) or 0)
+        chunked = 'chunked' in self.headers.get('Transfer-Encoding', '').lower()
+        if chunked:
+            body = self.count_body(iter_chunked_body(self.rfile))
+        elif content_length > 0:
+            body = self.count_body(iter_body(self.rfile, content_length))
+        else:
+            body = None
+
+        # Copy request headers; http.client frames the body itself, chunked
+        # when no Content-Length is given
+        headers = {}
+        for header, value in self.headers.items():
+            if header.lower() not in HOP_BY_HOP_HEADERS and header.lower() not in ('content-length', 'x-request-id'):
+                headers[header] = value
+        if body is not None and not chunked:
+            headers['Content-Length'] = str(content_length)
+        self.sample.request_id = headers[REQUEST_ID_HEADER] = request_id_for(self.headers.get)
+
+        try:
+            upstream_started = time.perf_counter()
+            worker, conn, response = request_upstream(method, self.path, body, headers)
+            self.sample.upstream_seconds = time.perf_counter() - upstream_started
+            self.sample.upstream_status = response.status
+            self.sample.worker = worker.index
+        except UpstreamUnavailable as e:
+            if e.circuit_open:
+                self.send_shed(503, UPSTREAM_BREAKER_RESET)
+            else:
+                # Every worker dropped out after the readiness check
+                self.send_starting_up()
+            return
+        except Exception as e:
+            # Already counted per attempt by request_upstream()
+            self.send_error(500, f"Error proxying request: {str(e)}")
+            return
+
+        headers_sent = False
+        failed = False
+        stream_reason = None  # Set while a Server-Sent Events stream is counted as open
+        bytes_out_at_start = self.wfile.bytes
+        try:
+            reusable = False
+            try:
+                event_stream = is_event_stream(response.getheader('Content-Type'))
+                if event_stream:
+                    if not tunnels.try_open('sse'):
+                        self.send_shed(503, 1)
+                        return
+                    stream_reason = 'error'
+                    # The stream may stay quiet for a long time, and it no longer
+                    # needs protecting from overload once it has started
+                    set_read_timeout(conn, response, TUNNEL_IDLE_TIMEOUT)
+                    self.release_admission()
+
                 self.send_response(response.status)
-                
-                # Forward response headers
-                for header in response.headers:
-                    if header.lower() not in ('transfer-encoding', 'connection'):
-                        self.send_header(header, response.headers[header])
-                
+
+                # Forward response headers; a chunked upstream body is decoded
+                # by http.client and ends with the connection
+                response_headers = [(header, value) for header, value in response.getheaders()
+                                    if header.lower() not in HOP_BY_HOP_HEADERS]
+
+                # Compress on the fly unless the upstream already encoded the body
+                length = response.getheader('Content-Length')
+                eligible = (method != 'HEAD' and response.status == 200 and not event_stream
+                            and not response.getheader('Content-Encoding')
+                            and 'no-transform' not in (response.getheader('Cache-Control') or '')
+                            and compression_eligible(response.getheader('Content-Type'),
+                                                     int(length) if length and length.isdigit() else None))
+                encoding = negotiate_encoding(self.headers.get('Accept-Encoding')) if eligible else None
+                compressor = StreamCompressor(encoding, compression_level(encoding)) if encoding else None
+
+                for header, value in response_headers:
+                    name = header.lower()
+                    if eligible and name == 'vary':
+                        continue
+                    if compressor is not None and name == 'content-length':
+                        continue
+                    if compressor is not None and name == 'etag':
+                        # Streamed output isn't byte-for-byte repeatable, so only a weak match
+                        value = variant_etag(value, encoding)
+                        value = value if value.startswith('W/') else f"W/{value}"
+                    self.send_header(header, value)
+                if eligible:
+                    self.send_header('Vary', merge_vary(response.getheader('Vary')))
+                if compressor is not None:
+                    self.send_header('Content-Encoding', encoding)
+
+                # A body without a length (chunked upstream or compressed here) is
+                # re-chunked for HTTP/1.1 clients; anything else ends with the connection
+                chunked = False
+                has_body = method != 'HEAD' and response.status not in (204, 304) and response.status >= 200
+                if has_body and (compressor is not None or not length):
+                    if self.keepalive and self.request_version == 'HTTP/1.1':
+                        chunked = True
+                        self.send_header('Transfer-Encoding', 'chunked')
+                    else:
+                        self.close_connection = True
+
                 self.end_headers()
+                headers_sent = True
+                write = self.write_chunk if chunked else self.wfile.write
+
+                lifetime = None
+                if store_key is not None and not event_stream:
+                    lifetime = response_cache.storable(response.status, response_headers, headers)
+                captured = [] if lifetime is not None else None
+                captured_bytes = 0
+
+                # Forward response body as it arrives
+                raw_bytes = compressed_bytes = 0
+                while True:
+                    chunk = response.read1(PROXY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if compressor is not None:
+                        raw_bytes += len(chunk)
+                        data = compressor.compress(chunk)
+                        compressed_bytes += len(data)
+                        write(data)
+                    else:
+                        write(chunk)
+                    if captured is not None:
+                        captured_bytes += len(chunk)
+                        if captured_bytes > PROXY_CACHE_MAX_ENTRY_BYTES:
+                            captured = None
+                        else:
+                            captured.append(chunk)
+                # read1() doesn't mark a fully read Content-Length body as done,
+                # and the connection won't take a new request until it is
+                reusable = not response.will_close and not event_stream
+                response.close()
+                if compressor is not None:
+                    data = compressor.finish()
+                    write(data)
+                    compressed_variants.record(raw_bytes, compressed_bytes + len(data))
+                if chunked:
+                    self.wfile.write(b'0\r\n\r\n')
+                if event_stream:
+                    stream_reason = 'upstream'
+
+                if captured is not None:
+                    response_cache.store(self.path, headers, response.status, response_headers,
+                                         b''.join(captured), lifetime)
+            finally:
+                worker.pool.release(conn, reusable)
                 
-                # Forward response body
-                self.wfile.write(response.read())
-                
-        except urllib.error.HTTPError as e:
-            self.send_response(e.code)
-            self.send_header('Content-Type', 'text/html')
-            self.end_headers()
-            self.wfile.write(e.read())
-            
         except Exception as e:
-            self.send_error(500, f"Error proxying request: {str(e)}")
+            client_gone = headers_sent and isinstance(e, (BrokenPipeError, ConnectionResetError))
+            stream_idle = stream_reason is not None and isinstance(e, TimeoutError)
+            if stream_reason is not None:
+                stream_reason = 'client' if client_gone else 'idle' if stream_idle else 'error'
+            # A client that hangs up mid-stream isn't the upstream's fault, nor is a quiet
+            # event stream; neither should count towards opening the worker's circuit
+            failed = not (client_gone or stream_idle)
+            if failed:
+                metrics.upstream_error(upstream_error_kind(e))
+            if headers_sent and stream_idle:
+                # End a quiet event stream cleanly; EventSource reconnects by itself
+                self.close_connection = True
+                if chunked:
+                    self.wfile.write(b'0\r\n\r\n')
+            elif headers_sent:
+                # Too late for an error page; cut the response short
+                self.close_connection = True
+                self.log_error("Error streaming response: %s", str(e))
+            else:
+                self.send_error(500, f"Error proxying request: {str(e)}")
+        finally:
+            if stream_reason is not None:
+                tunnels.tunnel_closed('sse', stream_reason, self.sample.bytes_in, self.wfile.bytes - bytes_out_at_start)
+            upstream.release(worker, failed)
+
+    def write_chunk(self, data):
+        # An empty chunk would end the body early
+        if data:
+            self.wfile.write(b'%x\r\n%b\r\n' % (len(data), data))
+
+    def serve_cached(self, cache_key):
+        """Answer from the response cache; False on a miss"""
+        entry, state = response_cache.lookup(cache_key, self.headers.get)
+        if entry is None:
+            return False
+
+        stored = {}
+        for header, value in entry.headers:
+            stored.setdefault(header.lower(), value)
+
+        # Cached bodies are kept plain; encoded variants are built once per entry
+        body = entry.body
+        eligible = (entry.status == 200 and 'content-encoding' not in stored
+                    and 'no-transform' not in stored.get('cache-control', '')
+                    and compression_eligible(stored.get('content-type'), len(body)))
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding')) if eligible else None
+        etag = stored.get('etag')
+        if encoding:
+            etag = variant_etag(etag, encoding)
+
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and etag_matches(if_none_match, etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            if eligible:
+                self.send_header('Vary', merge_vary(stored.get('vary')))
+            self.end_headers()
+            return True
+
+        if encoding:
+            body = compressed_variants.get(('cache', cache_key, entry.stored_at, encoding),
+                                           lambda: compress_variant(entry.body, encoding))
+            compressed_variants.record(len(entry.body), len(body))
+
+        self.send_response(entry.status)
+        for header, value in entry.headers:
+            if header.lower() not in ('content-length', 'age', 'etag', 'vary'):
+                self.send_header(header, value)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if eligible:
+            self.send_header('Vary', merge_vary(stored.get('vary')))
+        elif 'vary' in stored:
+            self.send_header('Vary', stored['vary'])
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Age', str(int(time.monotonic() - entry.stored_at)))
+        self.send_header('X-Proxy-Cache', 'HIT' if state == FRESH else 'STALE')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        return True
+
+    def serve_avatar(self):
+        """Render an avatar for /avatars/ requests that ask for a size; False otherwise"""
+        request = avatar_for(self.path)
+        if request is None:
+            return False
+        self.sample.route = '/avatars'
+        status, headers, body = avatar_response(request, self.headers.get('If-None-Match'))
+        self.send_response(status)
+        for header, value in headers:
+            self.send_header(header, value)
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+        return True
+
+    def serve_static(self):
+        """
+        Answer a request for a public/ file without going through Next.js.
+
+        Returns False when the path isn't an indexed static file.
+        """
+        entry = static_index.lookup(self.path)
+        if entry is None:
+            return False
+        entry, extra_headers = negotiate_image(self.path, entry, self.headers.get)
+        try:
+            f = open(entry.path, 'rb')
+        except OSError:
+            # Removed since the last index refresh; let Next.js decide
+            return False
+        self.sample.route = 'static'
+
+        with f:
+            # Text assets get a compressed variant from memory; Range and
+            # conditionals then apply to that representation
+            eligible = entry.size <= COMPRESSION_STATIC_MAX_SIZE and compression_eligible(entry.content_type, entry.size)
+            encoding = negotiate_encoding(self.headers.get('Accept-Encoding')) if eligible else None
+            data = None
+            if encoding:
+                variant_key = ('static', entry.path, entry.etag, encoding)
+                variant = entry._replace(etag=variant_etag(entry.etag, encoding))
+                get_header = self.headers.get
+                if self.command == 'HEAD' or plan_static_response(variant, get_header).status == 304:
+                    # No body goes out, so only use a variant that is already built
+                    data = compressed_variants.peek(variant_key)
+                    if data is None:
+                        get_header = without_range(get_header)
+                else:
+                    data = compressed_variants.get(variant_key, lambda: compress_variant(f.read(), encoding))
+                plan = plan_static_response(variant if data is None else variant._replace(size=len(data)),
+                                            get_header)
+                if data is None:
+                    # The encoded length isn't known without compressing
+                    plan = plan._replace(headers=[(header, value) for header, value in plan.headers
+                                                  if header != 'Content-Length'])
+            else:
+                plan = plan_static_response(entry, self.headers.get)
+
+            self.send_response(plan.status)
+            for header, value in plan.headers + extra_headers:
+                self.send_header(header, value)
+            if eligible:
+                self.send_header('Vary', 'Accept-Encoding')
+            if encoding and plan.status in (200, 206):
+                self.send_header('Content-Encoding', encoding)
+            self.end_headers()
+            if plan.length and self.command != 'HEAD':
+                if data is not None:
+                    self.wfile.write(memoryview(data)[plan.offset:plan.offset + plan.length])
+                    compressed_variants.record(entry.size, len(data))
+                else:
+                    # socket.sendfile() is zero-copy via os.sendfile()
+                    self.wfile.bytes += self.connection.sendfile(f, plan.offset, plan.length)
+        return True
+
+    def send_metrics(self):
+        """Answer /__proxy/metrics in the Prometheus text format"""
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, status=200):
+        """Answer a proxy-owned endpoint with a JSON body"""
+        body = json.dumps(payload, indent=2).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
     
+    def log_request(self, code='-', size='-'):
+        """Requests are written to the access log by record_metrics()"""
+
     def log_message(self, format, *args):
         """Custom logging for the server"""
-        print(f"[{self.log_date_time_string()}] {args[0]} {args[1]} {args[2]}")
+        print(f"[{self.log_date_time_string()}] {format % args}")
+
+class ThreadPoolHTTPServer(http.server.HTTPServer):
+    """HTTP server that hands each accepted connection to a fixed-size worker pool"""
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, server_address, handler_class, workers=PROXY_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='proxy-worker')
+        self.waiting = 0  # Accepted connections not yet picked up by a worker
+        self.waiting_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self.waiting_lock:
+            self.waiting += 1
+        self.executor.submit(self.process_request_worker, request, client_address)
+
+    def backlogged(self):
+        """True when accepted connections are waiting for a free worker"""
+        return self.waiting > 0
+
+    def process_request_worker(self, request, client_address):
+        with self.waiting_lock:
+            self.waiting -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class AsyncProxyServer:
+    """
+    Event-loop proxy to the Next.js server.
+
+    Each client connection is a coroutine, so a slow upstream page only holds
+    its own connection. At most `max_concurrency` requests are forwarded to
+    Next.js at once; the rest wait on a semaphore instead of being refused.
+    """
+    PROXIED_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE')
+    MAX_HEADER_LINES = 100
+
+    def __init__(self, host='0.0.0.0', port=PORT, max_concurrency=PROXY_MAX_CONCURRENCY):
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.limit = None
+        self.slot_released = None  # Set and replaced whenever an admission slot is given back
+
+    async def serve_forever(self):
+        self.limit = asyncio.Semaphore(self.max_concurrency)
+        self.slot_released = asyncio.Event()
+        if admission is not None:
+            loop = asyncio.get_running_loop()
+            admission.add_release_listener(lambda: loop.call_soon_threadsafe(self.wake_admission_waiters))
+        server = await asyncio.start_server(self.handle_client, self.host, self.port,
+                                            backlog=1024, reuse_address=True)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_client(self, reader, writer):
+        status = None
+        request_line = '-'
+        method = path = None
+        headers = []
+        started_at = None
+        sample = RequestSample()
+        writer = CountingWriter(writer)
+        try:
+            head = await self.read_head(reader)
+            if head is None:
+                return
+            started_at = time.perf_counter()
+            metrics.request_started()
+            request_line, headers = head
+            method, path, version = request_line.split(' ', 2)
+            sample.request_id = request_id_for(lambda name: self.header_value(headers, name.lower()))
+
+            if method == 'GET' and path in PROXY_ENDPOINTS:
+                sample.route = path
+                status = await self.send_proxy_endpoint(writer, path)
+                return
+
+            if method in ('GET', 'HEAD'):
+                request = avatar_for(path)
+                if request is not None:
+                    sample.route = '/avatars'
+                    status = await self.send_avatar(writer, method, request, headers)
+                    return
+
+                entry = static_index.lookup(path)
+                if entry is not None:
+                    entry, extra_headers = negotiate_image(
+                        path, entry, lambda name: self.header_value(headers, name.lower()))
+                    status = await self.send_static(writer, method, entry, headers, extra_headers)
+                    if status is not None:
+                        sample.route = 'static'
+                        return
+
+            if method not in self.PROXIED_METHODS:
+                status = await self.send_simple(writer, 501, f"Unsupported method ({method!r})".encode())
+                return
+
+            peer = writer.get_extra_info('peername')
+            wait = rate_limit_wait(path, peer[0] if peer else '-', lambda name: self.header_value(headers, name.lower()))
+            if wait:
+                status = await self.send_simple(writer, 429, RATE_LIMITED_BODY,
+                                                extra_headers=[('Retry-After', str(retry_after(wait)))])
+                return
+
+            queued_at = time.perf_counter()
+            ready = await self.wait_ready()
+            sample.queue_seconds += time.perf_counter() - queued_at
+            if not ready:
+                status = await self.send_simple(writer, 503, STARTING_UP_BODY,
+                                                extra_headers=[('Retry-After', '5')])
+                return
+
+            if method == 'GET' and is_upgrade(lambda name: self.header_value(headers, name.lower())):
+                status = await self.tunnel(reader, writer, request_line, headers, sample)
+                return
+
+            queued_at = time.perf_counter()
+            admitted = await self.admit(request_lane(path))
+            sample.queue_seconds += time.perf_counter() - queued_at
+            if not admitted:
+                status = await self.send_simple(writer, 503, OVERLOADED_BODY,
+                                                extra_headers=[('Retry-After', str(retry_after(ADMISSION_QUEUE_TIMEOUT)))])
+                return
+            slot = [admission is not None]
+
+            def release_slot():
+                if slot[0]:
+                    slot[0] = False
+                    admission.release()
+
+            try:
+                async with self.limit:
+                    # Retried on another worker only if nothing was read from the
+                    # client (no body) or written back to it yet
+                    retry_budget.record_request()
+                    has_body = (int(self.header_value(headers, 'content-length') or 0) > 0
+                                or self.header_value(headers, 'transfer-encoding') is not None)
+                    replayable = method in IDEMPOTENT_METHODS and not has_body
+                    tried = None
+                    for attempt in range(UPSTREAM_RETRIES + 1):
+                        worker = upstream.acquire(avoid=tried)
+                        if worker is None:
+                            if upstream.circuit_open():
+                                metrics.upstream_error('circuit_open')
+                                status = await self.send_simple(writer, 503, OVERLOADED_BODY, extra_headers=[
+                                    ('Retry-After', str(retry_after(UPSTREAM_BREAKER_RESET)))])
+                            else:
+                                metrics.upstream_error('unavailable')
+                                status = await self.send_simple(writer, 503, STARTING_UP_BODY,
+                                                                extra_headers=[('Retry-After', '5')])
+                            return
+                        sample.worker = worker.index
+                        failed = True
+                        written_before = writer.bytes
+                        try:
+                            status = await self.forward(reader, writer, worker.port, method, path, version, headers,
+                                                        sample, on_stream=release_slot)
+                            failed = False
+                            break
+                        except Exception as e:
+                            if isinstance(e, ConnectionRefusedError):
+                                worker.eject()
+                            if isinstance(e, asyncio.IncompleteReadError):
+                                # The client went away mid-body; not the upstream's fault
+                                failed = False
+                            else:
+                                metrics.upstream_error(upstream_error_kind(e))
+                            if not (failed and replayable and writer.bytes == written_before
+                                    and attempt < UPSTREAM_RETRIES and retry_budget.try_spend()):
+                                raise
+                            tried = worker
+                        finally:
+                            upstream.release(worker, failed)
+            finally:
+                release_slot()
+        except ValueError:
+            status = await self.send_simple(writer, 400, b"Bad request syntax")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            status = await self.send_simple(writer, 500, f"Error proxying request: {str(e)}".encode())
+        finally:
+            if started_at is not None:
+                # 499 (client closed request, as nginx logs it) when nothing was sent back
+                route = sample.route or metrics.route_for(path or '/')
+                seconds = time.perf_counter() - started_at
+                metrics.request_finished(method or '-', route, status or 499, seconds,
+                                         upstream_seconds=sample.upstream_seconds,
+                                         bytes_in=sample.bytes_in, bytes_out=writer.bytes)
+                peer = writer.get_extra_info('peername')
+                record_access(sample, method or '-', path, route, status or 499, seconds, peer[0] if peer else '-',
+                              writer.bytes, lambda name: self.header_value(headers, name.lower()))
+            writer.close()
+
+    async def read_head(self, reader):
+        """Read a request or response head, returning (first line, [(name, value), ...])"""
+        first_line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+        if not first_line:
+            return None
+        headers = []
+        for _ in range(self.MAX_HEADER_LINES):
+            line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+            if not line:
+                return first_line, headers
+            name, _, value = line.partition(':')
+            headers.append((name.strip(), value.strip()))
+        raise ValueError("Too many headers")
 
-def start_next_server():
-    """Start the Next.js server as a child process"""
-    global next_server_ready
+    @staticmethod
+    def header_value(headers, name):
+        """Return the first value of a header, matched case-insensitively"""
+        for header, value in headers:
+            if header.lower() == name:
+                return value
+        return None
+
+    async def forward(self, reader, writer, port, method, path, version, headers, sample, on_stream=None):
+        """
+        Forward one request to Next.js, streaming both bodies in fixed-size pieces.
+
+        The upstream request speaks the client's HTTP version with Connection: close,
+        so chunked framing can pass through untouched in both directions and the
+        response body ends when Next.js closes the socket. Upstream time and
+        request body size are recorded on `sample`. on_stream() is called when
+        the response turns out to be a Server-Sent Events stream.
+        """
+        content_length = int(self.header_value(headers, 'content-length') or 0)
+        chunked = 'chunked' in (self.header_value(headers, 'transfer-encoding') or '').lower()
+
+        upstream_started = time.perf_counter()
+        upstream_reader, upstream_writer = await asyncio.wait_for(
+            asyncio.open_connection('localhost', port), UPSTREAM_CONNECT_TIMEOUT)
+        try:
+            lines = [f"{method} {path} {version}"]
+            for name, value in headers:
+                if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() not in ('content-length', 'x-request-id'):
+                    lines.append(f"{name}: {value}")
+            lines.append(f"{REQUEST_ID_HEADER}: {sample.request_id}")
+            if chunked:
+                lines.append("Transfer-Encoding: chunked")
+            elif content_length > 0:
+                lines.append(f"Content-Length: {content_length}")
+            lines.append("Connection: close")
+            upstream_writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+
+            if chunked:
+                sample.bytes_in = await self.relay_chunked(reader, upstream_writer)
+            elif content_length > 0:
+                sample.bytes_in = await self.relay_exact(reader, upstream_writer, content_length)
+            await upstream_writer.drain()
+
+            head = await asyncio.wait_for(self.read_head(upstream_reader), UPSTREAM_READ_TIMEOUT)
+            if head is None:
+                raise ConnectionError("Next.js closed the connection without a response")
+            sample.upstream_seconds = time.perf_counter() - upstream_started
+            status_line, response_headers = head
+            status = sample.upstream_status = int(status_line.split(' ', 2)[1])
+
+            event_stream = is_event_stream(self.header_value(response_headers, 'content-type'))
+            if event_stream:
+                if not tunnels.try_open('sse'):
+                    return await self.send_simple(writer, 503, OVERLOADED_BODY, extra_headers=[('Retry-After', '1')])
+                if on_stream is not None:
+                    on_stream()
+            read_timeout = TUNNEL_IDLE_TIMEOUT if event_stream else UPSTREAM_READ_TIMEOUT
+            stream_reason = 'error'
+            bytes_out_at_start = writer.bytes
+
+            lines = [status_line]
+            for name, value in response_headers:
+                if name.lower() not in HOP_BY_HOP_HEADERS or name.lower() == 'transfer-encoding':
+                    lines.append(f"{name}: {value}")
+            lines.append("Connection: close")
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+
+            try:
+                while True:
+                    chunk = await asyncio.wait_for(upstream_reader.read(PROXY_CHUNK_SIZE), read_timeout)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+                stream_reason = 'upstream'
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                # Headers are already out; all we can do is cut the response short
+                if event_stream and isinstance(e, asyncio.TimeoutError):
+                    stream_reason = 'idle'
+                else:
+                    stream_reason = 'error'
+                    print(f"Error streaming response for {method} {path}: {str(e)}")
+            finally:
+                if event_stream:
+                    tunnels.tunnel_closed('sse', stream_reason, sample.bytes_in, writer.bytes - bytes_out_at_start)
+            return status
+        finally:
+            upstream_writer.close()
+
+    async def tunnel(self, reader, writer, request_line, headers, sample):
+        """Pass an Upgrade request (WebSocket) to Next.js and relay raw bytes both ways until either side is done"""
+        worker = upstream.acquire()
+        if worker is None:
+            metrics.upstream_error('unavailable')
+            return await self.send_simple(writer, 503, STARTING_UP_BODY, extra_headers=[('Retry-After', '5')])
+        if not tunnels.try_open('websocket'):
+            upstream.release(worker)
+            return await self.send_simple(writer, 503, OVERLOADED_BODY, extra_headers=[('Retry-After', '1')])
+
+        sample.worker = worker.index
+        reason, sent_upstream, sent_client = 'error', 0, 0
+        failed = True
+        refused = False
+        try:
+            upstream_reader, upstream_writer = await asyncio.wait_for(
+                asyncio.open_connection('localhost', worker.port), UPSTREAM_CONNECT_TIMEOUT)
+            try:
+                # The handshake goes through as received, Connection and Upgrade included
+                lines = [request_line] + [f"{name}: {value}" for name, value in headers
+                                          if name.lower() not in ('keep-alive', 'proxy-connection')]
+                upstream_writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+                head = await asyncio.wait_for(upstream_reader.readuntil(b'\r\n\r\n'), UPSTREAM_READ_TIMEOUT)
+                failed = False
+                sample.upstream_status = response_status(head)
+                if sample.upstream_status != 101:
+                    # Refused (404, 426, ...): an ordinary response, and no tunnel to hold a slot for
+                    refused = True
+                    writer.write(refusal_response(head, await asyncio.wait_for(
+                        read_refusal_body_async(upstream_reader, head), UPSTREAM_READ_TIMEOUT)))
+                    await writer.drain()
+                    return sample.upstream_status
+                writer.write(head)
+                reason, sent_upstream, sent_client = await relay_streams(
+                    reader, writer, upstream_reader, upstream_writer, TUNNEL_IDLE_TIMEOUT, TUNNEL_BUFFER_BYTES,
+                    chunk_size=PROXY_CHUNK_SIZE)
+                sample.bytes_in += sent_upstream
+                return sample.upstream_status
+            finally:
+                upstream_writer.close()
+        except ConnectionRefusedError:
+            metrics.upstream_error('refused')
+            worker.eject()
+            raise
+        except Exception as e:
+            if failed:
+                metrics.upstream_error(upstream_error_kind(e))
+            raise
+        finally:
+            if refused:
+                tunnels.cancel('websocket')
+            else:
+                tunnels.tunnel_closed('websocket', reason, sent_upstream, sent_client)
+            upstream.release(worker, failed)
+
+    async def relay_exact(self, reader, writer, length):
+        """Copy exactly `length` bytes from reader to writer, returning that length"""
+        remaining = length
+        while remaining > 0:
+            chunk = await reader.read(min(PROXY_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b'', remaining)
+            remaining -= len(chunk)
+            writer.write(chunk)
+            await writer.drain()
+        return length
+
+    async def relay_chunked(self, reader, writer):
+        """
+        Copy a chunked body verbatim, parsing just enough framing to find its end.
+
+        Returns the size of the decoded body.
+        """
+        total = 0
+        while True:
+            size_line = await reader.readline()
+            if not size_line:
+                raise asyncio.IncompleteReadError(b'', None)
+            writer.write(size_line)
+            size = int(size_line.split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                # Trailers, then the terminating blank line
+                while True:
+                    line = await reader.readline()
+                    writer.write(line)
+                    if line in (b'\r\n', b'\n', b''):
+                        return total
+            await self.relay_exact(reader, writer, size + 2)
+            total += size
+
+    async def send_static(self, writer, method, entry, headers, extra_headers=()):
+        """Send a public/ file straight from disk; None if it vanished since the last scan"""
+        try:
+            f = open(entry.path, 'rb')
+        except OSError:
+            return None
+        with f:
+            plan = plan_static_response(entry, lambda name: self.header_value(headers, name.lower()))
+            lines = [f"HTTP/1.1 {plan.status} {HTTPStatus(plan.status).phrase}"]
+            lines.extend(f"{header}: {value}" for header, value in plan.headers + list(extra_headers))
+            lines.append("Connection: close")
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+            if plan.length and method != 'HEAD':
+                writer.bytes += await asyncio.get_running_loop().sendfile(writer.transport, f, plan.offset, plan.length)
+            else:
+                await writer.drain()
+        return plan.status
+
+    async def send_avatar(self, writer, method, request, headers):
+        """Send a rendered avatar from the avatar cache"""
+        status, avatar_headers, body = avatar_response(request, self.header_value(headers, 'if-none-match'))
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        lines.extend(f"{header}: {value}" for header, value in avatar_headers)
+        lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        if method != 'HEAD':
+            writer.write(body)
+        await writer.drain()
+        return status
+
+    def wake_admission_waiters(self):
+        released, self.slot_released = self.slot_released, asyncio.Event()
+        released.set()
+
+    async def admit(self, lane):
+        """Take an admission slot, waiting in the short queue when all are busy; False means shed"""
+        if admission is None or admission.try_acquire(lane):
+            return True
+        if not admission.enter_queue(lane):
+            return False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ADMISSION_QUEUE_TIMEOUT
+        admitted = False
+        while not admitted:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            # Sleep until a slot is given back rather than polling
+            try:
+                await asyncio.wait_for(self.slot_released.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            admitted = admission.try_acquire(lane, queued=True)
+        admission.leave_queue(lane, admitted)
+        return admitted
+
+    async def wait_ready(self):
+        """Hold the request while Next.js is starting, up to the queue deadline"""
+        if upstream_readiness.ready:
+            return True
+        if not upstream_readiness.enter_queue():
+            return False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STARTUP_QUEUE_TIMEOUT
+        while not upstream_readiness.ready and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        ready = upstream_readiness.ready
+        upstream_readiness.leave_queue(ready)
+        return ready
+
+    async def send_proxy_endpoint(self, writer, path):
+        """Answer the proxy-owned stats, readiness, liveness, metrics, resources and slow-request endpoints"""
+        if path == PROXY_METRICS_PATH:
+            return await self.send_simple(writer, 200, metrics.render().encode(),
+                                          content_type='text/plain; version=0.0.4; charset=utf-8',
+                                          extra_headers=[('Cache-Control', 'no-store')])
+        status = 200
+        if path == PROXY_STATS_PATH:
+            payload = proxy_stats()
+        elif path == PROXY_READY_PATH:
+            payload = upstream_readiness.stats()
+            status = 200 if upstream_readiness.ready else 503
+        elif path == PROXY_RESOURCES_PATH:
+            payload = resource_report()
+        elif path == PROXY_SLOW_PATH:
+            payload = slow_requests.report()
+        else:
+            payload = {'alive': True}
+        body = json.dumps(payload, indent=2).encode()
+        return await self.send_simple(writer, status, body, content_type='application/json',
+                                      extra_headers=[('Cache-Control', 'no-store')])
+
+    async def send_simple(self, writer, status, body, content_type='text/html', extra_headers=()):
+        """Write a complete response that ends the connection"""
+        reason = HTTPStatus(status).phrase
+        extra = ''.join(f"{header}: {value}\r\n" for header, value in extra_headers)
+        writer.write((f"HTTP/1.0 {status} {reason}\r\n"
+                      f"Content-Type: {content_type}\r\n"
+                      f"Content-Length: {len(body)}\r\n"
+                      f"{extra}"
+                      "Connection: close\r\n\r\n").encode('latin-1') + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        return status
+
+def start_next_server(worker):
+    """Run one Next.js worker as a child process until it exits"""
     
     # Environment setup for Next.js
     env = os.environ.copy()
-    env['PORT'] = str(NEXT_SERVER_PORT)
-    env['NODE_ENV'] = 'development'
+    env['PORT'] = str(worker.port)
+    if NEXT_MODE == 'production':
+        # Every worker serves the same prebuilt directory; see distDir in next.config.js
+        env['NODE_ENV'] = 'production'
+        env['NEXT_DIST_DIR'] = worker.dist_dir
+        cmd = ["npx", "next", "start", "-p", str(worker.port)]
+    else:
+        env['NODE_ENV'] = 'development'
+        if worker.index > 0:
+            # Dev servers can't share a build directory
+            env['NEXT_DIST_DIR'] = f'.next-worker-{worker.index}'
+        cmd = ["npx", "next", "dev", "-p", str(worker.port)]
+    # A restarted process starts cold again
+    worker.warmup = None
     
-    # Start Next.js with the internal port
-    cmd = ["npx", "next", "dev", "-p", str(NEXT_SERVER_PORT)]
-    
-    print(f"Starting Next.js server on internal port {NEXT_SERVER_PORT}...")
+    print(f"Starting Next.js worker {worker.index} on internal port {worker.port}...")
     try:
-        process = subprocess.Popen(
+        # Own process group, so npx and the node process it spawns stop together
+        worker.process = subprocess.Popen(
             cmd, 
             env=env,
             stdout=subprocess.PIPE, 
             stderr=subprocess.STDOUT,
-            universal_newlines=True
+            universal_newlines=True,
+            start_new_session=True
         )
         
-        # Monitor output for server ready message
-        for line in iter(process.stdout.readline, ''):
-            print(f"[Next.js] {line.strip()}")
-            if "ready" in line.lower() and "started" in line.lower():
-                next_server_ready = True
-                print(f"✅ Next.js server ready on internal port {NEXT_SERVER_PORT}")
-        
-        # If we get here, the process has terminated
-        print("❌ Next.js server process ended unexpectedly")
-        sys.exit(1)
+        # A ready message only triggers an early health check; the probe decides
+        for line in iter(worker.process.stdout.readline, ''):
+            print(f"[Next.js:{worker.index}] {line.strip()}")
+            if "ready" in line.lower():
+                worker.readiness.poke()
+        worker.process.wait()
         
     except Exception as e:
-        print(f"❌ Failed to start Next.js server: {str(e)}")
-        sys.exit(1)
+        print(f"❌ Failed to start Next.js worker {worker.index}: {str(e)}")
+
+def supervise_next_worker(worker):
+    """Keep a Next.js worker running, restarting it with backoff whenever it exits"""
+    backoff = 1
+    while not worker.retired:
+        started = time.monotonic()
+        start_next_server(worker)
+        worker.readiness.mark(False)
+        if worker.retired:
+            return
+
+        # A worker that stayed up for a while gets a fresh backoff
+        if time.monotonic() - started > 60:
+            backoff = 1
+        print(f"❌ Next.js worker {worker.index} ended unexpectedly; restarting in {backoff}s")
+        time.sleep(backoff)
+        backoff = min(backoff * 2, WORKER_RESTART_BACKOFF_MAX)
+        worker.restarts += 1
+
+def stop_next_workers():
+    """Terminate every Next.js worker's process group"""
+    for worker in upstream.workers + deploy.draining:
+        stop_worker_process(worker)
+
+def stop_worker_process(worker):
+    if worker.process is not None and worker.process.poll() is None:
+        try:
+            os.killpg(worker.process.pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+def start_worker(worker):
+    """Supervise a worker's Next.js process (unless it runs elsewhere) and start its health check"""
+    if not NEXT_EXTERNAL:
+        next_thread = threading.Thread(target=supervise_next_worker, args=(worker,),
+                                       name=f'next-worker-{worker.index}-g{worker.generation}')
+        next_thread.daemon = True
+        next_thread.start()
+    worker.readiness.start()
+
+def build_next_app(dist_dir):
+    """`next build` into dist_dir; False (with the output printed) if it fails"""
+    env = os.environ.copy()
+    env['NODE_ENV'] = 'production'
+    env['NEXT_DIST_DIR'] = dist_dir
+    print(f"🏗️  Building Next.js into {dist_dir}...")
+    started = time.monotonic()
+    try:
+        process = subprocess.Popen(["npx", "next", "build"], env=env, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, universal_newlines=True, start_new_session=True)
+    except OSError as e:
+        print(f"❌ Next.js build failed to start: {str(e)}")
+        return False
+    # Stop a hung build from the side; the output loop ends when it dies
+    watchdog = threading.Timer(NEXT_BUILD_TIMEOUT, lambda: os.killpg(process.pid, signal.SIGTERM))
+    watchdog.daemon = True
+    watchdog.start()
+    try:
+        for line in iter(process.stdout.readline, ''):
+            print(f"[next build] {line.rstrip()}")
+        process.wait()
+    finally:
+        watchdog.cancel()
+    deploy.last_build_seconds = round(time.monotonic() - started, 1)
+    if process.returncode != 0:
+        print(f"❌ Next.js build into {dist_dir} failed (exit {process.returncode})")
+        return False
+    print(f"✅ Next.js build ready in {deploy.last_build_seconds}s")
+    return True
+
+class DeployState:
+    """What production mode has deployed, for the stats endpoint and SIGHUP"""
+
+    def __init__(self):
+        self.lock = threading.Lock()  # One deploy at a time
+        self.generation = 0
+        self.status = 'idle'
+        self.draining = []  # Replaced workers still finishing requests
+        self.last_build_seconds = None
+        self.last_switchover = None
+        self.deploys = 0
+        self.failed_deploys = 0
+
+    def stats(self):
+        return {
+            'next_mode': NEXT_MODE,
+            'generation': self.generation,
+            'status': self.status,
+            'dist_dir': production_dist_dir(self.generation) if NEXT_MODE == 'production' else None,
+            'draining_workers': len(self.draining),
+            'last_build_seconds': self.last_build_seconds,
+            'last_switchover': self.last_switchover,
+            'deploys': self.deploys,
+            'failed_deploys': self.failed_deploys,
+        }
+
+deploy = DeployState()
+
+def start_production_upstream():
+    """First production deploy: build, then start the workers (the proxy answers 503s meanwhile)"""
+    with deploy.lock:
+        deploy.status = 'building'
+        if not build_next_app(production_dist_dir(0)):
+            deploy.status = 'build failed'
+            deploy.failed_deploys += 1
+            return
+        deploy.status = 'serving'
+        deploy.deploys += 1
+        for worker in upstream.workers:
+            start_worker(worker)
+
+def redeploy():
+    """
+    Zero-downtime redeploy: build, start and warm a new generation of workers
+    next to the current one, switch over, then drain and stop the old workers.
+
+    Any failure before the switchover leaves the current workers serving.
+    """
+    if not deploy.lock.acquire(blocking=False):
+        print("⏳ A deploy is already running; ignoring this one")
+        return
+    try:
+        generation = deploy.generation + 1
+        dist_dir = production_dist_dir(generation)
+        deploy.status = f'building generation {generation}'
+        if not build_next_app(dist_dir):
+            deploy.status = 'serving (last deploy failed to build)'
+            deploy.failed_deploys += 1
+            return
+
+        deploy.status = f'warming generation {generation}'
+        fresh = [make_upstream_worker(worker.index, worker_port(worker.index, generation),
+                                      generation=generation, dist_dir=dist_dir)
+                 for worker in upstream.workers]
+        for worker in fresh:
+            start_worker(worker)
+        deadline = time.monotonic() + NEXT_SWITCHOVER_TIMEOUT
+        while not all(worker.healthy for worker in fresh) and time.monotonic() < deadline:
+            time.sleep(0.5)
+        if not all(worker.healthy for worker in fresh):
+            print(f"❌ Generation {generation} didn't become ready in {NEXT_SWITCHOVER_TIMEOUT}s; keeping the current workers")
+            retire_workers(fresh)
+            deploy.status = 'serving (last deploy never became ready)'
+            deploy.failed_deploys += 1
+            return
+
+        previous = upstream.swap(fresh)
+        deploy.generation = generation
+        deploy.last_switchover = time.time()
+        deploy.deploys += 1
+        print(f"🔀 Switched to generation {generation}: {describe_upstream()}")
+
+        deploy.status = f'draining generation {generation - 1}'
+        deploy.draining = previous
+        deadline = time.monotonic() + NEXT_DRAIN_TIMEOUT
+        while any(worker.in_flight for worker in previous) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        retire_workers(previous)
+        deploy.draining = []
+        deploy.status = 'serving'
+    finally:
+        deploy.lock.release()
+
+def retire_workers(workers):
+    for worker in workers:
+        worker.retired = True
+        worker.readiness.stop()
+        stop_worker_process(worker)
+        worker.pool.close()
+
+def describe_upstream():
+    ports = [worker.port for worker in upstream.workers]
+    if len(ports) == 1:
+        return f"Next.js on port {ports[0]}"
+    return f"{len(ports)} Next.js workers on ports {ports[0]}-{ports[-1]} ({upstream.strategy})"
 
 def run_server():
     """Start the HTTP proxy server"""
-    # Start Next.js in a separate thread
-    next_thread = threading.Thread(target=start_next_server)
-    next_thread.daemon = True
-    next_thread.start()
+    if ERROR_LOG_MODE == 'async':
+        configure_async_logging(max_queue=ERROR_LOG_QUEUE_SIZE, overflow=ERROR_LOG_OVERFLOW)
+    if ERROR_AGGREGATION_WINDOW > 0:
+        configure_error_aggregation(ERROR_AGGREGATION_WINDOW, sample_rates=ERROR_SAMPLE_RATES)
+    if access_log is not None:
+        access_log.start()
+
+    if NEXT_MODE not in NEXT_MODES:
+        print(f"❌ Unknown NEXT_MODE {NEXT_MODE!r}, expected one of: {', '.join(NEXT_MODES)}")
+        sys.exit(1)
+
+    # Start each Next.js worker under its own supervisor thread; production mode
+    # builds first, off the main thread so the proxy can answer in the meantime
+    if NEXT_MODE == 'production' and not NEXT_EXTERNAL:
+        threading.Thread(target=start_production_upstream, name='next-build', daemon=True).start()
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+            target=redeploy, name='next-redeploy', daemon=True).start())
+        print("Production mode: send SIGHUP to rebuild and switch over without downtime")
+    else:
+        for worker in upstream.workers:
+            start_worker(worker)
     
     # Give Next.js some time to start up
     print("Waiting for Next.js server to initialize...")
+    upstream_readiness.start()
+
+    if RESOURCE_MONITOR_INTERVAL > 0:
+        resource_monitor.start()
+
+    if STATIC_FAST_PATH:
+        static_index.start()
+        print(f"Serving {static_index.stats()['files']} static files from {STATIC_DIR}")
     
+    if PROXY_MODE not in PROXY_MODES:
+        print(f"❌ Unknown PROXY_MODE {PROXY_MODE!r}, expected one of: {', '.join(PROXY_MODES)}")
+        sys.exit(1)
+
     # Start the proxy server
     try:
+        if PROXY_MODE == 'asyncio':
+            print(f"🚀 Proxy server (asyncio, max {PROXY_MAX_CONCURRENCY} in flight) running at http://0.0.0.0:{PORT}")
+            print(f"Forwarding to {describe_upstream()}")
+            asyncio.run(AsyncProxyServer().serve_forever())
+            return
+
         handler = NextJsProxyHandler
-        with socketserver.TCPServer(("0.0.0.0", PORT), handler) as httpd:
-            print(f"🚀 Proxy server running at http://0.0.0.0:{PORT}")
-            print(f"Forwarding to Next.js on port {NEXT_SERVER_PORT}")
+        if PROXY_MODE == 'threaded':
+            httpd = ThreadPoolHTTPServer(("0.0.0.0", PORT), handler, workers=PROXY_WORKERS)
+            description = f"threaded, {PROXY_WORKERS} workers"
+        else:
+            httpd = socketserver.TCPServer(("0.0.0.0", PORT), handler)
+            description = "legacy, single-threaded"
+        with httpd:
+            print(f"🚀 Proxy server ({description}) running at http://0.0.0.0:{PORT}")
+            print(f"Forwarding to {describe_upstream()}")
             httpd.serve_forever()
     except KeyboardInterrupt:
         print("Server shutting down...")
     except Exception as e:
         print(f"Server error: {str(e)}")
         sys.exit(1)
+    finally:
+        stop_next_workers()
+        if access_log is not None:
+            access_log.close()
 
 if __name__ == "__main__":
     print("Starting Solo App Staging Server...")
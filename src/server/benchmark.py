@@ -0,0 +1,382 @@
+"""
+Benchmark python_server.py against the stub upstream.
+Starts the stub and the proxy, drives open-loop load at each target rate and
+reports throughput, latency percentiles and the proxy's memory use, so
+serving modes and changes can be compared run to run.
+
+Open loop means requests are sent on a fixed schedule whether or not earlier
+ones have finished, and latency is measured from when a request was due. A
+proxy that falls behind therefore shows up in the percentiles instead of
+quietly lowering the offered load.
+
+Usage:
+    python src/server/benchmark.py --modes threaded,asyncio --rps 100,500 --duration 10
+    python src/server/benchmark.py --rps 500 --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import platform
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from typing import Dict, Any, List, Optional, Tuple
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(SERVER_DIR))
+PROXY_SCRIPT = os.path.join(REPO_ROOT, 'python_server.py')
+STUB_SCRIPT = os.path.join(SERVER_DIR, 'stub_upstream.py')
+
+STARTUP_TIMEOUT = 30  # Seconds to wait for the stub and proxy to come up
+REQUEST_TIMEOUT = 30  # Seconds before an outstanding request counts as failed
+
+def is_success(status: int) -> bool:
+    """2xx and 3xx; anything else (429 from the rate limiter, 503 from shedding, ...) counts as failed"""
+    return 200 <= status < 400
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def read_proc_memory(pid: int) -> Dict[str, Optional[float]]:
+    """Current and peak resident set size of a process in MiB (Linux only)"""
+    memory = {'rss_mb': None, 'peak_rss_mb': None}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    memory['rss_mb'] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith('VmHWM:'):
+                    memory['peak_rss_mb'] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
+
+def read_proc_cpu_seconds(pid: int) -> Optional[float]:
+    """User plus system CPU time a process has used (Linux only)"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+def wait_for_http(url: str, timeout: float = STARTUP_TIMEOUT, process: Optional[subprocess.Popen] = None):
+    """Poll a URL until it answers 200"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before {url} came up")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+def stop_process(process: subprocess.Popen):
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+async def send_request(host: str, port: int, method: str, path: str, body: bytes) -> int:
+    """One request on a fresh connection; returns the response status"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+        status_line = await reader.readline()
+        # Read the rest so the measurement covers the whole response
+        while await reader.read(65536):
+            pass
+        return int(status_line.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+async def drive_load(host: str, port: int, paths: List[str], method: str, body: bytes,
+                     rps: float, duration: float, max_outstanding: int) -> Dict[str, Any]:
+    """
+    Send requests on a fixed schedule for `duration` seconds.
+
+    Returns:
+        dict: latencies (seconds, 2xx/3xx responses only), status counts,
+        connection errors and requests dropped because `max_outstanding`
+        were already in flight
+    """
+    loop = asyncio.get_running_loop()
+    latencies = []
+    statuses: Dict[str, int] = {}
+    result = {'errors': 0, 'dropped': 0}
+    outstanding = set()
+
+    async def one(path, due):
+        try:
+            status = await asyncio.wait_for(send_request(host, port, method, path, body), REQUEST_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            result['errors'] += 1
+            return
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if is_success(status):
+            latencies.append(loop.time() - due)
+
+    interval = 1 / rps
+    total = int(rps * duration)
+    start = loop.time()
+    for i in range(total):
+        due = start + i * interval
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(outstanding) >= max_outstanding:
+            result['dropped'] += 1
+            continue
+        task = asyncio.ensure_future(one(paths[i % len(paths)], due))
+        outstanding.add(task)
+        task.add_done_callback(outstanding.discard)
+    if outstanding:
+        await asyncio.wait(outstanding)
+
+    result.update(latencies=latencies, statuses=statuses, elapsed=loop.time() - start)
+    return result
+
+def _client_process(args: Tuple) -> Dict[str, Any]:
+    return asyncio.run(drive_load(*args))
+
+def run_load(host: str, port: int, paths: List[str], method: str, body: bytes, rps: float,
+             duration: float, max_outstanding: int, processes: int) -> Dict[str, Any]:
+    """Split the target rate over client processes so the load generator isn't the bottleneck"""
+    share = (host, port, paths, method, body, rps / processes, duration, max(max_outstanding // processes, 1))
+    if processes == 1:
+        return _client_process(share)
+    with multiprocessing.Pool(processes) as pool:
+        parts = pool.map(_client_process, [share] * processes)
+    merged = {'latencies': [], 'statuses': {}, 'errors': 0, 'dropped': 0, 'elapsed': 0.0}
+    for part in parts:
+        merged['latencies'].extend(part['latencies'])
+        merged['errors'] += part['errors']
+        merged['dropped'] += part['dropped']
+        merged['elapsed'] = max(merged['elapsed'], part['elapsed'])
+        for status, count in part['statuses'].items():
+            merged['statuses'][status] = merged['statuses'].get(status, 0) + count
+    return merged
+
+def summarize(load: Dict[str, Any], rps: float, duration: float) -> Dict[str, Any]:
+    latencies = sorted(load['latencies'])
+    completed = sum(load['statuses'].values())
+    succeeded = sum(count for status, count in load['statuses'].items() if is_success(int(status)))
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'target_rps': rps,
+        'duration_seconds': duration,
+        'sent': int(rps * duration) - load['dropped'],
+        'completed': completed,
+        'succeeded': succeeded,
+        # Fast rejections would otherwise look like capacity
+        'throughput_rps': round(succeeded / load['elapsed'], 1) if load['elapsed'] else 0.0,
+        'statuses': load['statuses'],
+        'client_errors': sum(count for status, count in load['statuses'].items() if 400 <= int(status) < 500),
+        'server_errors': sum(count for status, count in load['statuses'].items() if int(status) >= 500),
+        'connection_errors': load['errors'],
+        'dropped': load['dropped'],
+        'latency_ms': {
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1] if latencies else None),
+            'mean': ms(sum(latencies) / len(latencies) if latencies else None),
+        },
+    }
+
+class MemorySampler:
+    """Samples a process's RSS in the background for the length of a run"""
+
+    def __init__(self, pid: int, interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = read_proc_memory(self.pid)['rss_mb']
+            if rss is not None:
+                self.samples.append(rss)
+
+def benchmark_mode(mode: str, port: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Run every target rate against one proxy process in the given serving mode"""
+    env = os.environ.copy()
+    env.update({
+        'PROXY_MODE': mode,
+        'PROXY_PORT': str(port),
+        'NEXT_SERVER_PORT': str(args.upstream_port),
+        'NEXT_EXTERNAL': '1',
+        'NEXT_WORKERS': '1',
+        # All load comes from one address; a per-client limit would measure itself
+        'RATE_LIMIT_RPS': '0',
+        'PYTHONUNBUFFERED': '1',
+    })
+    for assignment in args.env:
+        name, _, value = assignment.partition('=')
+        env[name] = value
+
+    log = open(os.devnull, 'w') if not args.verbose else None
+    proxy = subprocess.Popen([sys.executable, PROXY_SCRIPT], cwd=REPO_ROOT, env=env,
+                             stdout=log, stderr=subprocess.STDOUT if log else None)
+    results = []
+    try:
+        wait_for_http(f'http://127.0.0.1:{port}/__proxy/ready', process=proxy)
+        if args.warmup > 0:
+            run_load('127.0.0.1', port, args.paths, args.method, args.body,
+                     min(args.rps), args.warmup, args.max_outstanding, 1)
+
+        for rps in args.rps:
+            cpu_before = read_proc_cpu_seconds(proxy.pid)
+            with MemorySampler(proxy.pid) as sampler:
+                load = run_load('127.0.0.1', port, args.paths, args.method, args.body,
+                                rps, args.duration, args.max_outstanding, args.processes)
+            cpu_after = read_proc_cpu_seconds(proxy.pid)
+
+            result = {'mode': mode, **summarize(load, rps, args.duration)}
+            result['proxy_memory'] = {
+                **read_proc_memory(proxy.pid),
+                'max_rss_during_run_mb': max(sampler.samples) if sampler.samples else None,
+            }
+            if cpu_before is not None and cpu_after is not None:
+                result['proxy_cpu_seconds'] = round(cpu_after - cpu_before, 2)
+            results.append(result)
+            print(format_result(result), flush=True)
+    finally:
+        stop_process(proxy)
+        if log is not None:
+            log.close()
+    return results
+
+def format_result(result: Dict[str, Any]) -> str:
+    latency = result['latency_ms']
+    failures = result['completed'] - result['succeeded'] + result['connection_errors'] + result['dropped']
+    return (f"{result['mode']:>8} @ {result['target_rps']:>7g} rps: {result['throughput_rps']:>8.1f} rps  "
+            f"p50 {latency['p50']}ms  p95 {latency['p95']}ms  p99 {latency['p99']}ms  max {latency['max']}ms  "
+            f"failed {failures}  rss {result['proxy_memory']['max_rss_during_run_mb']}MB")
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> List[str]:
+    """
+    Compare a run with a saved one, matching results by mode and target rate.
+
+    Returns:
+        list: descriptions of every p99 latency or throughput regression
+        beyond `threshold` (a fraction, e.g. 0.2 for 20%)
+    """
+    with open(baseline_path) as f:
+        baseline = {(r['mode'], r['target_rps']): r for r in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        before = baseline.get((result['mode'], result['target_rps']))
+        if before is None:
+            continue
+        label = f"{result['mode']} @ {result['target_rps']:g} rps"
+        old_p99, new_p99 = before['latency_ms']['p99'], result['latency_ms']['p99']
+        if old_p99 and new_p99 and new_p99 > old_p99 * (1 + threshold):
+            regressions.append(f"{label}: p99 {old_p99}ms -> {new_p99}ms")
+        old_rps, new_rps = before['throughput_rps'], result['throughput_rps']
+        if old_rps and new_rps < old_rps * (1 - threshold):
+            regressions.append(f"{label}: throughput {old_rps} -> {new_rps} rps")
+        print(f"{label}: p99 {old_p99}ms -> {new_p99}ms, throughput {old_rps} -> {new_rps} rps")
+    return regressions
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', default='threaded', help='Comma-separated PROXY_MODE values to compare')
+    parser.add_argument('--rps', default='100', help='Comma-separated target request rates, run in order')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per target rate')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of load before measuring')
+    parser.add_argument('--paths', default='/', help='Comma-separated request paths, used round-robin')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--body-bytes', type=int, default=0, help='Request body size for POST/PUT')
+    parser.add_argument('--max-outstanding', type=int, default=2000,
+                        help='Requests in flight before new ones are dropped and counted')
+    parser.add_argument('--processes', type=int, default=1, help='Load generator processes')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='Extra environment for the proxy, e.g. PROXY_CACHE=1 (repeatable)')
+    parser.add_argument('--proxy-port', type=int, default=5050, help='First of one port per mode')
+    parser.add_argument('--upstream-port', type=int, default=3950)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Stub upstream delay per request')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Stub upstream delay variation')
+    parser.add_argument('--response-bytes', type=int, default=2048, help='Stub upstream response body size')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of stub responses that are 500s')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='Earlier --output file to compare against')
+    parser.add_argument('--regression-threshold', type=float, default=0.2,
+                        help='Allowed p99/throughput change before --compare fails (fraction)')
+    parser.add_argument('--verbose', action='store_true', help="Show the proxy's output")
+    args = parser.parse_args(argv)
+    args.modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    args.rps = [float(rps) for rps in args.rps.split(',')]
+    args.paths = [path.strip() for path in args.paths.split(',') if path.strip()]
+    args.body = b'x' * args.body_bytes
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    stub = subprocess.Popen([sys.executable, STUB_SCRIPT, '--port', str(args.upstream_port),
+                             '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+                             '--body-bytes', str(args.response_bytes), '--error-rate', str(args.error_rate)])
+    try:
+        wait_for_http(f'http://127.0.0.1:{args.upstream_port}/api/health', process=stub)
+        results = []
+        for index, mode in enumerate(args.modes):
+            # A port per mode: the legacy server can't rebind one still in TIME_WAIT
+            results.extend(benchmark_mode(mode, args.proxy_port + index, args))
+    finally:
+        stop_process(stub)
+
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'upstream': {'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms,
+                     'response_bytes': args.response_bytes, 'error_rate': args.error_rate},
+        'settings': {'paths': args.paths, 'method': args.method, 'duration_seconds': args.duration,
+                     'processes': args.processes, 'env': args.env},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.regression_threshold)
+        if regressions:
+            print("❌ Regressions against " + args.compare + ":")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
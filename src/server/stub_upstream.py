@@ -0,0 +1,104 @@
+"""
+Stand-in for the Next.js server when benchmarking python_server.py.
+Every request gets a body of a fixed size after a configurable delay, and a
+configurable share of requests fail with a 500, so proxy overhead can be
+measured without building or running the app.
+
+Usage:
+    python src/server/stub_upstream.py --port 3950 --latency-ms 20 --body-bytes 4096
+"""
+import argparse
+import http.server
+import random
+import time
+
+HEALTH_PATH = '/api/health'
+
+class StubUpstreamHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like Next.js
+    disable_nagle_algorithm = True  # Node sets TCP_NODELAY on its sockets too
+
+    # Set from the command line in main()
+    latency = 0.0
+    jitter = 0.0
+    body = b''
+    error_rate = 0.0
+    content_type = 'text/html; charset=utf-8'
+
+    def do_GET(self):
+        if self.path == HEALTH_PATH:
+            self.respond(200, b'{"status":"ok"}', 'application/json')
+            return
+        self.simulate()
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_POST(self):
+        # Drain the upload so the connection can be reused
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        if length:
+            self.rfile.read(length)
+        elif 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            while True:
+                size = int(self.rfile.readline().split(b';', 1)[0].strip(), 16)
+                self.rfile.read(size + 2)
+                if size == 0:
+                    break
+        self.simulate()
+
+    do_PUT = do_POST
+    do_DELETE = do_POST
+
+    def simulate(self):
+        delay = self.latency + (random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            self.respond(500, b'Simulated upstream error', 'text/plain')
+            return
+        self.respond(200, self.body, self.content_type)
+
+    def respond(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate a benchmark
+
+class StubUpstreamServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3950)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay before each response')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Uniform +/- variation of the delay')
+    parser.add_argument('--body-bytes', type=int, default=2048, help='Size of each response body')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 500 (0-1)')
+    args = parser.parse_args()
+
+    StubUpstreamHandler.latency = args.latency_ms / 1000
+    StubUpstreamHandler.jitter = args.jitter_ms / 1000
+    StubUpstreamHandler.body = (b'<p>stub upstream</p>\n' * (args.body_bytes // 21 + 1))[:args.body_bytes]
+    StubUpstreamHandler.error_rate = args.error_rate
+
+    with StubUpstreamServer((args.host, args.port), StubUpstreamHandler) as httpd:
+        print(f"Stub upstream on http://{args.host}:{args.port} "
+              f"(latency {args.latency_ms}ms ±{args.jitter_ms}ms, {args.body_bytes} bytes, "
+              f"error rate {args.error_rate:.0%})", flush=True)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Access log for the proxy.
+Request threads only put a dict of fields on a bounded queue; a writer
+thread turns them into JSON lines and writes them in batches, to stdout or
+to a file rotated by size and age. Requests slower than a threshold are
+also kept in a small ring with their timing breakdown, for a stats endpoint.
+"""
+import itertools
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, TextIO
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Incoming request ids are kept only if they look like ids, so they can't break the log line
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+# Seconds fields, rounded when the line is written
+TIMING_FIELDS = ('seconds', 'queue_seconds', 'upstream_seconds')
+
+_request_counter = itertools.count(1)
+_request_id_prefix = os.urandom(4).hex()
+
+def new_request_id() -> str:
+    """Unique within this process and unlikely to repeat across restarts"""
+    return f"{_request_id_prefix}-{next(_request_counter):x}"
+
+def request_id_for(get_header) -> str:
+    """The client's X-Request-ID when it sent a usable one, else a new id"""
+    value = get_header(REQUEST_ID_HEADER) if get_header is not None else None
+    if value and REQUEST_ID_PATTERN.match(value):
+        return value
+    return new_request_id()
+
+class RotatingFile:
+    """
+    Append-only file that is rotated to `path`.1, `path`.2, ... once it
+    reaches `max_bytes` or has been open `max_age` seconds (0 disables
+    either), keeping `backups` old files.
+
+    Only used from one writer thread.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 0, max_age: float = 0, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self._file = None
+        self._size = 0
+        self._opened_at = 0.0
+        self.rotations = 0
+
+    def write(self, text: str):
+        # max_bytes is a size on disk, so count encoded bytes, not characters
+        size = len(text.encode('utf-8'))
+        if self._file is None:
+            self._open()
+        elif self._should_rotate(size):
+            self.rotate()
+        self._file.write(text)
+        self._size += size
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def rotate(self):
+        self.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.1")
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        self.rotations += 1
+        self._open()
+
+    def _should_rotate(self, incoming: int) -> bool:
+        if self.max_bytes and self._size and self._size + incoming > self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - self._opened_at >= self.max_age
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._size = self._file.tell()
+        self._opened_at = time.time()
+
+class AccessLog:
+    """
+    One JSON line per request, written by a background thread.
+
+    Successful requests faster than `slow_seconds` are logged at
+    `sample_rate` (0..1); errors and slow requests always are. When the
+    queue is full new records are dropped and counted rather than making
+    the request wait.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, sample_rate: float = 1.0, slow_seconds: float = 1.0,
+                 max_queue: int = 10000, batch_size: int = 512, flush_interval: float = 1.0):
+        self.stream = stream or sys.stdout
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(max_queue)
+        self._thread = None
+
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.batches = 0
+        self.write_errors = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer_loop, name='access-log-writer', daemon=True)
+            self._thread.start()
+
+    def record(self, entry: Dict[str, Any]):
+        if (self.sample_rate < 1 and entry['status'] < 400 and entry['seconds'] < self.slow_seconds
+                and random.random() >= self.sample_rate):
+            self.sampled_out += 1
+            return
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Write out what is queued and stop the writer"""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(5)
+        if hasattr(self.stream, 'close') and self.stream not in (sys.stdout, sys.stderr):
+            self.stream.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'sample_rate': self.sample_rate,
+            'slow_seconds': self.slow_seconds,
+            'queued': self.queue.qsize(),
+            'max_queue': self.queue.maxsize,
+            'written': self.written,
+            'dropped': self.dropped,
+            'sampled_out': self.sampled_out,
+            'batches': self.batches,
+            'write_errors': self.write_errors,
+            'rotations': getattr(self.stream, 'rotations', None),
+        }
+
+    @staticmethod
+    def format_entry(entry: Dict[str, Any]) -> str:
+        line = dict(entry, time=datetime.fromtimestamp(entry['time']).isoformat(timespec='milliseconds'))
+        for field in TIMING_FIELDS:
+            if line.get(field) is not None:
+                line[field] = round(line[field], 4)
+        return json.dumps(line, separators=(',', ':'), default=str) + '\n'
+
+    def _writer_loop(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = [self.format_entry(entry) for entry in batch if entry is not None]
+            if lines:
+                try:
+                    self.stream.write(''.join(lines))
+                    self.stream.flush()
+                    self.written += len(lines)
+                    self.batches += 1
+                except (OSError, ValueError):
+                    self.write_errors += 1
+                    self.dropped += len(lines)
+            if None in batch:
+                return
+
+class SlowRequestLog:
+    """
+    The last `capacity` requests that took at least `threshold` seconds,
+    with where the time went: waiting for an admission slot or for Next.js
+    to start, waiting for the upstream response head, and sending the response.
+    """
+
+    def __init__(self, threshold: float = 1.0, capacity: int = 100):
+        self.threshold = threshold
+        self._entries = deque(maxlen=capacity)
+        self.captured = 0
+
+    def observe(self, entry: Dict[str, Any]):
+        if entry['seconds'] >= self.threshold:
+            self._entries.append(entry)
+            self.captured += 1
+
+    def report(self) -> Dict[str, Any]:
+        """Kept requests, slowest first"""
+        requests: List[Dict[str, Any]] = []
+        for entry in sorted(list(self._entries), key=lambda entry: entry['seconds'], reverse=True):
+            queued = entry.get('queue_seconds') or 0.0
+            upstream = entry.get('upstream_seconds') or 0.0
+            request = {key: value for key, value in entry.items() if key not in TIMING_FIELDS}
+            request['time'] = datetime.fromtimestamp(entry['time']).isoformat(timespec='milliseconds')
+            request['seconds'] = round(entry['seconds'], 4)
+            request['breakdown'] = {
+                'queue_seconds': round(queued, 4),
+                'upstream_seconds': round(upstream, 4),
+                'response_seconds': round(max(0.0, entry['seconds'] - queued - upstream), 4),
+            }
+            requests.append(request)
+        return {
+            'threshold_seconds': self.threshold,
+            'capacity': self._entries.maxlen,
+            'captured': self.captured,
+            'requests': requests,
+        }
@@ -0,0 +1,204 @@
+"""
+Admission control for requests bound for Next.js.
+Per-client token buckets cap how fast one client can send work upstream,
+and a global concurrency cap with a short, bounded queue sheds the rest
+quickly instead of letting a burst pile up in front of the upstream.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List
+
+from src.server.utils.errors import ErrorCodes, log_error
+
+logger = logging.getLogger(__name__)
+
+# Highest priority first. 'priority' is for health checks and build assets,
+# which may use reserved slots above the cap and are admitted before queued
+# 'default' requests.
+LANES = ('priority', 'default')
+
+class TokenBucket:
+    """`rate` tokens a second, holding at most `burst`; one token per request"""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Spend a token; 0 when there was one, else seconds until there will be"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """
+    A token bucket per client key (address, session cookie, ...).
+
+    At most `max_clients` buckets are kept; the least recently seen client
+    is forgotten first, which at worst hands it a fresh burst.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # key -> TokenBucket
+        self._lock = threading.Lock()
+
+        self.allowed = 0
+        self.limited = 0
+
+    def check(self, key: str, path: str = None) -> float:
+        """0 when `key` may send a request now, else seconds to wait (logged as API001)"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take(now)
+            if wait:
+                self.limited += 1
+            else:
+                self.allowed += 1
+        if wait:
+            log_error(logger, ErrorCodes.API_RATE_LIMIT[0], client=key, path=path,
+                      rate=self.rate, burst=self.burst, retry_after=retry_after(wait))
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'rate_per_second': self.rate,
+                'burst': self.burst,
+                'clients': len(self._buckets),
+                'max_clients': self.max_clients,
+                'allowed': self.allowed,
+                'limited': self.limited,
+            }
+
+class AdmissionController:
+    """
+    Global cap on concurrent upstream requests, with a bounded wait queue.
+
+    A request that finds every slot busy waits up to `queue_timeout` seconds
+    if fewer than `max_queue` are already waiting, and is shed otherwise.
+    The 'priority' lane may also use `priority_reserve` slots above the cap,
+    and while any priority request is queued no default request is admitted.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 64, queue_timeout: float = 1.0,
+                 priority_reserve: int = 4):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.priority_reserve = priority_reserve
+        self._cond = threading.Condition()
+        self._release_listeners: List[Callable[[], None]] = []
+
+        self.in_flight = 0
+        self.waiting = {lane: 0 for lane in LANES}
+        self.admitted = {lane: 0 for lane in LANES}
+        self.queued = {lane: 0 for lane in LANES}
+        self.shed = {lane: {'queue_full': 0, 'queue_timeout': 0} for lane in LANES}
+
+    def acquire(self, lane: str) -> bool:
+        """
+        Take a slot, waiting in the queue if need be; False means shed.
+
+        Every True must be paired with a release().
+        """
+        with self._cond:
+            if self._admit(lane):
+                return True
+            if not self._enter_queue(lane):
+                return False
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed[lane]['queue_timeout'] += 1
+                        return False
+                    self._cond.wait(remaining)
+                    if self._admit(lane, queued=True):
+                        return True
+            finally:
+                self.waiting[lane] -= 1
+
+    def try_acquire(self, lane: str, queued: bool = False) -> bool:
+        """Non-blocking acquire(), for callers that wait on an event loop (see add_release_listener())"""
+        with self._cond:
+            return self._admit(lane, queued)
+
+    def enter_queue(self, lane: str) -> bool:
+        """Claim a queue place for a caller retrying try_acquire(queued=True); False means shed"""
+        with self._cond:
+            return self._enter_queue(lane)
+
+    def leave_queue(self, lane: str, admitted: bool):
+        with self._cond:
+            self.waiting[lane] -= 1
+            if not admitted:
+                self.shed[lane]['queue_timeout'] += 1
+
+    def add_release_listener(self, callback: Callable[[], None]):
+        """Call `callback` on every release(), from the releasing thread; how try_acquire() callers learn to retry"""
+        self._release_listeners.append(callback)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+        for callback in self._release_listeners:
+            callback()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'priority_reserve': self.priority_reserve,
+                'max_queue': self.max_queue,
+                'queue_timeout_seconds': self.queue_timeout,
+                'in_flight': self.in_flight,
+                'waiting': dict(self.waiting),
+                'admitted': dict(self.admitted),
+                'queued': dict(self.queued),
+                'shed': {lane: dict(reasons) for lane, reasons in self.shed.items()},
+            }
+
+    def _admit(self, lane: str, queued: bool = False) -> bool:
+        if lane == 'priority':
+            allowed = self.in_flight < self.max_concurrent + self.priority_reserve
+        else:
+            # Queued requests go first, so a newcomer can't jump the queue
+            allowed = (self.in_flight < self.max_concurrent and not self.waiting['priority']
+                       and (queued or not self.waiting['default']))
+        if allowed:
+            self.in_flight += 1
+            self.admitted[lane] += 1
+        return allowed
+
+    def _enter_queue(self, lane: str) -> bool:
+        if sum(self.waiting.values()) >= self.max_queue:
+            self.shed[lane]['queue_full'] += 1
+            return False
+        self.waiting[lane] += 1
+        self.queued[lane] += 1
+        return True
+
+def retry_after(seconds: float) -> int:
+    """Whole seconds for a Retry-After header, at least 1"""
+    return max(1, math.ceil(seconds))
@@ -0,0 +1,141 @@
+"""
+On-demand avatar rendering for the proxy.
+Avatars are solid-colour discs like the ones generate_avatar_set() used to
+write to public/avatars, but in any colour and size, rendered with NumPy and
+kept in a byte-bounded LRU so each variant is encoded once.
+"""
+import io
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # Optional; without them the /avatars/ route is left to static files
+    np = None
+    Image = None
+
+# The original avatar set; any other colour is given as rrggbb hex
+NAMED_COLORS = {
+    'gray': (74, 93, 121),    # #4A5D79
+    'white': (255, 255, 255),  # #FFFFFF
+    'black': (0, 0, 0),        # #000000
+    'purple': (116, 66, 214)   # #7442D6
+}
+
+MIN_SIZE = 16
+MAX_SIZE = 512
+
+# /avatars/purple-64.png, /avatars/7442d6-64.png, or the old file names
+# (/avatars/purple-solo-av.png) with a ?size= query
+AVATAR_PATH_PATTERN = re.compile(
+    r'^/avatars/(?P<color>[a-z]+|[0-9a-fA-F]{6})(?:-solo-av)?(?:-(?P<size>\d+))?\.png$')
+
+RENDER_VERSION = 1  # Part of the ETag; bump when rendering changes
+
+def available() -> bool:
+    return np is not None and Image is not None
+
+def parse_color(value: str) -> Optional[Tuple[int, int, int]]:
+    """A named colour or rrggbb hex as an RGB tuple; None if it's neither"""
+    if value in NAMED_COLORS:
+        return NAMED_COLORS[value]
+    if re.fullmatch(r'[0-9a-fA-F]{6}', value):
+        return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    return None
+
+def parse_avatar_request(path: str, query_size: Optional[str]) -> Optional[Tuple[Tuple[int, int, int], int]]:
+    """
+    Map a request path to (rgb, size).
+
+    Returns None for paths that aren't avatar requests, including old file
+    names without a size, which the static files still answer.
+    """
+    match = AVATAR_PATH_PATTERN.match(path)
+    if match is None:
+        return None
+    color = parse_color(match.group('color'))
+    size = match.group('size') or query_size
+    if color is None or not size or not size.isdigit():
+        return None
+    return color, min(max(int(size), MIN_SIZE), MAX_SIZE)
+
+@lru_cache(maxsize=64)
+def circle_mask(size: int):
+    """
+    Anti-aliased disc alpha for one size, computed once and shared.
+
+    Coverage falls off linearly over the pixel that the edge crosses, which
+    is what supersampling would converge to.
+    """
+    center = (size - 1) / 2
+    radius = size / 2
+    coordinates = np.arange(size, dtype=np.float32) - center
+    distance = np.sqrt(coordinates[None, :] ** 2 + coordinates[:, None] ** 2)
+    coverage = np.clip(radius - distance + 0.5, 0.0, 1.0)
+    mask = (coverage * 255 + 0.5).astype(np.uint8)
+    mask.setflags(write=False)
+    return mask
+
+def render_avatar(color: Tuple[int, int, int], size: int) -> bytes:
+    """PNG bytes of a `size` x `size` disc in `color` on a transparent background"""
+    pixels = np.empty((size, size, 4), dtype=np.uint8)
+    pixels[..., :3] = color
+    pixels[..., 3] = circle_mask(size)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, 'RGBA').save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+def avatar_etag(color: Tuple[int, int, int], size: int) -> str:
+    return '"avatar-{:02x}{:02x}{:02x}-{}-v{}"'.format(*color, size, RENDER_VERSION)
+
+class AvatarCache:
+    """Byte-bounded LRU of rendered avatars keyed by (rgb, size)"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._avatars: 'OrderedDict[tuple, bytes]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, color: Tuple[int, int, int], size: int) -> bytes:
+        key = (color, size)
+        with self._lock:
+            data = self._avatars.get(key)
+            if data is not None:
+                self._avatars.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        # Rendering is cheap enough that two threads racing on a miss is fine
+        data = render_avatar(color, size)
+        with self._lock:
+            if key not in self._avatars:
+                self._avatars[key] = data
+                self._bytes += len(data)
+                while self._bytes > self.max_bytes and len(self._avatars) > 1:
+                    _, evicted = self._avatars.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self.evictions += 1
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'available': available(),
+                'avatars': len(self._avatars),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'masks': circle_mask.cache_info().currsize if available() else 0,
+            }
@@ -0,0 +1,166 @@
+"""
+Load balancing across the proxy's upstream workers.
+Each worker is one Next.js process with its own connection pool, health
+check and circuit breaker; requests go to the healthy worker with the fewest
+in flight.
+"""
+import random
+import threading
+from typing import Dict, Any, List, Optional
+
+from src.server.utils.readiness import UpstreamReadiness
+from src.server.utils.resilience import CircuitBreaker
+from src.server.utils.upstream_pool import UpstreamConnectionPool
+
+BALANCE_STRATEGIES = ('least-connections', 'p2c')
+
+class UpstreamWorker:
+    """One upstream process: where it listens, how it's doing and its keep-alive pool"""
+
+    def __init__(self, index: int, port: int, pool: UpstreamConnectionPool, readiness: UpstreamReadiness,
+                 generation: int = 0, dist_dir: Optional[str] = None, breaker: Optional[CircuitBreaker] = None):
+        self.index = index
+        self.port = port
+        self.pool = pool
+        self.readiness = readiness
+        self.breaker = breaker or CircuitBreaker(f'worker-{index}')
+        self.process = None
+        self.generation = generation  # Deploy that started it; see redeploy() in python_server.py
+        self.dist_dir = dist_dir  # Production build it serves
+        self.warmup = None  # Result of the last warm-up, once done
+        self.retired = False  # Replaced by a newer generation; not to be restarted
+
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.restarts = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.readiness.ready
+
+    def eject(self):
+        """Take the worker out of rotation until its health check passes again"""
+        if self.readiness.ready:
+            self.ejections += 1
+            self.readiness.mark(False)
+            self.readiness.poke()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'index': self.index,
+            'port': self.port,
+            'generation': self.generation,
+            'pid': self.process.pid if self.process is not None else None,
+            'healthy': self.healthy,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ejections': self.ejections,
+            'restarts': self.restarts,
+            'warmup_seconds': self.warmup['seconds'] if self.warmup else None,
+            'circuit': self.breaker.stats(),
+            'pool': self.pool.stats(),
+        }
+
+class UpstreamGroup:
+    """
+    Picks a worker per request.
+
+    'least-connections' scans every healthy worker; 'p2c' (power of two choices)
+    compares two random ones, which stays O(1) and avoids herding on large groups.
+    """
+
+    def __init__(self, workers: List[UpstreamWorker], strategy: str = 'least-connections'):
+        if strategy not in BALANCE_STRATEGIES:
+            raise ValueError(f"Unknown balance strategy {strategy!r}, expected one of: {', '.join(BALANCE_STRATEGIES)}")
+        self.workers = workers
+        self.strategy = strategy
+        self._lock = threading.Lock()
+
+    def any_ready(self) -> bool:
+        return any(worker.healthy for worker in self.workers)
+
+    def acquire(self, avoid: Optional[UpstreamWorker] = None,
+                exclude: Optional[UpstreamWorker] = None) -> Optional[UpstreamWorker]:
+        """
+        Choose a healthy worker whose circuit is not open and count the request
+        against it; None if there is none.
+
+        `avoid` (e.g. the worker a retry is replacing) is only chosen when it
+        is the sole candidate; `exclude` is never chosen.
+        """
+        healthy = [worker for worker in self.workers if worker.healthy]
+        if not healthy:
+            return None
+        candidates = [worker for worker in healthy if worker.breaker.available()]
+        if not candidates:
+            for worker in healthy:
+                worker.breaker.reject()
+            return None
+        if exclude is not None:
+            candidates = [worker for worker in candidates if worker is not exclude]
+            if not candidates:
+                return None
+        fallback = None
+        if avoid is not None and len(candidates) > 1 and avoid in candidates:
+            candidates.remove(avoid)
+            fallback = avoid
+        with self._lock:
+            while candidates:
+                if len(candidates) == 1:
+                    worker = candidates[0]
+                elif self.strategy == 'p2c':
+                    first, second = random.sample(candidates, 2)
+                    worker = first if first.in_flight <= second.in_flight else second
+                else:
+                    worker = min(candidates, key=lambda candidate: candidate.in_flight)
+                # Another request may have taken a half-open worker's last probe since the check above
+                if worker.breaker.try_begin():
+                    worker.in_flight += 1
+                    worker.requests += 1
+                    return worker
+                candidates.remove(worker)
+                if not candidates and fallback is not None:
+                    candidates, fallback = [fallback], None
+        return None
+
+    def has_alternative(self, worker: UpstreamWorker) -> bool:
+        """Whether a healthy worker other than `worker` could take a request now"""
+        return any(other is not worker and other.healthy and other.breaker.available() for other in self.workers)
+
+    def circuit_open(self) -> bool:
+        """Whether healthy workers exist but every one's circuit is open"""
+        healthy = [worker for worker in self.workers if worker.healthy]
+        return bool(healthy) and not any(worker.breaker.available() for worker in healthy)
+
+    def release(self, worker: UpstreamWorker, failed: bool = False):
+        """Finish a request; `failed` means the upstream was at fault (error or timeout), and feeds its breaker"""
+        with self._lock:
+            worker.in_flight -= 1
+            if failed:
+                worker.failures += 1
+        worker.breaker.record(not failed)
+
+    def swap(self, workers: List[UpstreamWorker]) -> List[UpstreamWorker]:
+        """
+        Route new requests to `workers` from now on; returns the replaced ones.
+
+        Requests already on an old worker finish there; release() only touches
+        the worker it is given, so draining them needs nothing else.
+        """
+        with self._lock:
+            previous, self.workers = self.workers, list(workers)
+        return previous
+
+    def close(self):
+        for worker in self.workers:
+            worker.pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'strategy': self.strategy,
+            'healthy_workers': sum(1 for worker in self.workers if worker.healthy),
+            'workers': [worker.stats() for worker in self.workers],
+        }
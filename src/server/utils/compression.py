@@ -0,0 +1,198 @@
+"""
+Response compression for the proxy.
+Negotiates gzip or brotli from Accept-Encoding, compresses streamed upstream
+bodies on the fly and keeps precompressed variants of static and cached
+responses in memory.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Iterable, Optional
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip covers every browser we support
+    brotli = None
+
+GZIP_WBITS = 31  # zlib container with a gzip header
+
+def supported_encodings() -> tuple:
+    """Encodings we can produce, in order of preference"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the best encoding the client accepts.
+
+    Honors q-values (q=0 rules an encoding out) and `*`; ties go to our
+    preference order.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in supported_encodings():
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def is_compressible(content_type: Optional[str], compressible_types: Iterable[str]) -> bool:
+    """True for text-like MIME types (parameters such as charset are ignored)"""
+    if not content_type:
+        return False
+    mime = content_type.split(';', 1)[0].strip().lower()
+    return mime.startswith('text/') or mime in compressible_types
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """Compress a whole body in one go"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+class StreamCompressor:
+    """
+    Incremental compressor for streamed bodies.
+
+    Every piece is flushed so the client can start rendering before the
+    upstream has finished; with 64 KiB pieces the ratio cost is small.
+    """
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+def variant_etag(etag: Optional[str], encoding: str) -> Optional[str]:
+    """Distinct validator for an encoded representation: "abc" -> "abc-gzip" """
+    if not etag:
+        return etag
+    weak = etag.startswith('W/')
+    tag = etag[2:] if weak else etag
+    if tag.endswith('"'):
+        tag = f'{tag[:-1]}-{encoding}"'
+    return f'W/{tag}' if weak else tag
+
+class _Build:
+    """A variant being compressed that concurrent misses for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+
+class VariantCache:
+    """
+    Byte-bounded LRU of compressed bodies, keyed by whatever identifies the source.
+
+    Concurrent misses for one key share a single build.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._variants: 'OrderedDict[tuple, bytes]' = OrderedDict()
+        self._bytes = 0
+        self._building: Dict[tuple, _Build] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def peek(self, key: tuple) -> Optional[bytes]:
+        """The cached variant for key, or None; never builds"""
+        with self._lock:
+            return self._variants.get(key)
+
+    def get(self, key: tuple, build: Callable[[], bytes]) -> bytes:
+        """Return the cached variant for key, building and storing it on a miss"""
+        with self._lock:
+            data = self._variants.get(key)
+            if data is not None:
+                self._variants.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+            pending = self._building.get(key)
+            if pending is None:
+                leader = self._building[key] = _Build()
+            else:
+                self.coalesced += 1
+
+        if pending is not None:
+            pending.done.wait()
+            if pending.data is not None:
+                return pending.data
+            return build()  # The leader's build failed; try our own
+
+        try:
+            data = leader.data = build()
+        except BaseException:
+            with self._lock:
+                del self._building[key]
+            leader.done.set()
+            raise
+        with self._lock:
+            # Stored before the build is unregistered, so no later miss starts another
+            del self._building[key]
+            if len(data) <= self.max_bytes and key not in self._variants:
+                self._variants[key] = data
+                self._bytes += len(data)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._variants.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self.evictions += 1
+        leader.done.set()
+        return data
+
+    def record(self, original_size: int, compressed_size: int):
+        """Count bytes saved, including streamed bodies that aren't cached"""
+        with self._lock:
+            self.bytes_in += original_size
+            self.bytes_out += compressed_size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'encodings': list(supported_encodings()),
+                'variants': len(self._variants),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+            }
@@ -3,8 +3,15 @@ Internal error handling and logging for the climbing application.
 This module handles system-level errors and technical logging.
 """
 import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, TextIO, Tuple
 
 class ErrorSeverity:
     """Define error severity levels for internal error handling"""
@@ -56,6 +63,58 @@ class ErrorCodes:
     SYSTEM_RESOURCE_EXHAUSTED = ("SYS001", ErrorSeverity.CRITICAL)
     SYSTEM_CONFIGURATION_ERROR = ("SYS002", ErrorSeverity.ERROR)
 
+# Technical error descriptions for system logging, one per ErrorCodes entry
+ERROR_DESCRIPTIONS = {
+    ErrorCodes.AUTH_INVALID_TOKEN[0]: "Invalid authentication token provided",
+    ErrorCodes.AUTH_EXPIRED_TOKEN[0]: "Authentication token has expired",
+    ErrorCodes.AUTH_MISSING_CREDENTIALS[0]: "Authentication credentials missing",
+    ErrorCodes.AUTH_INVALID_SCOPE[0]: "Authentication scope not permitted",
+    ErrorCodes.DB_CONNECTION_ERROR[0]: "Failed to establish database connection",
+    ErrorCodes.DB_QUERY_ERROR[0]: "Database query execution failed",
+    ErrorCodes.DB_INTEGRITY_ERROR[0]: "Database integrity constraint violated",
+    ErrorCodes.DB_MIGRATION_ERROR[0]: "Database migration failed",
+    ErrorCodes.DB_DEADLOCK_ERROR[0]: "Database deadlock detected",
+    ErrorCodes.DB_CONNECTION_POOL_EXHAUSTED[0]: "Database connection pool exhausted",
+    ErrorCodes.DB_REPLICATION_LAG[0]: "Database replication lag detected",
+    ErrorCodes.DB_BACKUP_FAILED[0]: "Database backup operation failed",
+    ErrorCodes.FS_PERMISSION_ERROR[0]: "Insufficient filesystem permissions",
+    ErrorCodes.FS_STORAGE_FULL[0]: "Filesystem storage full",
+    ErrorCodes.FS_IO_ERROR[0]: "Filesystem I/O error",
+    ErrorCodes.API_RATE_LIMIT[0]: "API rate limit exceeded",
+    ErrorCodes.API_TIMEOUT[0]: "API request timed out",
+    ErrorCodes.API_INVALID_RESPONSE[0]: "Invalid API response received",
+    ErrorCodes.CACHE_MISS[0]: "Cache miss",
+    ErrorCodes.CACHE_INVALID[0]: "Cache entry invalidated",
+    ErrorCodes.CACHE_EVICTION[0]: "Cache entries evicted",
+    ErrorCodes.RESOURCE_CPU_THRESHOLD[0]: "CPU usage threshold exceeded",
+    ErrorCodes.RESOURCE_MEMORY_THRESHOLD[0]: "Memory usage threshold exceeded",
+    ErrorCodes.RESOURCE_DISK_THRESHOLD[0]: "Disk usage threshold exceeded",
+    ErrorCodes.RESOURCE_NETWORK_THRESHOLD[0]: "Network usage threshold exceeded",
+    ErrorCodes.SYSTEM_RESOURCE_EXHAUSTED[0]: "System resources exhausted",
+    ErrorCodes.SYSTEM_CONFIGURATION_ERROR[0]: "System configuration error",
+}
+
+UNKNOWN_ERROR = ("Unknown system error", ErrorSeverity.ERROR)
+
+SEVERITY_LOG_LEVELS = {
+    ErrorSeverity.INFO: logging.INFO,
+    ErrorSeverity.WARNING: logging.WARNING,
+    ErrorSeverity.ERROR: logging.ERROR,
+    ErrorSeverity.CRITICAL: logging.CRITICAL,
+}
+
+def _build_error_registry() -> Dict[str, Tuple[str, str]]:
+    """code -> (description, severity) for every ErrorCodes entry"""
+    registry = {}
+    for name, value in vars(ErrorCodes).items():
+        if not name.startswith('_') and isinstance(value, tuple):
+            code, severity = value
+            registry[code] = (ERROR_DESCRIPTIONS.get(code, UNKNOWN_ERROR[0]), severity)
+    return registry
+
+# Built once at import so logging an error is a single dict lookup
+ERROR_REGISTRY = _build_error_registry()
+
 def get_error_details(error_code: str, severity_override: Optional[str] = None) -> tuple:
     """
     Get technical error details for system logging.
@@ -65,28 +124,9 @@ def get_error_details(error_code: str, severity_override: Optional[str] = None)
         severity_override: Optional override for the severity level
 
     Returns:
-        tuple: (error description, severity level, log_level)
+        tuple: (error description, severity level)
     """
-    # Technical error descriptions for system logging
-    error_details = {
-        ErrorCodes.AUTH_INVALID_TOKEN[0]: ("Invalid authentication token provided", ErrorSeverity.ERROR),
-        ErrorCodes.AUTH_EXPIRED_TOKEN[0]: ("Authentication token has expired", ErrorSeverity.WARNING),
-        ErrorCodes.DB_CONNECTION_ERROR[0]: ("Failed to establish database connection", ErrorSeverity.CRITICAL),
-        ErrorCodes.DB_QUERY_ERROR[0]: ("Database query execution failed", ErrorSeverity.ERROR),
-        ErrorCodes.DB_DEADLOCK_ERROR[0]: ("Database deadlock detected", ErrorSeverity.ERROR),
-        ErrorCodes.DB_CONNECTION_POOL_EXHAUSTED[0]: ("Database connection pool exhausted", ErrorSeverity.CRITICAL),
-        ErrorCodes.DB_REPLICATION_LAG[0]: ("Database replication lag detected", ErrorSeverity.WARNING),
-        ErrorCodes.DB_BACKUP_FAILED[0]: ("Database backup operation failed", ErrorSeverity.ERROR),
-        ErrorCodes.FS_PERMISSION_ERROR[0]: ("Insufficient filesystem permissions", ErrorSeverity.ERROR),
-        ErrorCodes.API_RATE_LIMIT[0]: ("API rate limit exceeded", ErrorSeverity.WARNING),
-        ErrorCodes.SYSTEM_RESOURCE_EXHAUSTED[0]: ("System resources exhausted", ErrorSeverity.CRITICAL),
-        ErrorCodes.RESOURCE_CPU_THRESHOLD[0]: ("CPU usage threshold exceeded", ErrorSeverity.WARNING),
-        ErrorCodes.RESOURCE_MEMORY_THRESHOLD[0]: ("Memory usage threshold exceeded", ErrorSeverity.WARNING),
-        ErrorCodes.RESOURCE_DISK_THRESHOLD[0]: ("Disk usage threshold exceeded", ErrorSeverity.WARNING),
-        ErrorCodes.RESOURCE_NETWORK_THRESHOLD[0]: ("Network usage threshold exceeded", ErrorSeverity.WARNING)
-    }
-
-    description, severity = error_details.get(error_code, ("Unknown system error", ErrorSeverity.ERROR))
+    description, severity = ERROR_REGISTRY.get(error_code, UNKNOWN_ERROR)
     if severity_override:
         severity = severity_override
 
@@ -99,17 +139,419 @@ def format_error_context(context: Dict[str, Any]) -> str:
     except Exception:
         return str(context)
 
-def log_error(logger, error_code: str, exc_info=None, **kwargs):
+# Overflow policies for AsyncJsonLinesHandler when its queue is full
+OVERFLOW_DROP_NEWEST = 'drop-newest'  # Discard the incoming record; callers never wait
+OVERFLOW_DROP_OLDEST = 'drop-oldest'  # Discard the oldest queued record to make room
+OVERFLOW_BLOCK = 'block'  # Wait for room, pushing back on the caller
+OVERFLOW_POLICIES = (OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, OVERFLOW_BLOCK)
+# Longest close() waits for room in the queue and then for the writer to finish
+ASYNC_LOG_CLOSE_TIMEOUT = 5.0
+
+class AsyncJsonLinesHandler(logging.Handler):
     """
-    Log a system error with appropriate severity and structured context.
+    Logging handler that hands records to a background writer thread.
+
+    Records go into a bounded queue; the writer formats them as JSON lines and
+    writes them in batches of up to `batch_size`, so the logging thread pays
+    for neither serialization nor I/O. What happens when the queue is full is
+    set by `overflow` (one of OVERFLOW_POLICIES); dropped records are counted
+    and reported in the output.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, max_queue: int = 10000, batch_size: int = 256,
+                 flush_interval: float = 0.5, overflow: str = OVERFLOW_DROP_NEWEST, level=logging.NOTSET):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of: {', '.join(OVERFLOW_POLICIES)}")
+        super().__init__(level)
+        self.stream = stream or sys.stderr
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.queue = queue.Queue(max_queue)
+
+        self.written = 0
+        self.dropped = 0  # Updated by producers and the writer; see _count_dropped()
+        self.batches = 0
+        self._dropped_lock = threading.Lock()
+        self._reported_dropped = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._writer_loop, name='error-log-writer', daemon=True)
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord):
+        if self._closed:
+            return
+        if record.args:
+            # Format now; the arguments may change before the writer gets to them
+            record.msg = record.getMessage()
+            record.args = None
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow == OVERFLOW_BLOCK:
+            self.queue.put(record)
+        elif self.overflow == OVERFLOW_DROP_OLDEST:
+            try:
+                self.queue.get_nowait()
+                # The discarded record will never reach the writer; flush() waits on this count
+                self.queue.task_done()
+                self._count_dropped()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self._count_dropped()
+        else:
+            self._count_dropped()
+
+    def format_record(self, record: logging.LogRecord) -> str:
+        """One JSON line for a record, with log_error's structured fields when present"""
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in ('error_code', 'severity', 'details'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc_info'] = logging.Formatter().formatException(record.exc_info)
+        try:
+            return json.dumps(entry, default=str) + '\n'
+        except Exception:
+            entry['details'] = str(entry.get('details'))
+            return json.dumps(entry, default=str) + '\n'
+
+    def flush(self):
+        """Wait until everything queued so far has been written"""
+        if self._thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            if self._enqueue_stop():
+                self._thread.join(ASYNC_LOG_CLOSE_TIMEOUT)
+        super().close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': self.queue.qsize(),
+            'max_queue': self.queue.maxsize,
+            'overflow': self.overflow,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+        }
+
+    def _writer_loop(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._report_dropped([])
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            records = [record for record in batch if record is not None]
+            lines = []
+            for record in records:
+                try:
+                    lines.append(self.format_record(record))
+                except Exception:
+                    self._count_dropped()
+            self._report_dropped(lines)
+            if lines:
+                try:
+                    self.stream.write(''.join(lines))
+                    self.stream.flush()
+                    self.written += len(lines)
+                    self.batches += 1
+                except Exception:
+                    self._count_dropped(len(lines))
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _count_dropped(self, count: int = 1):
+        with self._dropped_lock:
+            self.dropped += count
+
+    def _enqueue_stop(self) -> bool:
+        """
+        Queue the writer's stop marker under the overflow policy: drop-oldest
+        discards records to make room, the others wait at most
+        ASYNC_LOG_CLOSE_TIMEOUT. False if the writer is too stalled to take it.
+        """
+        if self.overflow == OVERFLOW_DROP_OLDEST:
+            while True:
+                try:
+                    self.queue.put_nowait(None)
+                    return True
+                except queue.Full:
+                    pass
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self._count_dropped()
+                except queue.Empty:
+                    pass
+        try:
+            self.queue.put(None, timeout=ASYNC_LOG_CLOSE_TIMEOUT)
+            return True
+        except queue.Full:
+            return False
+
+    def _report_dropped(self, lines: List[str]):
+        # Make losses visible in the log itself, once per batch
+        dropped = self.dropped
+        if dropped > self._reported_dropped:
+            lines.append(json.dumps({
+                'timestamp': datetime.now().isoformat(),
+                'level': 'WARNING',
+                'logger': __name__,
+                'message': 'Log records dropped',
+                'details': {'dropped': dropped - self._reported_dropped, 'overflow': self.overflow},
+            }) + '\n')
+            self._reported_dropped = dropped
+            if len(lines) == 1:
+                try:
+                    self.stream.write(lines.pop())
+                    self.stream.flush()
+                except Exception:
+                    pass
+
+_async_handler: Optional[AsyncJsonLinesHandler] = None
+
+def configure_async_logging(stream: Optional[TextIO] = None, logger: Optional[logging.Logger] = None,
+                            **handler_options) -> AsyncJsonLinesHandler:
+    """
+    Switch log_error to the asynchronous JSON-lines pipeline.
+
+    Installs an AsyncJsonLinesHandler on `logger` (the root logger by default)
+    and makes log_error pass its context as record attributes instead of
+    formatting it on the calling thread.
 
     Args:
-        logger: The logger instance to use
-        error_code: The error code to log
-        exc_info: Optional exception info to include
-        **kwargs: Additional logging context
+        stream: Where to write; stderr by default
+        logger: Logger to attach the handler to
+        **handler_options: max_queue, batch_size, flush_interval, overflow
     """
-    description, severity = get_error_details(error_code)
+    global _async_handler
+    handler = AsyncJsonLinesHandler(stream, **handler_options)
+    target = logger or logging.getLogger()
+    target.addHandler(handler)
+    if target.level == logging.NOTSET or target.level > logging.INFO:
+        target.setLevel(logging.INFO)
+    _async_handler = handler
+    return handler
+
+def async_logging_stats() -> Optional[Dict[str, Any]]:
+    """Queue and drop counters of the async pipeline, or None when it isn't enabled"""
+    return _async_handler.stats() if _async_handler is not None else None
+
+# Context values are reduced to this shape for fingerprinting, so that
+# "user 123" and "user 456" count as the same error
+FINGERPRINT_DIGITS = re.compile(r'\d+')
+FINGERPRINT_VALUE_LENGTH = 200
+
+def error_fingerprint(error_code: str, context: Dict[str, Any], exc_info=None) -> tuple:
+    """Identity of an error for deduplication: code, context shape and exception type"""
+    parts = [error_code]
+    for key in sorted(context):
+        value = context[key]
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = '#'
+        else:
+            value = FINGERPRINT_DIGITS.sub('#', str(value)[:FINGERPRINT_VALUE_LENGTH])
+        parts.append((key, value))
+    if exc_info:
+        if isinstance(exc_info, BaseException):
+            exc = exc_info
+        else:
+            exc = exc_info[1] if isinstance(exc_info, tuple) else sys.exc_info()[1]
+        if exc is not None:
+            parts.append(('exception', type(exc).__name__))
+    return tuple(parts)
+
+class _ErrorBucket:
+    """Occurrences of one fingerprint within the current window"""
+    __slots__ = ('logger', 'error_code', 'count', 'logged', 'first_seen', 'last_seen', 'sample', 'exc_info')
+
+    def __init__(self, logger, error_code: str, now: float, context: Dict[str, Any], exc_info):
+        self.logger = logger
+        self.error_code = error_code
+        self.count = 0
+        self.logged = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.sample = context
+        self.exc_info = exc_info
+
+class ErrorAggregator:
+    """
+    Collapses repeats of the same error into one summary per window.
+
+    The first occurrence of a fingerprint in a window is logged as usual.
+    Repeats are only counted, unless the code's sample rate lets one through,
+    and when the window closes each repeated fingerprint is logged once with
+    its count, first/last timestamps and one context picked uniformly at
+    random from its occurrences.
+
+    Args:
+        window: Window length in seconds
+        sample_rates: code -> share of repeats still logged individually (default 0)
+        max_fingerprints: Distinct fingerprints tracked per window; further
+            ones are counted per code under an overflow bucket
+    """
+
+    def __init__(self, window: float = 10.0, sample_rates: Optional[Dict[str, float]] = None,
+                 max_fingerprints: int = 1000):
+        self.window = window
+        self.sample_rates = dict(sample_rates or {})
+        self.max_fingerprints = max_fingerprints
+
+        self._buckets: Dict[tuple, _ErrorBucket] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.window_started = time.time()
+
+        self.summaries = 0
+        self.suppressed = 0
+
+    def admit(self, logger, error_code: str, context: Dict[str, Any], exc_info=None) -> bool:
+        """Count one occurrence; True when it should also be logged on its own"""
+        now = time.time()
+        fingerprint = error_fingerprint(error_code, context, exc_info)
+        with self._lock:
+            bucket = self._buckets.get(fingerprint)
+            if bucket is None:
+                if len(self._buckets) >= self.max_fingerprints:
+                    fingerprint = (error_code, ('fingerprint', 'overflow'))
+                    bucket = self._buckets.get(fingerprint)
+                if bucket is None:
+                    bucket = self._buckets[fingerprint] = _ErrorBucket(logger, error_code, now, context, exc_info)
+            bucket.count += 1
+            bucket.last_seen = now
+            bucket.logger = logger
+            # Reservoir of one: every occurrence is equally likely to be the sample
+            if bucket.count > 1 and random.random() < 1 / bucket.count:
+                bucket.sample = context
+
+            log_now = bucket.count == 1 or random.random() < self.sample_rates.get(error_code, 0.0)
+            if log_now:
+                bucket.logged += 1
+            else:
+                self.suppressed += 1
+            return log_now
+
+    def flush(self):
+        """Close the current window, logging a summary for every repeated fingerprint"""
+        with self._lock:
+            buckets = self._buckets
+            window_started = self.window_started
+            self._buckets = {}
+            self.window_started = time.time()
+
+        for bucket in buckets.values():
+            if bucket.count <= bucket.logged:
+                continue
+            description, severity = ERROR_REGISTRY.get(bucket.error_code, UNKNOWN_ERROR)
+            level = SEVERITY_LOG_LEVELS.get(severity, logging.ERROR)
+            summary = {
+                'count': bucket.count,
+                'suppressed': bucket.count - bucket.logged,
+                'first_seen': datetime.fromtimestamp(bucket.first_seen).isoformat(),
+                'last_seen': datetime.fromtimestamp(bucket.last_seen).isoformat(),
+                'window_seconds': round(self.window_started - window_started, 3),
+                'sampled_context': bucket.sample,
+            }
+            _emit(bucket.logger, level, f"{description} (repeated {bucket.count}x)", bucket.error_code,
+                  severity, {'aggregated': summary}, None)
+            self.summaries += 1
+
+    def window_counts(self) -> Dict[str, Any]:
+        """Counters for the window in progress, per code and per fingerprint"""
+        with self._lock:
+            buckets = list(self._buckets.items())
+            window_started = self.window_started
+        codes: Dict[str, Dict[str, int]] = {}
+        fingerprints = []
+        for fingerprint, bucket in buckets:
+            totals = codes.setdefault(bucket.error_code, {'count': 0, 'logged': 0, 'fingerprints': 0})
+            totals['count'] += bucket.count
+            totals['logged'] += bucket.logged
+            totals['fingerprints'] += 1
+            fingerprints.append({
+                'error_code': bucket.error_code,
+                'fingerprint': [list(part) if isinstance(part, tuple) else part for part in fingerprint],
+                'count': bucket.count,
+                'first_seen': datetime.fromtimestamp(bucket.first_seen).isoformat(),
+                'last_seen': datetime.fromtimestamp(bucket.last_seen).isoformat(),
+            })
+        fingerprints.sort(key=lambda entry: entry['count'], reverse=True)
+        return {
+            'window_seconds': self.window,
+            'window_started': datetime.fromtimestamp(window_started).isoformat(),
+            'codes': codes,
+            'top': fingerprints[:20],
+            'summaries': self.summaries,
+            'suppressed': self.suppressed,
+        }
+
+    def start(self):
+        """Flush every `window` seconds from a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name='error-aggregator', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.window):
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+_aggregator: Optional[ErrorAggregator] = None
+
+def configure_error_aggregation(window: float = 10.0, sample_rates: Optional[Dict[str, float]] = None,
+                                max_fingerprints: int = 1000) -> ErrorAggregator:
+    """Deduplicate log_error output with an ErrorAggregator flushed in the background"""
+    global _aggregator
+    if _aggregator is not None:
+        _aggregator.stop()
+    _aggregator = ErrorAggregator(window, sample_rates, max_fingerprints)
+    _aggregator.start()
+    return _aggregator
+
+def error_window_stats() -> Optional[Dict[str, Any]]:
+    """The aggregator's counters for the current window, or None when it isn't enabled"""
+    return _aggregator.window_counts() if _aggregator is not None else None
+
+def _emit(logger, level: int, description: str, error_code: str, severity: str,
+          details: Optional[Dict[str, Any]], exc_info):
+    if _async_handler is not None:
+        logger.log(level, description, exc_info=exc_info,
+                   extra={'error_code': error_code, 'severity': severity, 'details': details or None})
+        return
 
     # Build structured log context
     log_context = {
@@ -119,18 +561,38 @@ def log_error(logger, error_code: str, exc_info=None, **kwargs):
     }
 
     # Add any additional context
-    if kwargs:
-        log_context['details'] = kwargs
+    if details:
+        log_context['details'] = details
 
     # Format the structured log message
     log_message = f"{description} | {format_error_context(log_context)}"
 
     # Log with appropriate severity level
-    if severity == ErrorSeverity.CRITICAL:
-        logger.critical(log_message, exc_info=exc_info)
-    elif severity == ErrorSeverity.ERROR:
-        logger.error(log_message, exc_info=exc_info)
-    elif severity == ErrorSeverity.WARNING:
-        logger.warning(log_message)
-    else:
-        logger.info(log_message)
\ No newline at end of file
+    logger.log(level, log_message, exc_info=exc_info)
+
+def log_error(logger, error_code: str, exc_info=None, **kwargs):
+    """
+    Log a system error with appropriate severity and structured context.
+
+    With the async pipeline enabled (see configure_async_logging) the context
+    travels on the log record and is serialized by the writer thread. With
+    aggregation enabled (see configure_error_aggregation) repeats of the same
+    error are folded into a periodic summary.
+
+    Args:
+        logger: The logger instance to use
+        error_code: The error code to log
+        exc_info: Optional exception info to include
+        **kwargs: Additional logging context
+    """
+    description, severity = ERROR_REGISTRY.get(error_code, UNKNOWN_ERROR)
+    level = SEVERITY_LOG_LEVELS.get(severity, logging.ERROR)
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.ERROR:
+        exc_info = None
+
+    if _aggregator is not None and not _aggregator.admit(logger, error_code, kwargs, exc_info):
+        return
+
+    _emit(logger, level, description, error_code, severity, kwargs, exc_info)
@@ -0,0 +1,340 @@
+"""
+Request metrics for the proxy, rendered in the Prometheus text format.
+Each thread records into its own shard, so the request path never takes a
+lock; shards are only merged when /__proxy/metrics is scraped.
+"""
+import re
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+
+# Seconds; the +Inf bucket is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+MAX_ROUTES = 500  # Distinct route labels kept before new ones are folded into 'other'
+OVERFLOW_ROUTE = 'other'
+
+# Path segments that are identifiers rather than part of the route
+ID_SEGMENT_PATTERN = re.compile(r'^(\d+|[0-9a-fA-F]{16,}|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27})$')
+
+# Everything under these prefixes shares one label
+GROUPED_PREFIXES = ('/_next/static', '/_next/data', '/_next/image', '/_next')
+
+UPSTREAM_ERROR_KINDS = ('timeout', 'refused', 'unavailable', 'circuit_open', 'error')
+
+class RequestSample:
+    """What a request picked up on the way through, for request_finished() and the access log"""
+    __slots__ = ('route', 'upstream_seconds', 'bytes_in', 'request_id', 'queue_seconds', 'upstream_status', 'worker')
+
+    def __init__(self):
+        self.route = None
+        self.upstream_seconds = None
+        self.bytes_in = 0
+        self.request_id = None
+        self.queue_seconds = 0.0  # Waiting for Next.js to start or for an admission slot
+        self.upstream_status = None
+        self.worker = None
+
+class CountingWriter:
+    """Wraps a socket writer and counts the bytes written through it"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+class ConnectionStats:
+    """Client connection counts for keep-alive: how often a connection carries more than one request"""
+
+    CLOSE_REASONS = ('client', 'idle', 'max_requests', 'busy', 'error')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.open = 0
+        self.requests = 0
+        self.reused = 0  # Requests after the first on their connection
+        self.closed = dict.fromkeys(self.CLOSE_REASONS, 0)
+
+    def connection_opened(self):
+        with self._lock:
+            self.opened += 1
+            self.open += 1
+
+    def connection_closed(self, reason: str):
+        with self._lock:
+            self.open -= 1
+            self.closed[reason] = self.closed.get(reason, 0) + 1
+
+    def request(self, reused: bool):
+        with self._lock:
+            self.requests += 1
+            if reused:
+                self.reused += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'opened': self.opened,
+                'open': self.open,
+                'requests': self.requests,
+                'reused_requests': self.reused,
+                'reuse_rate': round(self.reused / self.requests, 3) if self.requests else None,
+                'requests_per_connection': round(self.requests / self.opened, 2) if self.opened else None,
+                'closed': dict(self.closed),
+            }
+
+class TunnelStats:
+    """Open and finished WebSocket tunnels and Server-Sent Event streams"""
+
+    KINDS = ('websocket', 'sse')
+    CLOSE_REASONS = ('client', 'upstream', 'idle', 'error')
+
+    def __init__(self, max_open: int):
+        self._lock = threading.Lock()
+        self.max_open = max_open  # Across both kinds
+        self.open = dict.fromkeys(self.KINDS, 0)
+        self.opened = dict.fromkeys(self.KINDS, 0)
+        self.refused = 0
+        self.closed = dict.fromkeys(self.CLOSE_REASONS, 0)
+        self.bytes_upstream = 0
+        self.bytes_downstream = 0
+
+    def try_open(self, kind: str) -> bool:
+        """Count a new tunnel; False (and nothing counted as open) when max_open are already open"""
+        with self._lock:
+            if sum(self.open.values()) >= self.max_open:
+                self.refused += 1
+                return False
+            self.open[kind] += 1
+            self.opened[kind] += 1
+            return True
+
+    def cancel(self, kind: str):
+        """Give back a slot from try_open() that never became a tunnel (the upstream refused it)"""
+        with self._lock:
+            self.open[kind] -= 1
+            self.opened[kind] -= 1
+
+    def tunnel_closed(self, kind: str, reason: str, bytes_upstream: int = 0, bytes_downstream: int = 0):
+        with self._lock:
+            self.open[kind] -= 1
+            self.closed[reason] = self.closed.get(reason, 0) + 1
+            self.bytes_upstream += bytes_upstream
+            self.bytes_downstream += bytes_downstream
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'open': dict(self.open),
+                'max_open': self.max_open,
+                'opened': dict(self.opened),
+                'refused': self.refused,
+                'closed': dict(self.closed),
+                'bytes_upstream': self.bytes_upstream,
+                'bytes_downstream': self.bytes_downstream,
+            }
+
+class _Shard:
+    """One thread's counters; only that thread writes to it"""
+    __slots__ = ('requests', 'duration', 'upstream_duration', 'bytes_in', 'bytes_out',
+                 'upstream_errors', 'started', 'finished')
+
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.duration: Dict[Tuple[str, str], List[float]] = {}
+        self.upstream_duration: Dict[Tuple[str, str], List[float]] = {}
+        self.bytes_in: Dict[str, int] = {}
+        self.bytes_out: Dict[str, int] = {}
+        self.upstream_errors: Dict[str, int] = {}
+        self.started = 0
+        self.finished = 0
+
+def _observe(histograms: Dict[tuple, List[float]], key: tuple, seconds: float):
+    # Layout: one count per bucket, then the +Inf count, then the sum
+    values = histograms.get(key)
+    if values is None:
+        values = histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+    values[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    values[-1] += seconds
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + '}'
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and not value.is_integer():
+        return repr(round(value, 6))
+    return str(int(value))
+
+class ProxyMetrics:
+    """
+    Counters, gauges and latency histograms for requests through the proxy.
+
+    `request_started()` / `request_finished()` bracket every request; total
+    and upstream (time until Next.js sent its response headers) latency are
+    kept as separate histograms per method and route.
+    """
+
+    def __init__(self, max_routes: int = MAX_ROUTES):
+        self.max_routes = max_routes
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._routes = set()
+        self._lock = threading.Lock()  # Only for new shards, routes and gauges
+        # (name, 'gauge' or 'counter', help, collect)
+        self._gauges: List[Tuple[str, str, str, Callable[[], Iterable[Tuple[Dict[str, Any], float]]]]] = []
+
+    def route_for(self, path: str) -> str:
+        """
+        Low-cardinality route label for a request path.
+
+        Query strings are dropped, id-like segments become ':id' and Next.js
+        internals are grouped by prefix.
+        """
+        path = path.split('?', 1)[0].split('#', 1)[0] or '/'
+        for prefix in GROUPED_PREFIXES:
+            if path == prefix or path.startswith(prefix + '/'):
+                return prefix
+        route = '/'.join(':id' if ID_SEGMENT_PATTERN.match(segment) else segment
+                         for segment in path.split('/'))
+        if route in self._routes:
+            return route
+        with self._lock:
+            if len(self._routes) >= self.max_routes:
+                return OVERFLOW_ROUTE
+            self._routes.add(route)
+        return route
+
+    def register_gauge(self, name: str, help_text: str,
+                       collect: Callable[[], Iterable[Tuple[Dict[str, Any], float]]]):
+        """Add a gauge whose (labels, value) samples are read at scrape time"""
+        with self._lock:
+            self._gauges.append((name, 'gauge', help_text, collect))
+
+    def register_counter(self, name: str, help_text: str,
+                         collect: Callable[[], Iterable[Tuple[Dict[str, Any], float]]]):
+        """register_gauge() for values that only go up, such as counts since start; `name` should end in _total"""
+        with self._lock:
+            self._gauges.append((name, 'counter', help_text, collect))
+
+    def request_started(self):
+        self._shard().started += 1
+
+    def request_finished(self, method: str, route: str, status: int, seconds: float,
+                         upstream_seconds: Optional[float] = None, bytes_in: int = 0, bytes_out: int = 0):
+        shard = self._shard()
+        shard.finished += 1
+        key = (method, route, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        _observe(shard.duration, (method, route), seconds)
+        if upstream_seconds is not None:
+            _observe(shard.upstream_duration, (method, route), upstream_seconds)
+        if bytes_in:
+            shard.bytes_in[route] = shard.bytes_in.get(route, 0) + bytes_in
+        if bytes_out:
+            shard.bytes_out[route] = shard.bytes_out.get(route, 0) + bytes_out
+
+    def upstream_error(self, kind: str):
+        """Count a failed upstream exchange; kind is one of UPSTREAM_ERROR_KINDS"""
+        shard = self._shard()
+        shard.upstream_errors[kind] = shard.upstream_errors.get(kind, 0) + 1
+
+    def top_routes(self, limit: int, method: str = 'GET') -> List[str]:
+        """Route labels with the most successful requests for `method`, busiest first"""
+        with self._lock:
+            shards = list(self._shards)
+        counts = {}
+        for shard in shards:
+            for (request_method, route, status), count in dict(shard.requests).items():
+                if request_method == method and status < 400:
+                    counts[route] = counts.get(route, 0) + count
+        return sorted(counts, key=counts.get, reverse=True)[:limit]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            shards = list(self._shards)
+        return sum(shard.started - shard.finished for shard in shards)
+
+    def render(self) -> str:
+        """Merge every shard and format the result for Prometheus"""
+        with self._lock:
+            shards = list(self._shards)
+            gauges = list(self._gauges)
+
+        requests, bytes_in, bytes_out, errors = {}, {}, {}, dict.fromkeys(UPSTREAM_ERROR_KINDS, 0)
+        duration, upstream_duration = {}, {}
+        in_flight = 0
+        for shard in shards:
+            # dict() copies are atomic under the GIL, so a writer can't trip the merge
+            for target, source in ((requests, shard.requests), (bytes_in, shard.bytes_in),
+                                   (bytes_out, shard.bytes_out), (errors, shard.upstream_errors)):
+                for key, value in dict(source).items():
+                    target[key] = target.get(key, 0) + value
+            for target, source in ((duration, shard.duration), (upstream_duration, shard.upstream_duration)):
+                for key, values in dict(source).items():
+                    merged = target.setdefault(key, [0] * len(values))
+                    for i, value in enumerate(list(values)):
+                        merged[i] += value
+            in_flight += shard.started - shard.finished
+
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        header('proxy_requests_total', 'counter', 'Requests handled by the proxy.')
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(f'proxy_requests_total{_labels(method=method, route=route, status=status)} {count}')
+
+        for name, histograms, help_text in (
+                ('proxy_request_duration_seconds', duration,
+                 'Time from reading the request line to the last response byte.'),
+                ('proxy_upstream_duration_seconds', upstream_duration,
+                 'Time until the Next.js worker returned response headers.')):
+            header(name, 'histogram', help_text)
+            for (method, route), values in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(method=method, route=route, le=bound)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(method=method, route=route)} {_format_value(values[-1])}')
+                lines.append(f'{name}_count{_labels(method=method, route=route)} {cumulative}')
+
+        header('proxy_request_bytes_total', 'counter', 'Request body bytes received from clients.')
+        for route, count in sorted(bytes_in.items()):
+            lines.append(f'proxy_request_bytes_total{_labels(route=route)} {count}')
+        header('proxy_response_bytes_total', 'counter', 'Response bytes sent to clients, headers included.')
+        for route, count in sorted(bytes_out.items()):
+            lines.append(f'proxy_response_bytes_total{_labels(route=route)} {count}')
+
+        header('proxy_upstream_errors_total', 'counter', 'Upstream requests that failed, by kind.')
+        for kind, count in sorted(errors.items()):
+            lines.append(f'proxy_upstream_errors_total{_labels(kind=kind)} {count}')
+
+        header('proxy_requests_in_flight', 'gauge', 'Requests currently being handled.')
+        lines.append(f'proxy_requests_in_flight {in_flight}')
+
+        for name, kind, help_text, collect in gauges:
+            header(name, kind, help_text)
+            for labels, value in collect():
+                lines.append(f'{name}{_labels(**labels) if labels else ""} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
@@ -0,0 +1,158 @@
+"""
+Active readiness tracking for the proxy's upstream.
+A background loop probes the upstream instead of trusting its log output, and
+requests that arrive before it is ready can wait in a bounded queue.
+"""
+import threading
+import time
+from typing import Callable, Dict, Any, Optional
+
+class UpstreamReadiness:
+    """
+    Health-check loop plus a bounded wait queue for not-yet-ready requests.
+
+    The upstream becomes ready on the first successful probe and is marked
+    not ready again after `failure_threshold` failures in a row. Probes run
+    every `starting_interval` seconds until it is ready, then every `interval`.
+    """
+
+    def __init__(self, probe: Callable[[], bool], interval: float = 5.0, starting_interval: float = 0.5,
+                 failure_threshold: int = 3, max_waiters: int = 32,
+                 on_change: Optional[Callable[[bool], None]] = None):
+        self.probe = probe
+        self.on_change = on_change
+        self.interval = interval
+        self.starting_interval = starting_interval
+        self.failure_threshold = failure_threshold
+        self.max_waiters = max_waiters
+
+        self._ready = False
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.started_at = time.time()
+        self.ready_since = None
+        self.last_probe_at = None
+        self.last_probe_ok = None
+        self.consecutive_failures = 0
+        self.probes = 0
+        self.waiting = 0
+        self.queued = 0
+        self.queue_served = 0
+        self.queue_timeouts = 0
+        self.queue_rejected = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def start(self):
+        """Start probing from a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._probe_loop, name='upstream-readiness', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def poke(self):
+        """Probe right away, e.g. when the upstream's output hints that it is up"""
+        self._wake.set()
+
+    def mark(self, ready: bool):
+        """Record a readiness change and release queued requests when it turns ready"""
+        with self._cond:
+            changed = ready != self._ready
+            if ready and changed:
+                self.ready_since = time.time()
+            elif not ready:
+                self.ready_since = None
+            self._ready = ready
+            if ready:
+                self._cond.notify_all()
+        if changed and self.on_change is not None:
+            self.on_change(ready)
+
+    def enter_queue(self) -> bool:
+        """Claim a wait-queue slot; False when the queue is full"""
+        with self._cond:
+            if self.waiting >= self.max_waiters:
+                self.queue_rejected += 1
+                return False
+            self.waiting += 1
+            self.queued += 1
+            return True
+
+    def leave_queue(self, served: bool):
+        with self._cond:
+            self.waiting -= 1
+            if served:
+                self.queue_served += 1
+            else:
+                self.queue_timeouts += 1
+
+    def wait_ready(self, timeout: float) -> bool:
+        """
+        Block until the upstream is ready, for at most `timeout` seconds.
+
+        Returns False straight away when the wait queue is full.
+        """
+        if self._ready:
+            return True
+        if timeout <= 0 or not self.enter_queue():
+            return False
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._ready:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            ready = self._ready
+        self.leave_queue(ready)
+        return ready
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'ready': self._ready,
+                'uptime_seconds': round(time.time() - self.started_at, 3),
+                'ready_since': self.ready_since,
+                'last_probe_at': self.last_probe_at,
+                'last_probe_ok': self.last_probe_ok,
+                'consecutive_failures': self.consecutive_failures,
+                'probes': self.probes,
+                'queue': {
+                    'waiting': self.waiting,
+                    'max_waiters': self.max_waiters,
+                    'queued': self.queued,
+                    'served': self.queue_served,
+                    'timeouts': self.queue_timeouts,
+                    'rejected': self.queue_rejected,
+                },
+            }
+
+    def _probe_loop(self):
+        while not self._stop.is_set():
+            try:
+                ok = bool(self.probe())
+            except Exception:
+                ok = False
+
+            self.probes += 1
+            self.last_probe_at = time.time()
+            self.last_probe_ok = ok
+            if ok:
+                self.consecutive_failures = 0
+                if not self._ready:
+                    self.mark(True)
+            else:
+                self.consecutive_failures += 1
+                if self._ready and self.consecutive_failures >= self.failure_threshold:
+                    self.mark(False)
+
+            self._wake.wait(self.interval if self._ready else self.starting_interval)
+            self._wake.clear()
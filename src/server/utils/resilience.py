@@ -0,0 +1,223 @@
+"""
+Failure handling for requests to the Next.js workers.
+A circuit breaker per worker stops sending it requests after repeated
+failures, so a hung process costs one timeout rather than one per request;
+a retry budget caps how many extra requests retries and hedges may add, and
+a latency window supplies the delay after which a GET is hedged.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+from src.server.utils.errors import ErrorCodes, log_error
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+BREAKER_STATES = (CLOSED, HALF_OPEN, OPEN)  # Index is the proxy_upstream_circuit_state gauge value
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` failures in a row; open -> half-open
+    once `reset_timeout` seconds have passed, letting `half_open_probes`
+    requests through; one success closes it again, one failure reopens it.
+
+    Transitions are logged as API002.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 5.0, half_open_probes: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probes_in_flight = 0
+
+        self.opens = 0
+        self.rejected = 0
+        self.last_transition_at = None
+
+    def available(self) -> bool:
+        """Whether a request may be sent now; an open breaker goes half-open here once its timeout is up"""
+        with self._lock:
+            return self._available()
+
+    def try_begin(self) -> bool:
+        """
+        Claim the right to send a request: True when available(), and in
+        half-open state the probe is reserved in the same step, so concurrent
+        callers can't send more than `half_open_probes`.
+        """
+        with self._lock:
+            if not self._available():
+                return False
+            if self.state == HALF_OPEN:
+                self.probes_in_flight += 1
+            return True
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                if success:
+                    self.consecutive_failures = 0
+                    self._transition(CLOSED)
+                else:
+                    self._open()
+            elif self.state == CLOSED:
+                if success:
+                    self.consecutive_failures = 0
+                else:
+                    self.consecutive_failures += 1
+                    if self.consecutive_failures >= self.failure_threshold:
+                        self._open()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'opens': self.opens,
+                'rejected': self.rejected,
+                'last_transition_at': self.last_transition_at,
+            }
+
+    def _available(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            return self.probes_in_flight < self.half_open_probes
+        return self.state == CLOSED
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self.opens += 1
+        self._transition(OPEN)
+
+    def _transition(self, state: str):
+        previous, self.state = self.state, state
+        self.last_transition_at = time.time()
+        if state != HALF_OPEN:
+            self.probes_in_flight = 0
+        log_error(logger, ErrorCodes.API_TIMEOUT[0], breaker=self.name, transition=f"{previous} -> {state}",
+                  consecutive_failures=self.consecutive_failures, reset_timeout=self.reset_timeout)
+
+class RetryBudget:
+    """
+    Retries allowed as a share of recent traffic: at most `ratio` times the
+    requests of the last `window` seconds, plus `min_per_second` so a quiet
+    proxy can still retry. Keeps a failing upstream from being hit by a
+    multiple of its normal load.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, window: int = 10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._buckets = deque()  # [second, requests, retries], oldest on the left
+        self._lock = threading.Lock()
+
+        self.spent = {'retry': 0, 'hedge': 0}
+        self.exhausted = 0
+        self.hedges_won = 0  # Hedges that answered before the request they copied
+
+    def record_request(self):
+        with self._lock:
+            self._bucket()[1] += 1
+
+    def try_spend(self, kind: str = 'retry') -> bool:
+        """Claim one retry or hedge; False when the budget is used up"""
+        with self._lock:
+            current = self._bucket()
+            requests = sum(bucket[1] for bucket in self._buckets)
+            retries = sum(bucket[2] for bucket in self._buckets)
+            if retries >= requests * self.ratio + self.min_per_second * self.window:
+                self.exhausted += 1
+                return False
+            current[2] += 1
+            self.spent[kind] += 1
+            return True
+
+    def hedge_won(self):
+        with self._lock:
+            self.hedges_won += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._bucket()
+            return {
+                'ratio': self.ratio,
+                'min_per_second': self.min_per_second,
+                'window_seconds': self.window,
+                'window_requests': sum(bucket[1] for bucket in self._buckets),
+                'window_retries': sum(bucket[2] for bucket in self._buckets),
+                'spent': dict(self.spent),
+                'exhausted': self.exhausted,
+                'hedges_won': self.hedges_won,
+            }
+
+    def _bucket(self):
+        second = int(time.monotonic())
+        while self._buckets and self._buckets[0][0] <= second - self.window:
+            self._buckets.popleft()
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        return self._buckets[-1]
+
+class LatencyWindow:
+    """
+    The last `size` upstream response times, for a percentile-based hedge delay.
+
+    The percentile is recomputed every `refresh_every` observations rather
+    than on each read.
+    """
+
+    def __init__(self, size: int = 1000, min_samples: int = 50, refresh_every: int = 50):
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self._samples = deque(maxlen=size)
+        self._since_refresh = 0
+        self._percentiles: Dict[float, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._since_refresh += 1
+            if self._since_refresh >= self.refresh_every:
+                self._percentiles = {}
+                self._since_refresh = 0
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The q-quantile (0..1) of recent samples; None until there are min_samples"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            value = self._percentiles.get(q)
+            if value is None:
+                ordered = sorted(self._samples)
+                value = self._percentiles[q] = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {'samples': 0, 'p50_seconds': None, 'p95_seconds': None}
+        return {
+            'samples': len(samples),
+            'p50_seconds': round(samples[int(0.5 * len(samples))], 4),
+            'p95_seconds': round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 4),
+        }
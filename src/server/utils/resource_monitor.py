@@ -0,0 +1,324 @@
+"""
+Background resource monitoring for the proxy host.
+Samples /proc for the proxy process, its Next.js workers and the host, keeps
+a fixed-size history and logs the RES001-RES004 / SYS001 codes when usage
+crosses a threshold.
+"""
+import logging
+import os
+import resource
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Any, List, Optional
+
+from src.server.utils.errors import ErrorCodes, log_error
+
+logger = logging.getLogger(__name__)
+
+PROC = '/proc'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+class ResourceAlert:
+    """
+    Threshold with hysteresis on one sampled value.
+
+    Fires after `sustain` consecutive samples at or above `high` and only
+    clears once the value drops to `clear` or below, so a value hovering
+    around the threshold doesn't flap.
+    """
+
+    def __init__(self, name: str, error_code: str, high: float, clear: Optional[float] = None, sustain: int = 2):
+        self.name = name
+        self.error_code = error_code
+        self.high = high
+        self.clear = clear if clear is not None else high * 0.9
+        self.sustain = sustain
+
+        self.active = False
+        self.streak = 0
+        self.since = None
+        self.fired = 0
+
+    def update(self, value: Optional[float]) -> Optional[str]:
+        """Feed one sample; returns 'fired' or 'cleared' on a state change"""
+        if value is None:
+            return None
+        if self.active:
+            if value <= self.clear:
+                self.active = False
+                self.streak = 0
+                self.since = None
+                return 'cleared'
+            return None
+        self.streak = self.streak + 1 if value >= self.high else 0
+        if self.streak >= self.sustain:
+            self.active = True
+            self.since = time.time()
+            self.fired += 1
+            return 'fired'
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'error_code': self.error_code,
+            'high': self.high,
+            'clear': self.clear,
+            'active': self.active,
+            'since': self.since,
+            'fired': self.fired,
+        }
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+def read_process(pid: int) -> Optional[Dict[str, Any]]:
+    """CPU ticks, RSS, thread count and process group of one process"""
+    stat = _read(f'{PROC}/{pid}/stat')
+    statm = _read(f'{PROC}/{pid}/statm')
+    if stat is None or statm is None:
+        return None
+    # The command name may contain spaces; fields after it are fixed
+    fields = stat.rsplit(')', 1)[1].split()
+    return {
+        'pgrp': int(fields[2]),
+        'cpu_ticks': int(fields[11]) + int(fields[12]),
+        'threads': int(fields[17]),
+        'rss_bytes': int(statm.split()[1]) * PAGE_SIZE,
+    }
+
+def process_groups() -> Dict[int, List[int]]:
+    """Every pid on the host by process group, e.g. npx plus the node server it started"""
+    groups = {}
+    try:
+        entries = os.listdir(PROC)
+    except OSError:
+        return groups
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        stat = _read(f'{PROC}/{entry}/stat')
+        if stat is not None:
+            try:
+                pgrp = int(stat.rsplit(')', 1)[1].split()[2])
+            except (IndexError, ValueError):
+                continue
+            groups.setdefault(pgrp, []).append(int(entry))
+    return groups
+
+def read_host_cpu() -> Optional[tuple]:
+    """(busy, total) jiffies across all CPUs"""
+    stat = _read(f'{PROC}/stat')
+    if stat is None:
+        return None
+    values = [int(value) for value in stat.splitlines()[0].split()[1:]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+    return sum(values) - idle, sum(values)
+
+def read_meminfo() -> Dict[str, int]:
+    info = {}
+    for line in (_read(f'{PROC}/meminfo') or '').splitlines():
+        name, _, rest = line.partition(':')
+        parts = rest.split()
+        if parts:
+            info[name] = int(parts[0]) * 1024
+    return info
+
+def read_network_bytes() -> Optional[int]:
+    """Bytes received plus sent on every interface except loopback"""
+    dev = _read(f'{PROC}/net/dev')
+    if dev is None:
+        return None
+    total = 0
+    for line in dev.splitlines()[2:]:
+        name, _, counters = line.partition(':')
+        if name.strip() == 'lo':
+            continue
+        fields = counters.split()
+        total += int(fields[0]) + int(fields[8])
+    return total
+
+class ResourceMonitor:
+    """
+    Samples resource usage every `interval` seconds into a ring buffer.
+
+    Args:
+        interval: Seconds between samples
+        history: Samples kept (the oldest are overwritten)
+        processes: Callable returning {label: pid} of processes to watch; each
+            pid's whole process group is counted under its label
+        disk_path: Filesystem whose usage is watched
+        thresholds: Overrides for cpu_percent, memory_percent, disk_percent,
+            network_bytes_per_second, fd_percent and memory_exhausted_percent
+    """
+
+    DEFAULT_THRESHOLDS = {
+        'cpu_percent': 85.0,
+        'memory_percent': 90.0,
+        'disk_percent': 90.0,
+        'network_bytes_per_second': 100 * 1024 * 1024,
+        'fd_percent': 90.0,
+        'memory_exhausted_percent': 97.0,
+    }
+
+    def __init__(self, interval: float = 5.0, history: int = 720,
+                 processes: Optional[Callable[[], Dict[str, int]]] = None, disk_path: str = '.',
+                 thresholds: Optional[Dict[str, float]] = None):
+        self.interval = interval
+        self.processes = processes or (lambda: {})
+        self.disk_path = disk_path
+        self.available = os.path.isdir(PROC)
+        self.samples = deque(maxlen=history)
+
+        limits = dict(self.DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.alerts = [
+            ResourceAlert('host_cpu_percent', ErrorCodes.RESOURCE_CPU_THRESHOLD[0], limits['cpu_percent']),
+            ResourceAlert('host_memory_percent', ErrorCodes.RESOURCE_MEMORY_THRESHOLD[0], limits['memory_percent']),
+            ResourceAlert('disk_percent', ErrorCodes.RESOURCE_DISK_THRESHOLD[0], limits['disk_percent']),
+            ResourceAlert('network_bytes_per_second', ErrorCodes.RESOURCE_NETWORK_THRESHOLD[0],
+                          limits['network_bytes_per_second']),
+            ResourceAlert('proxy_fd_percent', ErrorCodes.SYSTEM_RESOURCE_EXHAUSTED[0], limits['fd_percent'], sustain=1),
+            ResourceAlert('host_memory_percent', ErrorCodes.SYSTEM_RESOURCE_EXHAUSTED[0],
+                          limits['memory_exhausted_percent'], sustain=1),
+        ]
+
+        self._previous_cpu = {}  # label -> (cpu_ticks, monotonic time)
+        self._previous_host_cpu = None
+        self._previous_network = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self) -> Dict[str, Any]:
+        """Take one sample, append it to the history and check the thresholds"""
+        now = time.monotonic()
+        sample = {'time': time.time()}
+
+        processes = {'proxy': [os.getpid()]}
+        watched = {label: pid for label, pid in self.processes().items() if pid is not None}
+        # One walk of /proc per sample, however many workers are watched
+        groups = process_groups() if watched else {}
+        for label, pid in watched.items():
+            processes[label] = groups.get(pid) or [pid]
+        sample['processes'] = {}
+        for label, pids in processes.items():
+            readings = [reading for reading in map(read_process, pids) if reading is not None]
+            if not readings:
+                continue
+            ticks = sum(reading['cpu_ticks'] for reading in readings)
+            cpu_percent = None
+            previous = self._previous_cpu.get(label)
+            if previous is not None and now > previous[1]:
+                cpu_percent = round(max(ticks - previous[0], 0) / CLOCK_TICKS / (now - previous[1]) * 100, 1)
+            self._previous_cpu[label] = (ticks, now)
+            sample['processes'][label] = {
+                'pids': len(readings),
+                'cpu_percent': cpu_percent,
+                'rss_bytes': sum(reading['rss_bytes'] for reading in readings),
+                'threads': sum(reading['threads'] for reading in readings),
+            }
+        for label in list(self._previous_cpu):
+            if label not in processes:
+                del self._previous_cpu[label]
+
+        host_cpu = read_host_cpu()
+        if host_cpu is not None and self._previous_host_cpu is not None:
+            busy = host_cpu[0] - self._previous_host_cpu[0]
+            total = host_cpu[1] - self._previous_host_cpu[1]
+            sample['host_cpu_percent'] = round(busy / total * 100, 1) if total > 0 else 0.0
+        else:
+            sample['host_cpu_percent'] = None
+        self._previous_host_cpu = host_cpu
+
+        meminfo = read_meminfo()
+        if meminfo.get('MemTotal'):
+            available = meminfo.get('MemAvailable', meminfo.get('MemFree', 0))
+            sample['host_memory_percent'] = round((1 - available / meminfo['MemTotal']) * 100, 1)
+            sample['host_memory_available_bytes'] = available
+        else:
+            sample['host_memory_percent'] = None
+
+        try:
+            fs = os.statvfs(self.disk_path)
+            sample['disk_percent'] = round((1 - fs.f_bavail / fs.f_blocks) * 100, 1) if fs.f_blocks else None
+        except OSError:
+            sample['disk_percent'] = None
+
+        network = read_network_bytes()
+        if network is not None and self._previous_network is not None and now > self._previous_network[1]:
+            sample['network_bytes_per_second'] = round(
+                max(network - self._previous_network[0], 0) / (now - self._previous_network[1]))
+        else:
+            sample['network_bytes_per_second'] = None
+        if network is not None:
+            self._previous_network = (network, now)
+
+        try:
+            open_fds = len(os.listdir(f'{PROC}/self/fd'))
+            fd_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+            sample['proxy_open_fds'] = open_fds
+            sample['proxy_fd_percent'] = round(open_fds / fd_limit * 100, 1) if fd_limit > 0 else None
+        except OSError:
+            sample['proxy_fd_percent'] = None
+
+        load = _read(f'{PROC}/loadavg')
+        sample['load_average'] = [float(value) for value in load.split()[:3]] if load else None
+
+        self.samples.append(sample)
+        self._check_thresholds(sample)
+        return sample
+
+    def _check_thresholds(self, sample: Dict[str, Any]):
+        for alert in self.alerts:
+            value = sample.get(alert.name)
+            change = alert.update(value)
+            if change == 'fired':
+                log_error(logger, alert.error_code, resource=alert.name, value=value, threshold=alert.high,
+                          processes={label: {'cpu_percent': usage['cpu_percent'], 'rss_bytes': usage['rss_bytes']}
+                                     for label, usage in sample['processes'].items()})
+            elif change == 'cleared':
+                logger.info("Resource %s back to %s (clears at %s)", alert.name, value, alert.clear)
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        return self.samples[-1] if self.samples else None
+
+    def history(self, seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Samples from the last `seconds` (all kept samples by default), oldest first"""
+        samples = list(self.samples)
+        if seconds is None:
+            return samples
+        cutoff = time.time() - seconds
+        return [sample for sample in samples if sample['time'] >= cutoff]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'available': self.available,
+            'interval_seconds': self.interval,
+            'samples': len(self.samples),
+            'latest': self.latest(),
+            'alerts': [dict(alert.stats(), resource=alert.name) for alert in self.alerts],
+        }
+
+    def start(self):
+        """Sample from a daemon thread; does nothing without /proc"""
+        if not self.available:
+            print("Resource monitor disabled: /proc is not available")
+            return
+        if self._thread is None:
+            self.sample()  # Baseline for the rate-based values
+            self._thread = threading.Thread(target=self._sample_loop, name='resource-monitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Resource sampling failed: {str(e)}")
@@ -0,0 +1,308 @@
+"""
+Shared HTTP response cache for the proxy.
+Stores upstream GET responses that are marked cacheable, bounded by bytes with
+LRU eviction, and serves stale entries while they are revalidated.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, NamedTuple, Optional, Tuple
+
+from src.server.utils.errors import ErrorCodes, log_error
+
+logger = logging.getLogger(__name__)
+
+CACHEABLE_STATUSES = (200, 203, 301, 404, 410)
+
+# Belong to the client that filled an entry, so they aren't replayed when
+# revalidating it (unless the response varies on them)
+PER_REQUEST_HEADERS = ('x-request-id', 'cookie', 'authorization')
+
+# Freshness states returned by ResponseCache.lookup()
+FRESH = 'fresh'
+STALE = 'stale'
+
+class CacheEntry(NamedTuple):
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+    stored_at: float
+    expires: float  # Fresh until this monotonic time
+    stale_until: float  # May be served while revalidating until this time
+    request_headers: Dict[str, str]  # Replayed for background revalidation, without PER_REQUEST_HEADERS
+    size: int
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Split a Cache-Control header into {directive: argument or None}"""
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+def _seconds(directives: Dict[str, Optional[str]], name: str) -> Optional[int]:
+    try:
+        return int(directives[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class InFlight:
+    """An upstream fetch that concurrent misses for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+class ResponseCache:
+    """
+    Byte-bounded LRU cache of upstream responses.
+
+    Follows the shared-cache rules of Cache-Control: s-maxage/max-age give the
+    freshness lifetime, stale-while-revalidate extends it for background
+    revalidation, and no-store/private/no-cache, Set-Cookie and `Vary: *`
+    keep a response out. Entries are keyed by path plus the request values of
+    the headers named in the response's Vary.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int,
+                 fetch: Callable[[str, Dict[str, str]], Tuple[int, List[Tuple[str, str]], bytes]],
+                 default_stale_while_revalidate: int = 0):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.fetch = fetch
+        self.default_stale_while_revalidate = default_stale_while_revalidate
+
+        self._entries: 'OrderedDict[tuple, CacheEntry]' = OrderedDict()
+        self._keys_by_path: Dict[str, set] = {}
+        self._vary: Dict[str, Tuple[str, ...]] = {}
+        self._in_flight: Dict[tuple, InFlight] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.revalidations = 0
+
+    def key_for(self, path: str, get_header: Callable[[str], Optional[str]]) -> tuple:
+        """Cache key for a request, using the Vary headers last seen for this path"""
+        names = self._vary.get(path, ())
+        return (path,) + tuple(get_header(name) or '' for name in names)
+
+    def lookup(self, key: tuple, get_header: Callable[[str], Optional[str]]) -> Tuple[Optional[CacheEntry], Optional[str]]:
+        """
+        Find a servable entry for a GET/HEAD request.
+
+        Returns:
+            tuple: (entry, FRESH or STALE), or (None, None) on a miss. A STALE
+            result has already scheduled a background revalidation.
+        """
+        request_directives = parse_cache_control(get_header('Cache-Control'))
+        if 'no-cache' in request_directives or 'no-store' in request_directives:
+            return None, None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now < entry.expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry, FRESH
+                if now < entry.stale_until:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    revalidate = key not in self._in_flight
+                    if revalidate:
+                        self._in_flight[key] = InFlight()
+                else:
+                    self._remove(key)
+                    entry = None
+            if entry is None:
+                self.misses += 1
+
+        if entry is None:
+            if logger.isEnabledFor(logging.INFO):
+                log_error(logger, ErrorCodes.CACHE_MISS[0], path=key[0])
+            return None, None
+
+        if revalidate:
+            threading.Thread(target=self._revalidate, args=(key, entry),
+                             name='cache-revalidate', daemon=True).start()
+        return entry, STALE
+
+    def begin_fetch(self, key: tuple) -> Optional[InFlight]:
+        """
+        Register this request as the one fetching `key` from upstream.
+
+        Returns None when this caller is the leader and must call `end_fetch()`,
+        or the InFlight of the existing fetch to wait on.
+        """
+        with self._lock:
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight
+            self._in_flight[key] = InFlight()
+            return None
+
+    def end_fetch(self, key: tuple):
+        """Release requests waiting on this key's fetch"""
+        with self._lock:
+            flight = self._in_flight.pop(key, None)
+        if flight is not None:
+            flight.done.set()
+
+    def storable(self, status: int, headers: List[Tuple[str, str]],
+                 request_headers: Dict[str, str]) -> Optional[Tuple[float, float]]:
+        """
+        Decide whether a response may be cached.
+
+        Returns:
+            (fresh_for, stale_for) in seconds, or None if it must not be stored
+        """
+        if status not in CACHEABLE_STATUSES:
+            return None
+        lowered = {}
+        for name, value in headers:
+            lowered.setdefault(name.lower(), value)
+        if 'set-cookie' in lowered or lowered.get('vary', '').strip() == '*':
+            return None
+
+        directives = parse_cache_control(lowered.get('cache-control'))
+        if {'no-store', 'no-cache', 'private'} & directives.keys():
+            return None
+        if any(name.lower() == 'authorization' for name in request_headers) \
+                and not {'public', 's-maxage'} & directives.keys():
+            return None
+
+        fresh_for = _seconds(directives, 's-maxage')
+        if fresh_for is None:
+            fresh_for = _seconds(directives, 'max-age')
+        if not fresh_for or fresh_for <= 0:
+            return None
+        try:
+            fresh_for -= int(lowered.get('age', 0))
+        except ValueError:
+            pass
+
+        stale_for = _seconds(directives, 'stale-while-revalidate')
+        if stale_for is None:
+            stale_for = self.default_stale_while_revalidate
+        if 'must-revalidate' in directives or 'proxy-revalidate' in directives:
+            stale_for = 0
+        return max(fresh_for, 0), stale_for
+
+    def store(self, path: str, request_headers: Dict[str, str], status: int,
+              headers: List[Tuple[str, str]], body: bytes, lifetime: Tuple[float, float]):
+        """Insert a response, evicting least recently used entries to fit"""
+        vary_names = set()
+        for name, value in headers:
+            if name.lower() == 'vary':
+                vary_names.update(part.strip().lower() for part in value.split(',') if part.strip())
+        vary = tuple(sorted(vary_names))
+        lowered_request = {name.lower(): value for name, value in request_headers.items()}
+        key = (path,) + tuple(lowered_request.get(name, '') for name in vary)
+
+        size = len(body) + sum(len(name) + len(value) for name, value in headers) + 256
+        if size > self.max_entry_bytes:
+            return
+
+        replayed = {name: value for name, value in request_headers.items()
+                    if name.lower() not in PER_REQUEST_HEADERS or name.lower() in vary}
+        now = time.monotonic()
+        fresh_for, stale_for = lifetime
+        entry = CacheEntry(status, headers, body, now, now + fresh_for,
+                           now + fresh_for + stale_for, replayed, size)
+
+        evicted = []
+        with self._lock:
+            self._vary[path] = vary
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._keys_by_path.setdefault(path, set()).add(key)
+            self._bytes += size
+            self.stores += 1
+            while self._bytes > self.max_bytes and self._entries:
+                old_key, _ = next(iter(self._entries.items()))
+                self._remove(old_key)
+                self.evictions += 1
+                evicted.append(old_key[0])
+
+        if evicted and logger.isEnabledFor(logging.WARNING):
+            log_error(logger, ErrorCodes.CACHE_EVICTION[0], evicted=len(evicted),
+                      paths=evicted[:5], cache_bytes=self._bytes)
+
+    def invalidate(self, path: str, reason: str):
+        """Drop every variant stored for a path"""
+        with self._lock:
+            keys = list(self._keys_by_path.get(path, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        if keys:
+            log_error(logger, ErrorCodes.CACHE_INVALID[0], path=path, reason=reason, variants=len(keys))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.stale_hits) / lookups, 4) if lookups else None,
+                'coalesced': self.coalesced,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'revalidations': self.revalidations,
+            }
+
+    def _remove(self, key: tuple):
+        # Caller holds the lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            keys = self._keys_by_path.get(key[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_path[key[0]]
+
+    def _revalidate(self, key: tuple, entry: CacheEntry):
+        """Refresh a stale entry, conditionally when it carries a validator"""
+        path = key[0]
+        request_headers = dict(entry.request_headers)
+        for name, value in entry.headers:
+            if name.lower() == 'etag':
+                request_headers['If-None-Match'] = value
+            elif name.lower() == 'last-modified':
+                request_headers['If-Modified-Since'] = value
+        try:
+            status, headers, body = self.fetch(path, request_headers)
+            if status == 304:
+                # Keep the stored body, take the new freshness headers
+                updated = {name.lower() for name, _ in headers}
+                headers = [(name, value) for name, value in entry.headers
+                           if name.lower() not in updated] + headers
+                status, body = entry.status, entry.body
+            lifetime = self.storable(status, headers, entry.request_headers)
+            if lifetime is None:
+                self.invalidate(path, reason=f"revalidation returned uncacheable {status}")
+            else:
+                self.store(path, entry.request_headers, status, headers, body, lifetime)
+                with self._lock:
+                    self.revalidations += 1
+        except Exception as e:
+            log_error(logger, ErrorCodes.CACHE_INVALID[0], path=path, reason=f"revalidation failed: {str(e)}")
+        finally:
+            self.end_fetch(key)
@@ -0,0 +1,147 @@
+"""
+Accept / width negotiation for the responsive image variants.
+utils/icon_generator.py writes WebP and AVIF variants of public/images plus a
+manifest; this picks the variant to send for a request to the original URL.
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, List, NamedTuple, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+# Most compact first; only formats the client names explicitly are sent, since
+# image/* and */* say nothing about what a browser can decode
+FORMAT_PREFERENCE = ('avif', 'webp')
+
+# Request headers the choice depends on, for Vary
+NEGOTIATED_HEADERS = 'Accept, Sec-CH-Width, Width'
+
+MAX_WIDTH_HINT = 8192
+
+class ImageVariant(NamedTuple):
+    url: str  # Path under public/, served from the static index
+    format: str
+    content_type: str
+    width: int
+    bytes: int
+
+def accepted_formats(accept: Optional[str]) -> List[str]:
+    """FORMAT_PREFERENCE names the Accept header lists with a non-zero q"""
+    accepted = set()
+    for media_range in (accept or '').lower().split(','):
+        media_type, *params = [part.strip() for part in media_range.split(';')]
+        if not media_type.startswith('image/'):
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(media_type[len('image/'):])
+    return [name for name in FORMAT_PREFERENCE if name in accepted]
+
+def width_hint(path: str, get_header) -> Optional[int]:
+    """
+    Rendered width in device pixels, if the request says.
+
+    A `?w=` query wins over the Sec-CH-Width / Width client hints, which
+    browsers only send to origins that asked for them with Accept-CH.
+    """
+    values = parse_qs(urlparse(path).query).get('w', [])
+    values += [get_header('Sec-CH-Width'), get_header('Width')]
+    for value in values:
+        if value and value.strip().isdigit() and int(value) > 0:
+            return min(int(value), MAX_WIDTH_HINT)
+    return None
+
+class ResponsiveImageIndex:
+    """
+    Source URL -> variants, loaded from the pipeline's manifest.
+
+    The manifest is re-read when its mtime changes, checked at most every
+    `refresh_interval` seconds from the request path; like the static
+    index, the map is swapped in whole so lookups don't lock.
+    """
+
+    def __init__(self, manifest_path: str, refresh_interval: float = 2.0):
+        self.manifest_path = manifest_path
+        self.refresh_interval = refresh_interval
+        self._images: Dict[str, List[ImageVariant]] = {}
+        self._mtime_ns = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()  # One reload at a time
+
+        self.reloads = 0
+        self.negotiated = 0
+        self.originals = 0
+
+    def variants(self, url_path: str) -> Optional[List[ImageVariant]]:
+        """Variants of the image at url_path; None when it isn't in the manifest"""
+        self._maybe_reload()
+        return self._images.get(unquote(url_path.split('?', 1)[0].split('#', 1)[0]))
+
+    def choose(self, variants: List[ImageVariant], accept: Optional[str], width: Optional[int]) -> Optional[ImageVariant]:
+        """
+        Best variant for a client, or None to send the original.
+
+        The narrowest width at or above the hint (the widest without one),
+        then the smallest file among the accepted formats at that width.
+        """
+        formats = accepted_formats(accept)
+        candidates = [variant for variant in variants if variant.format in formats]
+        if not candidates:
+            self.originals += 1
+            return None
+        widths = sorted({variant.width for variant in candidates})
+        target = widths[-1]
+        if width is not None:
+            target = next((w for w in widths if w >= width), widths[-1])
+        self.negotiated += 1
+        return min((variant for variant in candidates if variant.width == target),
+                   key=lambda variant: (variant.bytes, formats.index(variant.format)))
+
+    def stats(self) -> Dict[str, Any]:
+        images = self._images
+        return {
+            'images': len(images),
+            'variants': sum(len(variants) for variants in images.values()),
+            'reloads': self.reloads,
+            'negotiated': self.negotiated,
+            'originals': self.originals,
+        }
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + self.refresh_interval
+            try:
+                mtime_ns = os.stat(self.manifest_path).st_mtime_ns
+            except OSError:
+                self._images, self._mtime_ns = {}, None
+                return
+            if mtime_ns != self._mtime_ns:
+                self._images = self._load()
+                self._mtime_ns = mtime_ns
+                self.reloads += 1
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Responsive image manifest reload failed: {str(e)}")
+        finally:
+            self._lock.release()
+
+    def _load(self) -> Dict[str, List[ImageVariant]]:
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        url_root = manifest['url_root']
+        return {
+            url_path: [ImageVariant(url_root + variant['file'], variant['format'], variant['content_type'],
+                                    variant['width'], variant['bytes'])
+                       for variant in entry['variants']]
+            for url_path, entry in manifest['images'].items()
+        }
@@ -0,0 +1,308 @@
+"""
+In-memory standings: per-user and per-gym aggregates of sends plus sorted
+leaderboard indexes, kept current one send at a time.
+Mirrors the queries in src/server/routes/auth.js (/standings) and
+leaderboard.js, so a page view no longer has to aggregate every send.
+"""
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+GRADE_PATTERN = re.compile(r'^5\.(\d+)([a-d]?)$')
+GRADE_LETTER_FRACTIONS = {'': 0.0, 'a': 0.0, 'b': 0.25, 'c': 0.5, 'd': 0.75}
+
+def grade_value(grade: Optional[str]) -> Optional[float]:
+    """Numeric YDS grade as the SQL computes it: 5.11c -> 11.5; None for anything else"""
+    match = GRADE_PATTERN.match(grade or '')
+    if match is None:
+        return None
+    return int(match.group(1)) + GRADE_LETTER_FRACTIONS[match.group(2)]
+
+def format_grade(value: Optional[float]) -> str:
+    """Inverse of grade_value() for averages, like formatGrade() in leaderboard.js"""
+    if not value:
+        return 'N/A'
+    base = int(value)
+    fraction = value - base
+    letter = 'a' if fraction < 0.25 else 'b' if fraction < 0.5 else 'c' if fraction < 0.75 else 'd'
+    return f'5.{base}{letter}'
+
+class LeaderboardIndex:
+    """
+    Ids ordered by points (highest first, ties by id).
+
+    Kept as a sorted list of (-points, id) keys: moving an id is two bisects,
+    O(log n) comparisons plus a memmove of the tail, and the top of the
+    board is a slice of the list.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[int, int]] = []
+        self._points: Dict[int, int] = {}
+
+    def set(self, member_id: int, points: int):
+        previous = self._points.get(member_id)
+        if previous == points:
+            return
+        if previous is not None:
+            del self._keys[bisect_left(self._keys, (-previous, member_id))]
+        self._points[member_id] = points
+        insort(self._keys, (-points, member_id))
+
+    def discard(self, member_id: int):
+        previous = self._points.pop(member_id, None)
+        if previous is not None:
+            del self._keys[bisect_left(self._keys, (-previous, member_id))]
+
+    def rank(self, member_id: int) -> Optional[int]:
+        """1-based position, or None for an unknown id"""
+        points = self._points.get(member_id)
+        if points is None:
+            return None
+        return bisect_left(self._keys, (-points, member_id)) + 1
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        """(id, points) for the first `limit` places"""
+        return [(member_id, -negative_points) for negative_points, member_id in self._keys[:limit]]
+
+    @classmethod
+    def from_points(cls, points: Dict[int, int]) -> 'LeaderboardIndex':
+        """Build in one sort rather than n insertions"""
+        index = cls()
+        index._points = dict(points)
+        index._keys = sorted((-value, member_id) for member_id, value in points.items())
+        return index
+
+    def __len__(self):
+        return len(self._keys)
+
+class Totals:
+    """Running sums for one user or gym; averages are derived on read"""
+    __slots__ = ('points', 'ascents', 'sends', 'attempts', 'grade_total', 'graded', 'sent_grade_total', 'sent_graded')
+
+    def __init__(self):
+        self.points = 0
+        self.ascents = 0
+        self.sends = 0
+        self.attempts = 0
+        self.grade_total = 0.0
+        self.graded = 0
+        self.sent_grade_total = 0.0
+        self.sent_graded = 0
+
+    def add(self, contribution: 'SendContribution', sign: int = 1):
+        self.points += sign * contribution.points
+        self.ascents += sign
+        self.attempts += sign * contribution.attempts
+        if contribution.sent:
+            self.sends += sign
+        if contribution.grade is not None:
+            self.grade_total += sign * contribution.grade
+            self.graded += sign
+            if contribution.sent:
+                self.sent_grade_total += sign * contribution.grade
+                self.sent_graded += sign
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'points': self.points,
+            'totalAscents': self.ascents,
+            'totalSends': self.sends,
+            'burns': self.ascents - self.sends,
+            'grade': format_grade(self.grade_total / self.graded if self.graded else None),
+            'avgSentGrade': format_grade(self.sent_grade_total / self.sent_graded if self.sent_graded else None),
+            'avgAttemptsPerClimb': round(self.attempts / self.ascents, 1) if self.ascents else 0,
+            'successRate': round(self.sends / self.ascents * 100) if self.ascents else 0,
+        }
+
+class SendContribution:
+    """What one send added to the totals, kept so edits and deletes can take it back out"""
+    __slots__ = ('user_id', 'gym_id', 'points', 'sent', 'attempts', 'grade')
+
+    def __init__(self, user_id: int, gym_id: Optional[int], points: int, sent: bool, attempts: int,
+                 grade: Optional[float]):
+        self.user_id = user_id
+        self.gym_id = gym_id
+        self.points = points
+        self.sent = sent
+        self.attempts = attempts
+        self.grade = grade
+
+class StandingsEngine:
+    """
+    Materialized standings over the users, routes and sends tables.
+
+    Rows use the field names of prisma/schema.prisma (userId, routeId,
+    gymId, ...). rebuild() loads a full snapshot; apply_send() and
+    remove_send() then keep the aggregates and leaderboards current, each in
+    O(log n). Gym standings count sends on that gym's routes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usernames: Dict[int, str] = {}
+        self._routes: Dict[int, Tuple[Optional[int], Optional[float]]] = {}  # id -> (gym id, grade)
+        self._sends: Dict[int, SendContribution] = {}
+        self._users: Dict[int, Totals] = {}
+        self._gyms: Dict[int, Totals] = {}
+        self._gym_climbers: Dict[int, Dict[int, List[int]]] = {}  # gym id -> user id -> [points, ascents] there
+        self._leaderboard = LeaderboardIndex()
+        self._gym_leaderboards: Dict[int, LeaderboardIndex] = {}
+        self._boards: Dict[Tuple[Optional[int], int], List[Dict[str, Any]]] = {}  # Rendered, until the next write
+
+        self.rebuilds = 0
+        self.updates = 0
+
+    def rebuild(self, users: Iterable[Dict[str, Any]], routes: Iterable[Dict[str, Any]],
+                sends: Iterable[Dict[str, Any]]):
+        """Replace everything with aggregates computed from a bulk snapshot"""
+        fresh = StandingsEngine()
+        for user in users:
+            fresh._usernames[user['id']] = user.get('username') or 'Anonymous'
+            fresh._users[user['id']] = Totals()
+        for route in routes:
+            fresh._routes[route['id']] = (route.get('gymId'), grade_value(route.get('grade')))
+        for send in sends:
+            fresh._add(send['id'], fresh._contribution(send))
+
+        leaderboard = LeaderboardIndex.from_points({user_id: totals.points for user_id, totals in fresh._users.items()})
+        gym_leaderboards = {gym_id: LeaderboardIndex.from_points({user_id: points for user_id, (points, _)
+                                                                  in climbers.items()})
+                            for gym_id, climbers in fresh._gym_climbers.items()}
+        with self._lock:
+            self._usernames, self._routes, self._sends = fresh._usernames, fresh._routes, fresh._sends
+            self._users, self._gyms, self._gym_climbers = fresh._users, fresh._gyms, fresh._gym_climbers
+            self._leaderboard, self._gym_leaderboards = leaderboard, gym_leaderboards
+            self._boards = {}
+            self.rebuilds += 1
+
+    def upsert_user(self, user: Dict[str, Any]):
+        with self._lock:
+            self._usernames[user['id']] = user.get('username') or 'Anonymous'
+            if user['id'] not in self._users:
+                self._users[user['id']] = Totals()
+                self._leaderboard.set(user['id'], 0)
+            self._boards = {}
+
+    def upsert_route(self, route: Dict[str, Any]):
+        """New or edited route; sends already counted keep the grade and gym they had"""
+        with self._lock:
+            self._routes[route['id']] = (route.get('gymId'), grade_value(route.get('grade')))
+
+    def apply_send(self, send: Dict[str, Any]):
+        """Count a new send, or replace what an already counted send (same id) contributed"""
+        with self._lock:
+            contribution = self._contribution(send)
+            touched = {(contribution.user_id, contribution.gym_id)}
+            previous = self._sends.get(send['id'])
+            if previous is not None:
+                self._subtract(send['id'])
+                touched.add((previous.user_id, previous.gym_id))
+            self._add(send['id'], contribution)
+            self._reindex(touched)
+            self.updates += 1
+
+    def remove_send(self, send_id: int):
+        with self._lock:
+            previous = self._sends.get(send_id)
+            if previous is None:
+                return
+            self._subtract(send_id)
+            self._reindex({(previous.user_id, previous.gym_id)})
+            self.updates += 1
+
+    def leaderboard(self, limit: int = 100, gym_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Top of the overall or a gym's board, in the /api/standings entry shape.
+
+        The list is rendered once per write and shared by every reader until
+        the next one, so callers must not modify it.
+        """
+        with self._lock:
+            board = self._boards.get((gym_id, limit))
+            if board is None:
+                index = self._leaderboard if gym_id is None else self._gym_leaderboards.get(gym_id)
+                board = [self._entry(user_id, rank, points)
+                         for rank, (user_id, points) in enumerate(index.top(limit), start=1)] if index else []
+                self._boards[(gym_id, limit)] = board
+            return board
+
+    def user_standing(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            rank = self._leaderboard.rank(user_id)
+            if rank is None:
+                return None
+            return self._entry(user_id, rank, self._users[user_id].points)
+
+    def gym_totals(self, gym_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            totals = self._gyms.get(gym_id)
+            if totals is None:
+                return None
+            return dict(totals.to_dict(), gymId=gym_id, climbers=len(self._gym_climbers.get(gym_id, ())))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'gyms': len(self._gyms),
+                'routes': len(self._routes),
+                'sends': len(self._sends),
+                'rebuilds': self.rebuilds,
+                'updates': self.updates,
+            }
+
+    def _entry(self, user_id: int, rank: int, points: int) -> Dict[str, Any]:
+        totals = self._users.get(user_id) or Totals()
+        return dict(totals.to_dict(), userId=user_id, username=self._usernames.get(user_id, 'Anonymous'),
+                    points=points, rank=rank)
+
+    def _contribution(self, send: Dict[str, Any]) -> SendContribution:
+        gym_id, route_grade = self._routes.get(send.get('routeId'), (None, None))
+        return SendContribution(
+            user_id=send['userId'],
+            gym_id=gym_id,
+            points=send.get('points') or 0,
+            sent=send.get('sent', True),
+            attempts=send.get('attempts') or 1,
+            grade=route_grade if route_grade is not None else grade_value(send.get('grade')),
+        )
+
+    def _add(self, send_id: int, contribution: SendContribution):
+        self._sends[send_id] = contribution
+        self._users.setdefault(contribution.user_id, Totals()).add(contribution)
+        if contribution.gym_id is not None:
+            self._gyms.setdefault(contribution.gym_id, Totals()).add(contribution)
+            climber = self._gym_climbers.setdefault(contribution.gym_id, {}).setdefault(contribution.user_id, [0, 0])
+            climber[0] += contribution.points
+            climber[1] += 1
+
+    def _subtract(self, send_id: int):
+        contribution = self._sends.pop(send_id)
+        self._users[contribution.user_id].add(contribution, -1)
+        if contribution.gym_id is not None:
+            gym = self._gyms[contribution.gym_id]
+            gym.add(contribution, -1)
+            if not gym.ascents:
+                # As if it had never had a send, which is what rebuild() would say
+                del self._gyms[contribution.gym_id]
+            climber = self._gym_climbers[contribution.gym_id][contribution.user_id]
+            climber[0] -= contribution.points
+            climber[1] -= 1
+
+    def _reindex(self, touched):
+        """Move the (user, gym) pairs whose points changed to their new places"""
+        self._boards = {}
+        for user_id, gym_id in touched:
+            self._leaderboard.set(user_id, self._users[user_id].points)
+            if gym_id is None:
+                continue
+            index = self._gym_leaderboards.setdefault(gym_id, LeaderboardIndex())
+            climbers = self._gym_climbers[gym_id]
+            if climbers[user_id][1]:
+                index.set(user_id, climbers[user_id][0])
+            else:
+                # No sends left at this gym
+                del climbers[user_id]
+                index.discard(user_id)
@@ -0,0 +1,216 @@
+"""
+In-memory index of the proxy's static files (public/).
+Metadata is loaded up front and refreshed in the background, so answering a
+request for an asset needs neither the upstream nor a stat() call.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote
+
+# Vite/webpack style names such as main.B48lKuWY.js or logo.3f9a2c1b.png
+CONTENT_HASH_PATTERN = re.compile(r'\.([A-Za-z0-9_-]{8,})\.[A-Za-z0-9]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+class StaticEntry(NamedTuple):
+    """Metadata for one file under the static root"""
+    path: str  # Absolute path on disk
+    size: int
+    mtime: float
+    mtime_ns: int
+    etag: str
+    last_modified: str
+    content_type: str
+    cache_control: str
+
+class StaticResponse(NamedTuple):
+    """What to send for a static request: status, headers and the byte range of the file"""
+    status: int
+    headers: List[Tuple[str, str]]
+    offset: int
+    length: int  # 0 when there is no body to send
+
+def is_content_hashed(filename: str) -> bool:
+    """True for fingerprinted names whose content can never change"""
+    match = CONTENT_HASH_PATTERN.search(filename)
+    return bool(match) and any(c.isdigit() for c in match.group(1))
+
+class StaticFileIndex:
+    """
+    URL path -> StaticEntry map for every file under `root`.
+
+    The whole map is rebuilt off the request path and swapped in with a single
+    assignment, so lookups never take a lock. Files are only re-hashed when their
+    size or mtime changes.
+    """
+
+    def __init__(self, root: str, refresh_interval: float = 2.0):
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self._entries: Dict[str, StaticEntry] = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+
+    def lookup(self, url_path: str) -> Optional[StaticEntry]:
+        """Find the file for a request path (query string and fragment are ignored)"""
+        path = unquote(url_path.split('?', 1)[0].split('#', 1)[0])
+        return self._entries.get(path)
+
+    def refresh(self):
+        """Rescan the root, reusing entries whose size and mtime are unchanged"""
+        previous = self._entries
+        entries = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                url_path = '/' + os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                entry = previous.get(url_path)
+                if entry is None or entry.size != st.st_size or entry.mtime_ns != st.st_mtime_ns:
+                    try:
+                        entry = self._build_entry(full_path, filename, st)
+                    except OSError:
+                        continue
+                entries[url_path] = entry
+        self._entries = entries
+        self.refreshes += 1
+
+    def start(self):
+        """Load the index now and keep it fresh from a daemon thread"""
+        self.refresh()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name='static-index', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        entries = self._entries
+        return {
+            'files': len(entries),
+            'bytes': sum(entry.size for entry in entries.values()),
+            'refreshes': self.refreshes,
+        }
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Static index refresh failed: {str(e)}")
+
+    @staticmethod
+    def _build_entry(full_path: str, filename: str, st: os.stat_result) -> StaticEntry:
+        digest = hashlib.blake2b(digest_size=12)
+        with open(full_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        content_type, _ = mimetypes.guess_type(filename)
+        return StaticEntry(
+            path=full_path,
+            size=st.st_size,
+            mtime=st.st_mtime,
+            mtime_ns=st.st_mtime_ns,
+            etag=f'"{digest.hexdigest()}"',
+            last_modified=formatdate(st.st_mtime, usegmt=True),
+            content_type=content_type or 'application/octet-stream',
+            cache_control=IMMUTABLE_CACHE_CONTROL if is_content_hashed(filename) else REVALIDATE_CACHE_CONTROL,
+        )
+
+def plan_static_response(entry: StaticEntry, get_header) -> StaticResponse:
+    """
+    Work out the response to a GET/HEAD for a static file.
+
+    Handles If-None-Match / If-Modified-Since (304), a single byte Range with
+    optional If-Range (206/416); anything else gets the whole file.
+
+    Args:
+        entry: The indexed file
+        get_header: Callable returning a request header value or None
+    """
+    headers = [
+        ('ETag', entry.etag),
+        ('Last-Modified', entry.last_modified),
+        ('Cache-Control', entry.cache_control),
+        ('Accept-Ranges', 'bytes'),
+    ]
+
+    if _not_modified(entry, get_header('If-None-Match'), get_header('If-Modified-Since')):
+        return StaticResponse(304, headers, 0, 0)
+
+    headers.append(('Content-Type', entry.content_type))
+
+    range_header = get_header('Range')
+    if_range = get_header('If-Range')
+    if range_header and (not if_range or if_range in (entry.etag, entry.last_modified)):
+        byte_range = _parse_range(range_header, entry.size)
+        if byte_range == 'unsatisfiable':
+            headers.append(('Content-Range', f'bytes */{entry.size}'))
+            headers.append(('Content-Length', '0'))
+            return StaticResponse(416, headers, 0, 0)
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            headers.append(('Content-Range', f'bytes {start}-{end}/{entry.size}'))
+            headers.append(('Content-Length', str(length)))
+            return StaticResponse(206, headers, start, length)
+
+    headers.append(('Content-Length', str(entry.size)))
+    return StaticResponse(200, headers, 0, entry.size)
+
+def etag_matches(if_none_match: str, etag: Optional[str]) -> bool:
+    """Whether an If-None-Match list (or `*`) matches etag, compared weakly as RFC 9110 requires"""
+    if etag is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in [tag.removeprefix('W/') for tag in tags]
+
+def _not_modified(entry: StaticEntry, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    if if_none_match:
+        # If-None-Match wins over If-Modified-Since
+        return etag_matches(if_none_match, entry.etag)
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return False
+        return int(entry.mtime) <= since
+    return False
+
+def _parse_range(value: str, size: int):
+    """
+    Parse a single-range `bytes=` header.
+
+    Returns:
+        (start, end) inclusive, None to ignore the header, or 'unsatisfiable'
+    """
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None  # Multipart ranges aren't worth it for our assets
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                return 'unsatisfiable'
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return 'unsatisfiable'
+    return start, min(end, size - 1)
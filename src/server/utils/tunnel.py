@@ -0,0 +1,291 @@
+"""
+Byte tunnels between a client and Next.js, for WebSocket upgrades.
+Once the upstream has accepted the handshake (101) the proxy stops parsing and
+copies bytes both ways as they arrive; any other answer is passed back as an
+ordinary response. Each direction buffers at most a
+fixed number of bytes: a side isn't read while the other can't keep up.
+Server-Sent Events stay on the normal response path, which already streams;
+is_event_stream() is how it knows to treat one as long-lived.
+"""
+import asyncio
+import selectors
+import socket
+import time
+from typing import List, Optional, Tuple
+
+# Largest response head accepted from the upstream during a handshake
+MAX_HEAD_BYTES = 64 * 1024
+# Largest body of a refused handshake (e.g. a 404 page) passed back to the client
+MAX_REFUSAL_BODY_BYTES = 1024 * 1024
+
+# Hop-by-hop and framing headers of a refused handshake, replaced when it is re-sent
+REFUSAL_DROPPED_HEADERS = ('connection', 'keep-alive', 'transfer-encoding', 'content-length', 'upgrade')
+
+def is_upgrade(get_header) -> bool:
+    """Whether the request asks to switch protocols (Connection: Upgrade plus an Upgrade header)"""
+    connection = (get_header('Connection') or '').lower()
+    return bool(get_header('Upgrade')) and 'upgrade' in [token.strip() for token in connection.split(',')]
+
+def is_event_stream(content_type) -> bool:
+    return (content_type or '').split(';', 1)[0].strip().lower() == 'text/event-stream'
+
+def read_response_head(sock: socket.socket) -> Tuple[bytes, bytes]:
+    """
+    Read an HTTP response head from a blocking socket.
+
+    Returns (head including the blank line, bytes that arrived after it).
+    """
+    data = b''
+    while b'\r\n\r\n' not in data:
+        if len(data) > MAX_HEAD_BYTES:
+            raise ConnectionError("Upstream response head too large")
+        chunk = sock.recv(16 * 1024)
+        if not chunk:
+            raise ConnectionError("Upstream closed the connection during the handshake")
+        data += chunk
+    end = data.index(b'\r\n\r\n') + 4
+    return data[:end], data[end:]
+
+def response_status(head: bytes) -> int:
+    return int(head.split(b' ', 2)[1])
+
+def parse_response_head(head: bytes) -> Tuple[int, str, List[Tuple[str, str]]]:
+    """(status, reason, headers) of a raw response head"""
+    lines = head.decode('latin-1').split('\r\n')
+    _, status, reason = (lines[0].split(' ', 2) + [''])[:3]
+    headers = []
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers.append((name.strip(), value.strip()))
+    return int(status), reason, headers
+
+def body_framing(status: int, headers: List[Tuple[str, str]]) -> Tuple[bool, Optional[int]]:
+    """
+    How a response body is delimited.
+
+    Returns:
+        (chunked, length); length is None when the body runs until the upstream closes
+    """
+    lowered = {name.lower(): value for name, value in headers}
+    if 100 <= status < 200 or status in (204, 304):
+        return False, 0
+    if 'chunked' in lowered.get('transfer-encoding', '').lower():
+        return True, None
+    try:
+        return False, int(lowered['content-length'])
+    except (KeyError, ValueError):
+        return False, None
+
+def refusal_response(head: bytes, body: bytes) -> bytes:
+    """A refused handshake's answer with its body, re-framed by Content-Length and closing the connection"""
+    status, reason, headers = parse_response_head(head)
+    lines = [f"HTTP/1.1 {status} {reason}".rstrip()]
+    lines.extend(f"{name}: {value}" for name, value in headers if name.lower() not in REFUSAL_DROPPED_HEADERS)
+    lines.append(f"Content-Length: {len(body)}")
+    lines.append("Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body
+
+def read_refusal_body(sock: socket.socket, head: bytes, buffered: bytes = b'') -> bytes:
+    """
+    Read the body of a non-101 handshake answer from a blocking socket.
+
+    `buffered` is what read_response_head() returned past the head. Chunked
+    bodies are decoded; the result is at most MAX_REFUSAL_BODY_BYTES.
+    """
+    status, _, headers = parse_response_head(head)
+    chunked, length = body_framing(status, headers)
+    data = bytearray(buffered)
+
+    def fill(size: int) -> bool:
+        """Read until `data` holds `size` bytes; False if the upstream closed first"""
+        while len(data) < size:
+            if len(data) > MAX_REFUSAL_BODY_BYTES + MAX_HEAD_BYTES:
+                raise ConnectionError("Refused handshake body too large")
+            chunk = sock.recv(16 * 1024)
+            if not chunk:
+                return False
+            data.extend(chunk)
+        return True
+
+    if not chunked:
+        if length is None:
+            fill(MAX_REFUSAL_BODY_BYTES + 1)
+        elif not fill(length):
+            raise ConnectionError("Upstream closed the connection mid-body")
+        body = bytes(data if length is None else data[:length])
+        if len(body) > MAX_REFUSAL_BODY_BYTES:
+            raise ConnectionError("Refused handshake body too large")
+        return body
+
+    body = bytearray()
+    while True:
+        while b'\r\n' not in data:
+            if not fill(len(data) + 1):
+                raise ConnectionError("Upstream closed the connection mid-body")
+        line, _, rest = bytes(data).partition(b'\r\n')
+        size = _chunk_size(line)
+        data[:] = rest
+        if size == 0:
+            return bytes(body)  # Trailers aren't passed on
+        if not fill(size + 2):
+            raise ConnectionError("Upstream closed the connection mid-body")
+        body += data[:size]
+        del data[:size + 2]
+        if len(body) > MAX_REFUSAL_BODY_BYTES:
+            raise ConnectionError("Refused handshake body too large")
+
+def _chunk_size(line: bytes) -> int:
+    try:
+        return int(line.split(b';', 1)[0], 16)
+    except ValueError:
+        raise ConnectionError("Malformed chunk in refused handshake body") from None
+
+async def read_refusal_body_async(reader, head: bytes) -> bytes:
+    """read_refusal_body() for an asyncio StreamReader positioned after the head"""
+    status, _, headers = parse_response_head(head)
+    chunked, length = body_framing(status, headers)
+    if not chunked:
+        if length is None:
+            body = b''
+            while len(body) <= MAX_REFUSAL_BODY_BYTES:
+                chunk = await reader.read(MAX_REFUSAL_BODY_BYTES + 1 - len(body))
+                if not chunk:
+                    break
+                body += chunk
+        elif length > MAX_REFUSAL_BODY_BYTES:
+            raise ConnectionError("Refused handshake body too large")
+        else:
+            body = await reader.readexactly(length)
+        if len(body) > MAX_REFUSAL_BODY_BYTES:
+            raise ConnectionError("Refused handshake body too large")
+        return body
+
+    body = bytearray()
+    while True:
+        size = _chunk_size(await reader.readline())
+        if size == 0:
+            return bytes(body)
+        if len(body) + size > MAX_REFUSAL_BODY_BYTES:
+            raise ConnectionError("Refused handshake body too large")
+        body += (await reader.readexactly(size + 2))[:size]
+
+def relay_sockets(client: socket.socket, upstream: socket.socket, idle_timeout: float, buffer_bytes: int,
+                  to_upstream: bytes = b'', to_client: bytes = b'', chunk_size: int = 64 * 1024) -> Tuple[str, int, int]:
+    """
+    Copy bytes between two sockets until both directions have ended.
+
+    A side that reaches EOF is half-closed on the other once its bytes are
+    delivered, so either end can finish first. `to_upstream` / `to_client`
+    are bytes already read past the handshake.
+
+    Returns:
+        (close reason: 'client', 'upstream', 'idle' or 'error', bytes sent upstream, bytes sent to the client)
+    """
+    peer = {client: upstream, upstream: client}
+    pending = {upstream: bytearray(to_upstream), client: bytearray(to_client)}  # Bytes waiting to be written to a socket
+    open_for_reading = {client: True, upstream: True}
+    sent = {client: 0, upstream: 0}
+    shut = set()  # Sockets whose peer has been told there's nothing more
+    reason = None
+    for sock in peer:
+        sock.setblocking(False)
+
+    selector = selectors.DefaultSelector()
+    registered = {}
+    last_activity = time.monotonic()
+    try:
+        while open_for_reading[client] or open_for_reading[upstream] or pending[client] or pending[upstream]:
+            for sock in peer:
+                events = 0
+                if open_for_reading[sock] and len(pending[peer[sock]]) < buffer_bytes:
+                    events |= selectors.EVENT_READ
+                if pending[sock]:
+                    events |= selectors.EVENT_WRITE
+                if events != registered.get(sock, 0):
+                    if sock in registered:
+                        selector.unregister(sock)
+                        del registered[sock]
+                    if events:
+                        selector.register(sock, events)
+                        registered[sock] = events
+            if not registered:
+                break
+
+            ready = selector.select(max(0.0, last_activity + idle_timeout - time.monotonic()))
+            if not ready:
+                if time.monotonic() - last_activity >= idle_timeout:
+                    return 'idle', sent[upstream], sent[client]
+                continue
+            last_activity = time.monotonic()
+            for key, events in ready:
+                sock = key.fileobj
+                if events & selectors.EVENT_WRITE:
+                    written = sock.send(pending[sock])
+                    del pending[sock][:written]
+                    sent[sock] += written
+                if events & selectors.EVENT_READ:
+                    data = sock.recv(min(chunk_size, buffer_bytes - len(pending[peer[sock]])))
+                    if data:
+                        pending[peer[sock]] += data
+                    else:
+                        open_for_reading[sock] = False
+                        reason = reason or ('client' if sock is client else 'upstream')
+            for sock in peer:
+                # Pass an EOF on once everything before it has been delivered
+                if not open_for_reading[sock] and not pending[peer[sock]] and sock not in shut:
+                    shut.add(sock)
+                    try:
+                        peer[sock].shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+        return reason or 'client', sent[upstream], sent[client]
+    except OSError:
+        return 'error', sent[upstream], sent[client]
+    finally:
+        selector.close()
+
+async def relay_streams(client_reader, client_writer, upstream_reader, upstream_writer,
+                        idle_timeout: float, buffer_bytes: int, chunk_size: int = 64 * 1024) -> Tuple[str, int, int]:
+    """
+    relay_sockets() for asyncio streams.
+
+    The write buffer limits of both transports are capped at `buffer_bytes`,
+    so a side is only read while the other drains.
+    """
+    loop = asyncio.get_running_loop()
+    last_activity = [loop.time()]
+    sent = {'upstream': 0, 'client': 0}
+    for writer in (client_writer, upstream_writer):
+        writer.transport.set_write_buffer_limits(high=buffer_bytes)
+
+    async def pipe(reader, writer, direction):
+        while True:
+            data = await reader.read(min(chunk_size, buffer_bytes))
+            if not data:
+                break
+            last_activity[0] = loop.time()
+            writer.write(data)
+            sent[direction] += len(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+
+    up = asyncio.ensure_future(pipe(client_reader, upstream_writer, 'upstream'))
+    down = asyncio.ensure_future(pipe(upstream_reader, client_writer, 'client'))
+    reason = None
+    try:
+        pending = {up, down}
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, last_activity[0] + idle_timeout - loop.time()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    return 'error', sent['upstream'], sent['client']
+                reason = reason or ('client' if task is up else 'upstream')
+            if not done and loop.time() - last_activity[0] >= idle_timeout:
+                return 'idle', sent['upstream'], sent['client']
+        return reason or 'client', sent['upstream'], sent['client']
+    finally:
+        for task in (up, down):
+            task.cancel()
@@ -0,0 +1,205 @@
+"""
+Keep-alive connection pool for the proxy's upstream (the Next.js server).
+Connections are shared by every worker thread and reused across requests.
+"""
+import http.client
+import select
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+# Errors that mean a reused socket was closed by the upstream while it sat idle
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+def set_read_timeout(conn: http.client.HTTPConnection, response: http.client.HTTPResponse, timeout: float):
+    """
+    Change how long reads of a response in progress may block.
+
+    A response that ends with the connection has already been detached from
+    `conn`, so its socket is reached through the response's file object.
+    """
+    sock = conn.sock or getattr(getattr(response.fp, 'raw', None), '_sock', None)
+    if sock is not None:
+        sock.settimeout(timeout)
+
+class UpstreamConnection(http.client.HTTPConnection):
+    """HTTPConnection with its own connect timeout; `timeout` applies to reads once connected"""
+
+    def __init__(self, host: str, port: int, timeout: float, connect_timeout: float):
+        super().__init__(host, port, timeout=connect_timeout)
+        self.read_timeout = timeout
+
+    def connect(self):
+        super().connect()
+        self.sock.settimeout(self.read_timeout)
+
+class PoolTimeout(Exception):
+    """Raised when no upstream connection frees up within the wait timeout"""
+
+class UpstreamConnectionPool:
+    """
+    Thread-safe pool of persistent HTTPConnections to a single host.
+
+    Idle connections are kept LIFO so the warmest socket is reused first, and are
+    evicted once they have been idle for `idle_timeout` seconds. This should stay
+    below the upstream's own keep-alive timeout (5s for Node.js) so we drop
+    sockets before the server does.
+    """
+
+    def __init__(self, host: str, port: int, max_size: int = 32, idle_timeout: float = 4.0,
+                 timeout: float = 10, wait_timeout: Optional[float] = None, connect_timeout: Optional[float] = None):
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout  # Per read
+        self.connect_timeout = timeout if connect_timeout is None else connect_timeout
+        self.wait_timeout = timeout if wait_timeout is None else wait_timeout
+
+        self._idle = deque()  # (connection, last_used) pairs, most recent on the right
+        self._open = 0  # idle + checked out
+        self._cond = threading.Condition()
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.evictions = 0
+        self.reconnects = 0
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        Check out a connection, waiting if the pool is at capacity.
+
+        Returns:
+            tuple: (connection, reused) where reused is True for a pooled socket
+        """
+        wait_started = None
+        with self._cond:
+            try:
+                while True:
+                    self._evict_idle(time.monotonic())
+                    while self._idle:
+                        conn, _ = self._idle.pop()
+                        if self._is_usable(conn):
+                            self.hits += 1
+                            return conn, True
+                        self._discard(conn)
+                        self.evictions += 1
+                    if self._open < self.max_size:
+                        self._open += 1
+                        self.misses += 1
+                        break
+                    if wait_started is None:
+                        wait_started = time.monotonic()
+                        self.waits += 1
+                    remaining = self.wait_timeout - (time.monotonic() - wait_started)
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No upstream connection available after {self.wait_timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                if wait_started is not None:
+                    self.wait_time += time.monotonic() - wait_started
+
+        return UpstreamConnection(self.host, self.port, self.timeout, self.connect_timeout), False
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool = True):
+        """Return a connection to the pool, or close it if it can't be reused"""
+        with self._cond:
+            if reusable and conn.sock is not None and len(self._idle) < self.max_size:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def request(self, method: str, path: str, body=None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """
+        Send a request and return (connection, response).
+
+        If a pooled socket turns out to be stale the request is replayed once on a
+        fresh connection, provided the body is bytes (a streamed body can't be
+        sent twice). The caller must read the response and hand the connection
+        back with `release()`.
+        """
+        replayable = body is None or isinstance(body, (bytes, bytearray))
+        conn, reused = self.acquire()
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            return conn, conn.getresponse()
+        except STALE_CONNECTION_ERRORS:
+            self.release(conn, reusable=False)
+            if not (reused and replayable):
+                raise
+        except BaseException:
+            self.release(conn, reusable=False)
+            raise
+
+        with self._cond:
+            self.reconnects += 1
+        conn, _ = self.acquire_fresh()
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            return conn, conn.getresponse()
+        except BaseException:
+            self.release(conn, reusable=False)
+            raise
+
+    def acquire_fresh(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """Check out a connection that has never been used"""
+        conn, reused = self.acquire()
+        if reused:
+            conn.close()
+        return conn, False
+
+    def close(self):
+        """Close every idle connection"""
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing the pool under load"""
+        with self._cond:
+            lookups = self.hits + self.misses
+            return {
+                'size': self.max_size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'waits': self.waits,
+                'wait_time_seconds': round(self.wait_time, 6),
+                'evictions': self.evictions,
+                'reconnects': self.reconnects,
+            }
+
+    def _evict_idle(self, now: float):
+        # The oldest connections sit on the left
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._discard(conn)
+            self.evictions += 1
+
+    def _discard(self, conn: http.client.HTTPConnection):
+        conn.close()
+        self._open -= 1
+
+    @staticmethod
+    def _is_usable(conn: http.client.HTTPConnection) -> bool:
+        """An idle keep-alive socket should have nothing to read; readable means EOF or junk"""
+        if conn.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
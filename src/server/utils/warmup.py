@@ -0,0 +1,102 @@
+"""
+Warm-up for production Next.js workers.
+`next start` renders a route's server code on its first request, so a fresh
+worker is sent the busiest routes before it is put in rotation. The routes
+come from a configured list, an access log or the proxy's own metrics.
+"""
+import http.client
+import json
+import re
+import time
+from collections import Counter, deque
+from typing import Dict, Any, Iterable, List, Optional
+
+# Never worth warming: proxy endpoints, build assets and files served from public/
+SKIPPED_PREFIXES = ('/__proxy', '/_next/', '/api/health', '/avatars/', '/images/')
+SKIPPED_EXTENSIONS = re.compile(r'\.(js|css|map|png|jpe?g|gif|svg|ico|webp|avif|woff2?|ttf|txt|xml|json)$')
+
+# "GET /path HTTP/1.1" 200 in the common/combined log format
+COMMON_LOG_PATTERN = re.compile(r'"(?P<method>[A-Z]+) (?P<path>\S+) HTTP/[\d.]+" (?P<status>\d{3})')
+
+def warmable(path: str) -> bool:
+    """A page or API route rendered by Next.js, as opposed to a static file"""
+    path = path.split('?', 1)[0]
+    return (path.startswith('/') and ':' not in path
+            and not path.startswith(SKIPPED_PREFIXES) and not SKIPPED_EXTENSIONS.search(path))
+
+def routes_from_access_log(log_path: str, limit: int, max_lines: int = 100_000) -> List[str]:
+    """
+    The most requested successful GET paths in the last `max_lines` lines of a log.
+
+    Understands JSON lines with method/path/status fields and the common
+    log format; anything else is skipped.
+    """
+    counts = Counter()
+    try:
+        with open(log_path, errors='replace') as f:
+            lines = deque(f, maxlen=max_lines)
+    except OSError:
+        return []
+    for line in lines:
+        method = path = status = None
+        if line.startswith('{'):
+            try:
+                record = json.loads(line)
+                method, path, status = record.get('method'), record.get('path'), record.get('status')
+            except ValueError:
+                continue
+        else:
+            match = COMMON_LOG_PATTERN.search(line)
+            if match:
+                method, path, status = match.group('method'), match.group('path'), match.group('status')
+        if method == 'GET' and path and str(status).startswith(('2', '3')) and warmable(path):
+            counts[path.split('?', 1)[0]] += 1
+    return [path for path, _ in counts.most_common(limit)]
+
+def pick_warmup_routes(configured: Iterable[str], access_log: Optional[str], recent: Iterable[str],
+                       limit: int) -> List[str]:
+    """
+    Routes to warm, first source that has any: the configured list, the
+    access log, then routes recently served by this proxy. '/' is always included.
+    """
+    routes = [route for route in configured if route]
+    if not routes and access_log:
+        routes = routes_from_access_log(access_log, limit)
+    if not routes:
+        routes = [route for route in recent if warmable(route)]
+    routes = list(dict.fromkeys(['/'] + routes))
+    return routes[:max(limit, 1)]
+
+def warm_routes(port: int, routes: Iterable[str], timeout: float = 30.0, host: str = 'localhost') -> Dict[str, Any]:
+    """
+    GET each route once, sequentially, on one keep-alive connection.
+
+    Failures are recorded, not raised: a route that errors while warming
+    would error for users too, and shouldn't keep the worker out of rotation.
+    """
+    results = []
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        for route in routes:
+            route_started = time.perf_counter()
+            try:
+                conn.request('GET', route, headers={'User-Agent': 'solo-proxy-warmup', 'Accept': 'text/html'})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+                if response.will_close:
+                    conn.close()
+            except (OSError, http.client.HTTPException) as e:
+                status = f'error: {e.__class__.__name__}'
+                conn.close()
+            results.append({'route': route, 'status': status,
+                            'seconds': round(time.perf_counter() - route_started, 3)})
+    finally:
+        conn.close()
+    return {
+        'port': port,
+        'routes': results,
+        'seconds': round(time.perf_counter() - started, 3),
+        'finished_at': time.time(),
+    }
@@ -0,0 +1,85 @@
+import io
+import os
+import time
+
+from src.server.utils.access_log import AccessLog, RotatingFile, SlowRequestLog, request_id_for
+
+
+def make_entry(**fields):
+    entry = {'time': time.time(), 'method': 'GET', 'path': '/', 'status': 200, 'seconds': 0.01}
+    entry.update(fields)
+    return entry
+
+
+def test_rotation_counts_encoded_bytes(tmp_path):
+    path = str(tmp_path / 'access.log')
+    log = RotatingFile(path, max_bytes=100, backups=2)
+    line = 'é' * 30 + '\n'  # 31 characters, 61 bytes
+    log.write(line)
+    log.write(line)
+    log.close()
+    assert log.rotations == 1
+    assert os.path.getsize(path) == 61
+    assert os.path.getsize(path + '.1') == 61
+
+
+def test_rotation_keeps_only_the_configured_backups(tmp_path):
+    path = str(tmp_path / 'access.log')
+    log = RotatingFile(path, max_bytes=10, backups=2)
+    for index in range(5):
+        log.write(f'line {index:04}\n')
+    log.close()
+    assert sorted(os.listdir(tmp_path)) == ['access.log', 'access.log.1', 'access.log.2']
+    assert open(path).read() == 'line 0004\n'
+    assert open(path + '.2').read() == 'line 0002\n'
+
+
+def test_sampling_keeps_errors_and_slow_requests():
+    log = AccessLog(io.StringIO(), sample_rate=0, slow_seconds=1.0)
+    log.record(make_entry())
+    log.record(make_entry(status=502))
+    log.record(make_entry(seconds=2.5))
+    assert log.sampled_out == 1
+    assert log.queue.qsize() == 2
+
+
+def test_full_queue_drops_instead_of_blocking():
+    log = AccessLog(io.StringIO(), max_queue=1)
+    log.record(make_entry())
+    log.record(make_entry())
+    assert log.dropped == 1
+
+
+def test_writer_flushes_queued_records_on_close():
+    stream = io.StringIO()
+    stream.close = lambda: None
+    log = AccessLog(stream, flush_interval=0.05)
+    log.start()
+    log.record(make_entry(seconds=0.123456))
+    log.close()
+    assert log.written == 1
+    assert '"seconds":0.1235' in stream.getvalue()
+
+
+def test_slow_request_report_breaks_down_the_time():
+    slow = SlowRequestLog(threshold=0.5, capacity=2)
+    slow.observe(make_entry(seconds=0.1))
+    slow.observe(make_entry(path='/a', seconds=1.0, queue_seconds=0.25, upstream_seconds=0.5))
+    slow.observe(make_entry(path='/b', seconds=3.0))
+    slow.observe(make_entry(path='/c', seconds=2.0))
+    report = slow.report()
+    assert report['captured'] == 3
+    assert [request['path'] for request in report['requests']] == ['/b', '/c']
+    assert report['requests'][0]['breakdown'] == {
+        'queue_seconds': 0.0, 'upstream_seconds': 0.0, 'response_seconds': 3.0}
+
+    slow = SlowRequestLog(threshold=0.5)
+    slow.observe(make_entry(seconds=1.0, queue_seconds=0.25, upstream_seconds=0.5))
+    assert slow.report()['requests'][0]['breakdown']['response_seconds'] == 0.25
+
+
+def test_request_id_is_kept_only_when_it_looks_like_an_id():
+    assert request_id_for({'X-Request-ID': 'abc-123'}.get) == 'abc-123'
+    generated = request_id_for({'X-Request-ID': 'bad id\n{}'}.get)
+    assert generated != 'bad id\n{}'
+    assert request_id_for(None) != request_id_for(None)
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+
+from src.server.utils.admission import AdmissionController, RateLimiter, TokenBucket, retry_after
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2, burst=2, now=0.0)
+    assert bucket.take(0.0) == 0
+    assert bucket.take(0.0) == 0
+    assert bucket.take(0.0) == 0.5  # Half a second until the next token
+    assert bucket.take(0.5) == 0
+
+
+def test_rate_limiter_is_per_client_and_bounded():
+    limiter = RateLimiter(rate=1, burst=2, max_clients=2)
+    assert limiter.check('a') == 0
+    assert limiter.check('a') == 0
+    assert limiter.check('a') > 0
+    assert limiter.check('b') == 0
+    limiter.check('c')  # Evicts 'a', the least recently seen
+    assert limiter.stats()['clients'] == 2
+    assert limiter.check('a') == 0  # Forgotten, so a fresh burst
+    assert limiter.limited == 1
+
+
+def test_retry_after_is_whole_seconds():
+    assert retry_after(0.01) == 1
+    assert retry_after(1.2) == 2
+
+
+def test_admission_sheds_when_queue_is_full():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=0.05, priority_reserve=1)
+    assert controller.acquire('default')
+    assert not controller.acquire('default')
+    assert controller.stats()['shed']['default']['queue_full'] == 1
+    # The priority lane may use the reserve above the cap
+    assert controller.acquire('priority')
+    controller.release()
+    controller.release()
+    assert controller.in_flight == 0
+
+
+def test_admission_queue_times_out_then_admits_on_release():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.05, priority_reserve=0)
+    assert controller.acquire('default')
+    started = time.monotonic()
+    assert not controller.acquire('default')
+    assert time.monotonic() - started >= 0.05
+    assert controller.stats()['shed']['default']['queue_timeout'] == 1
+
+    controller.queue_timeout = 2
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(controller.acquire('default')))
+    waiter.start()
+    time.sleep(0.05)
+    assert controller.waiting['default'] == 1
+    controller.release()
+    waiter.join(2)
+    assert result == [True]
+    assert controller.in_flight == 1
+
+
+def test_queued_priority_request_blocks_new_default_requests():
+    controller = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=1, priority_reserve=0)
+    assert controller.acquire('default')
+    assert controller.enter_queue('priority')
+    controller.release()
+    assert not controller.try_acquire('default')
+    assert controller.try_acquire('priority', queued=True)
+    controller.leave_queue('priority', admitted=True)
+    assert controller.waiting['priority'] == 0
+
+
+def test_release_wakes_event_loop_waiters():
+    admission = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5)
+
+    async def wait_for_slot(released):
+        assert admission.try_acquire('default')
+        assert not admission.try_acquire('default')
+        assert admission.enter_queue('default')
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.02, admission.release)
+        started = loop.time()
+        await asyncio.wait_for(released.wait(), 1)
+        admitted = admission.try_acquire('default', queued=True)
+        admission.leave_queue('default', admitted)
+        return admitted, loop.time() - started
+
+    async def main():
+        released = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        admission.add_release_listener(lambda: loop.call_soon_threadsafe(released.set))
+        return await wait_for_slot(released)
+
+    admitted, waited = asyncio.run(main())
+    assert admitted
+    assert waited < 0.5
+    assert admission.stats()['shed']['default'] == {'queue_full': 0, 'queue_timeout': 0}
@@ -0,0 +1,23 @@
+from src.server.benchmark import format_result, is_success, percentile, summarize
+
+
+def test_only_2xx_and_3xx_count_as_success():
+    assert is_success(200) and is_success(304)
+    assert not is_success(429)
+    assert not is_success(503)
+
+
+def test_percentile_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 50) is None
+
+
+def test_rejected_requests_are_failures():
+    load = {'latencies': [0.01] * 89, 'statuses': {'200': 89, '429': 61}, 'errors': 0, 'dropped': 0, 'elapsed': 3.0}
+    result = {'mode': 'threaded', **summarize(load, 50, 3), 'proxy_memory': {'max_rss_during_run_mb': 30}}
+    assert result['succeeded'] == 89
+    assert result['client_errors'] == 61
+    assert result['throughput_rps'] == round(89 / 3.0, 1)
+    assert 'failed 61' in format_result(result)
@@ -0,0 +1,125 @@
+import gzip
+import threading
+import time
+import zlib
+
+import pytest
+
+from src.server.utils import compression
+from src.server.utils.compression import (StreamCompressor, VariantCache, compress, is_compressible,
+                                          negotiate_encoding, variant_etag)
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    monkeypatch.setattr(compression, 'supported_encodings', lambda: ('br', 'gzip'))
+
+
+@pytest.fixture
+def gzip_only(monkeypatch):
+    monkeypatch.setattr(compression, 'supported_encodings', lambda: ('gzip',))
+
+
+def test_negotiation_prefers_brotli_on_ties(with_brotli):
+    assert negotiate_encoding('gzip, deflate, br') == 'br'
+    assert negotiate_encoding('gzip;q=1.0, br;q=0.5') == 'gzip'
+    assert negotiate_encoding('br;q=0, gzip') == 'gzip'
+    assert negotiate_encoding('*') == 'br'
+    assert negotiate_encoding('*;q=0, gzip;q=0.1') == 'gzip'
+    assert negotiate_encoding('identity') is None
+    assert negotiate_encoding('') is None
+    assert negotiate_encoding(None) is None
+
+
+def test_negotiation_without_brotli(gzip_only):
+    assert negotiate_encoding('br') is None
+    assert negotiate_encoding('br, gzip') == 'gzip'
+
+
+def test_negotiation_parameters(with_brotli):
+    assert negotiate_encoding('GZIP;Q=0.1, br;q=0.5') == 'br'
+    assert negotiate_encoding('gzip; q=0.5 , br;q=bogus') == 'gzip'
+
+
+def test_compressible_types():
+    assert is_compressible('text/html; charset=utf-8', ())
+    assert is_compressible('Application/JSON', ('application/json',))
+    assert not is_compressible('image/png', ('application/json',))
+    assert not is_compressible(None, ())
+
+
+def test_gzip_round_trip():
+    body = b'<p>hello</p>' * 200
+    assert gzip.decompress(compress(body, 'gzip', 6)) == body
+
+    stream = StreamCompressor('gzip', 6)
+    pieces = [stream.compress(body[:1000]), stream.compress(body[1000:]), stream.finish()]
+    assert pieces[0], "each piece is flushed so the client can start rendering"
+    assert gzip.decompress(b''.join(pieces)) == body
+
+
+def test_brotli_round_trip():
+    brotli = pytest.importorskip('brotli')
+    body = b'{"a": 1}' * 500
+    assert brotli.decompress(compress(body, 'br', 4)) == body
+    stream = StreamCompressor('br', 4)
+    assert brotli.decompress(stream.compress(body) + stream.finish()) == body
+
+
+def test_variant_etags():
+    assert variant_etag('"abc"', 'gzip') == '"abc-gzip"'
+    assert variant_etag('W/"abc"', 'br') == 'W/"abc-br"'
+    assert variant_etag(None, 'gzip') is None
+
+
+def test_variant_cache_is_byte_bounded_lru():
+    cache = VariantCache(max_bytes=10)
+    assert cache.get(('a',), lambda: b'12345') == b'12345'
+    cache.get(('b',), lambda: b'12345')
+    cache.get(('a',), lambda: b'unused')  # Hit; 'b' is now least recent
+    cache.get(('c',), lambda: b'12345')
+    assert cache.stats()['evictions'] == 1
+    assert cache.get(('a',), lambda: b'rebuilt') == b'12345'
+    assert cache.get(('b',), lambda: b'rebuilt') == b'rebuilt'
+    assert cache.get(('big',), lambda: b'x' * 11) == b'x' * 11  # Too big to keep
+    assert cache.stats()['bytes'] <= 10
+
+
+def test_concurrent_misses_share_one_build():
+    cache = VariantCache(max_bytes=1024)
+    started = threading.Event()
+    release = threading.Event()
+    builds = []
+
+    def build():
+        builds.append(1)
+        started.set()
+        release.wait(5)
+        return b'compressed'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(('a',), build))) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.stats()['coalesced'] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert builds == [1]
+    assert results == [b'compressed'] * 4
+    assert cache.peek(('a',)) == b'compressed'
+
+
+def test_failed_build_is_not_left_registered():
+    cache = VariantCache(max_bytes=1024)
+
+    def fail():
+        raise zlib.error('boom')
+
+    with pytest.raises(zlib.error):
+        cache.get(('a',), fail)
+    assert cache.peek(('a',)) is None
+    assert cache.get(('a',), lambda: b'ok') == b'ok'
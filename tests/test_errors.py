@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from src.server.utils import errors
+from src.server.utils.errors import (ERROR_DESCRIPTIONS, ERROR_REGISTRY, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST,
+                                     SEVERITY_LOG_LEVELS,
+                                     UNKNOWN_ERROR, AsyncJsonLinesHandler, ErrorAggregator, ErrorCodes,
+                                     ErrorSeverity, error_fingerprint, get_error_details)
+
+
+class BlockingStream:
+    """Holds the writer thread in write() until released, so the queue can be filled"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lines = []
+
+    def write(self, text):
+        self.release.wait(5)
+        self.lines.append(text)
+
+    def flush(self):
+        pass
+
+
+def make_record(message):
+    return logging.LogRecord('test', logging.ERROR, __file__, 1, message, None, None)
+
+
+def test_flush_returns_after_drop_oldest_overflow():
+    stream = BlockingStream()
+    handler = AsyncJsonLinesHandler(stream, max_queue=2, overflow=OVERFLOW_DROP_OLDEST)
+    try:
+        for index in range(6):
+            handler.emit(make_record(f"record {index}"))
+        assert handler.dropped >= 1
+
+        stream.release.set()
+        flusher = threading.Thread(target=handler.flush, daemon=True)
+        flusher.start()
+        flusher.join(3)
+        assert not flusher.is_alive(), "flush() hung after records were dropped"
+        assert 'record 5' in ''.join(stream.lines)
+    finally:
+        stream.release.set()
+        handler.close()
+
+
+def stalled_handler(overflow, max_queue=2):
+    """A handler whose writer is stuck in write() with a full queue behind it"""
+    stream = BlockingStream()
+    handler = AsyncJsonLinesHandler(stream, max_queue=max_queue, overflow=overflow)
+    handler.emit(make_record("taken by the writer"))
+    deadline = time.monotonic() + 2
+    while handler.queue.qsize() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    for index in range(max_queue):
+        handler.emit(make_record(f"queued {index}"))
+    assert handler.queue.full()
+    return stream, handler
+
+
+@pytest.mark.parametrize('overflow', [OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST])
+def test_close_does_not_hang_on_a_full_queue(overflow, monkeypatch):
+    monkeypatch.setattr(errors, 'ASYNC_LOG_CLOSE_TIMEOUT', 0.2)
+    stream, handler = stalled_handler(overflow)
+    closer = threading.Thread(target=handler.close, daemon=True)
+    closer.start()
+    closer.join(2)
+    stream.release.set()
+    assert not closer.is_alive(), "close() blocked on the full queue"
+
+
+def test_dropped_count_is_exact_under_concurrent_producers():
+    stream, handler = stalled_handler(OVERFLOW_DROP_NEWEST, max_queue=1)
+    try:
+        producers = [threading.Thread(target=lambda: [handler.emit(make_record("x")) for _ in range(2000)])
+                     for _ in range(8)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        assert handler.dropped == 8 * 2000
+    finally:
+        stream.release.set()
+        handler.close()
+
+
+def test_every_error_code_is_registered_with_a_description():
+    codes = [value for name, value in vars(ErrorCodes).items() if not name.startswith('_')]
+    assert len(ERROR_REGISTRY) == len(codes)
+    for code, severity in codes:
+        description, registered_severity = ERROR_REGISTRY[code]
+        assert description != UNKNOWN_ERROR[0], code
+        assert registered_severity == severity
+        assert registered_severity in SEVERITY_LOG_LEVELS
+
+
+def test_error_details_lookup():
+    assert get_error_details('API001') == (ERROR_DESCRIPTIONS['API001'], ErrorSeverity.WARNING)
+    assert get_error_details('API001', ErrorSeverity.CRITICAL)[1] == ErrorSeverity.CRITICAL
+    assert get_error_details('NOPE999') == UNKNOWN_ERROR
+
+
+def test_fingerprints_ignore_numbers_but_not_shape():
+    assert error_fingerprint('DB002', {'user': 'user 123', 'ms': 5}) == \
+        error_fingerprint('DB002', {'ms': 900, 'user': 'user 456'})
+    assert error_fingerprint('DB002', {'user': 'alice'}) != error_fingerprint('DB002', {'user': 'bob'})
+    assert error_fingerprint('DB002', {'a': 1}) != error_fingerprint('DB002', {'b': 1})
+    assert error_fingerprint('DB002', {}) != error_fingerprint('DB001', {})
+    assert error_fingerprint('DB002', {}, ValueError('x')) != error_fingerprint('DB002', {}, KeyError('x'))
+    assert error_fingerprint('DB002', {}, ValueError('x')) == error_fingerprint('DB002', {}, ValueError('y'))
+
+
+def test_aggregator_logs_first_occurrence_then_a_summary(caplog):
+    logger = logging.getLogger('test.aggregator')
+    aggregator = ErrorAggregator(window=60)
+    admitted = [aggregator.admit(logger, 'DB002', {'query': f'select {n}'}) for n in range(5)]
+    assert admitted == [True, False, False, False, False]
+    assert aggregator.suppressed == 4
+
+    with caplog.at_level(logging.ERROR, logger='test.aggregator'):
+        aggregator.flush()
+    assert aggregator.summaries == 1
+    assert 'repeated 5x' in caplog.text
+    assert '"suppressed": 4' in caplog.text
+    assert aggregator.window_counts()['codes'] == {}
+
+
+def test_aggregator_sample_rate_and_overflow():
+    logger = logging.getLogger('test.aggregator')
+    sampled = ErrorAggregator(window=60, sample_rates={'CACHE001': 1.0})
+    assert all(sampled.admit(logger, 'CACHE001', {}) for _ in range(3))
+
+    bounded = ErrorAggregator(window=60, max_fingerprints=2)
+    for name in ('a', 'b', 'c', 'd'):
+        bounded.admit(logger, 'DB002', {'table': name})
+    counts = bounded.window_counts()['codes']['DB002']
+    assert counts['count'] == 4
+    assert counts['fingerprints'] == 3  # Two tracked plus the overflow bucket
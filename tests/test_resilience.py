@@ -0,0 +1,112 @@
+import time
+from types import SimpleNamespace
+
+from src.server.utils.balancer import UpstreamGroup, UpstreamWorker
+from src.server.utils.metrics import ProxyMetrics
+from src.server.utils.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, LatencyWindow, RetryBudget
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=60)
+    breaker.record(False)
+    breaker.record(False)
+    breaker.record(True)  # A success resets the run
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.available()
+    assert breaker.stats()['opens'] == 1
+
+
+def test_breaker_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05, half_open_probes=1)
+    breaker.record(False)
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+
+    assert breaker.available()
+    assert breaker.state == HALF_OPEN
+    assert breaker.try_begin()
+    assert not breaker.available(), "only one probe at a time"
+    assert not breaker.try_begin()
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert breaker.try_begin()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.available()
+
+
+def test_retry_budget_allows_ratio_plus_floor():
+    budget = RetryBudget(ratio=0.1, min_per_second=0, window=10)
+    for _ in range(50):
+        budget.record_request()
+    spent = [budget.try_spend() for _ in range(10)]
+    assert spent.count(True) == 5
+    assert budget.exhausted == 5
+
+    quiet = RetryBudget(ratio=0.1, min_per_second=0.2, window=10)
+    assert [quiet.try_spend('hedge') for _ in range(3)] == [True, True, False]
+    assert quiet.stats()['spent'] == {'retry': 0, 'hedge': 2}
+
+
+def test_latency_window_needs_min_samples():
+    window = LatencyWindow(size=100, min_samples=10, refresh_every=1)
+    for value in range(9):
+        window.observe(value / 100)
+    assert window.percentile(0.95) is None
+    window.observe(0.09)
+    assert window.percentile(0.5) == 0.05
+    assert window.percentile(0.95) == 0.09
+
+
+def make_worker(index, ready=True):
+    return UpstreamWorker(index, 4000 + index, pool=None, readiness=SimpleNamespace(ready=ready))
+
+
+def test_acquire_exclude_never_returns_the_excluded_worker():
+    only = make_worker(0)
+    group = UpstreamGroup([only])
+    assert not group.has_alternative(only)
+    assert group.acquire(exclude=only) is None
+    assert group.acquire(avoid=only) is only  # avoid still falls back to the sole candidate
+
+    other = make_worker(1)
+    group = UpstreamGroup([only, other])
+    assert group.has_alternative(only)
+    assert group.acquire(exclude=only) is other
+
+    other.breaker = CircuitBreaker('open', failure_threshold=1, reset_timeout=60)
+    other.breaker.record(False)
+    assert not group.has_alternative(only)
+
+
+def test_acquire_reserves_half_open_probes_atomically():
+    probing = make_worker(0)
+    probing.breaker = CircuitBreaker('probing', failure_threshold=1, reset_timeout=0, half_open_probes=1)
+    probing.breaker.record(False)
+    assert probing.breaker.try_begin()  # The one probe is out
+    probing.breaker.available = lambda: True  # As a concurrent request saw it before the probe was taken
+
+    group = UpstreamGroup([probing])
+    assert group.acquire() is None
+    assert probing.in_flight == 0
+
+    spare = make_worker(1)
+    spare.in_flight = 5  # Least connections would pick the half-open worker first
+    group = UpstreamGroup([probing, spare])
+    assert group.acquire() is spare
+    assert probing.in_flight == 0
+    assert group.acquire(avoid=spare) is spare  # Falls back to the avoided worker
+
+
+def test_counters_render_with_counter_type():
+    metrics = ProxyMetrics()
+    metrics.register_counter('proxy_things_total', 'Things.', lambda: [({'kind': 'a'}, 3)])
+    metrics.register_gauge('proxy_things_open', 'Open things.', lambda: [({}, 1)])
+    text = metrics.render()
+    assert '# TYPE proxy_things_total counter' in text
+    assert 'proxy_things_total{kind="a"} 3' in text
+    assert '# TYPE proxy_things_open gauge' in text
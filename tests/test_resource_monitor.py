@@ -0,0 +1,57 @@
+import os
+
+from src.server.utils import resource_monitor
+from src.server.utils.resource_monitor import ResourceAlert, ResourceMonitor, process_groups
+
+
+def write_process(proc, pid, pgrp, name='node', utime=10, stime=5, threads=3, rss_pages=100):
+    directory = proc / str(pid)
+    directory.mkdir()
+    # pid (comm) state ppid pgrp session tty tpgid flags minflt cminflt majflt cmajflt utime stime ... num_threads
+    fields = ['S', '1', str(pgrp)] + ['0'] * 8 + [str(utime), str(stime)] + ['0'] * 4 + [str(threads)]
+    (directory / 'stat').write_text(f"{pid} ({name}) {' '.join(fields)}\n")
+    (directory / 'statm').write_text(f"1000 {rss_pages} 0 0 0 0 0\n")
+
+
+def test_process_groups_walks_proc_once(tmp_path, monkeypatch):
+    write_process(tmp_path, 100, 100, name='npx next start')
+    write_process(tmp_path, 101, 100)
+    write_process(tmp_path, 200, 200)
+    (tmp_path / 'self').mkdir()
+    monkeypatch.setattr(resource_monitor, 'PROC', str(tmp_path))
+
+    listed = []
+    listdir = os.listdir
+    monkeypatch.setattr(resource_monitor.os, 'listdir', lambda path: listed.append(path) or listdir(path))
+    groups = process_groups()
+    assert {pgrp: sorted(pids) for pgrp, pids in groups.items()} == {100: [100, 101], 200: [200]}
+    assert listed == [str(tmp_path)]
+
+
+def test_sample_counts_each_worker_group_from_one_walk(tmp_path, monkeypatch):
+    write_process(tmp_path, 100, 100, threads=2)
+    write_process(tmp_path, 101, 100, threads=5)
+    write_process(tmp_path, 200, 200, threads=1)
+    monkeypatch.setattr(resource_monitor, 'PROC', str(tmp_path))
+    walks = []
+    monkeypatch.setattr(resource_monitor, 'process_groups',
+                        lambda: walks.append(1) or process_groups())
+
+    monitor = ResourceMonitor(processes=lambda: {'worker-0': 100, 'worker-1': 200, 'worker-2': 300})
+    processes = monitor.sample()['processes']
+    assert len(walks) == 1
+    assert processes['worker-0']['pids'] == 2
+    assert processes['worker-0']['threads'] == 7
+    assert processes['worker-1']['pids'] == 1
+    assert 'worker-2' not in processes  # Exited: no /proc entry
+
+
+def test_alert_hysteresis():
+    alert = ResourceAlert('cpu', 'RES001', high=80, clear=70, sustain=2)
+    assert alert.update(85) is None
+    assert alert.update(60) is None
+    assert alert.update(85) is None
+    assert alert.update(90) == 'fired'
+    assert alert.update(75) is None
+    assert alert.update(70) == 'cleared'
+    assert alert.fired == 1
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from src.server.utils.response_cache import FRESH, STALE, ResponseCache, parse_cache_control
+
+
+def make_cache(fetch=None, **options):
+    return ResponseCache(1024 * 1024, 64 * 1024, fetch or (lambda path, headers: (200, [], b'')), **options)
+
+
+def no_headers(name):
+    return None
+
+
+def test_parse_cache_control():
+    assert parse_cache_control('public, max-age=60, s-maxage="30", No-Store') == {
+        'public': None, 'max-age': '60', 's-maxage': '30', 'no-store': None}
+    assert parse_cache_control(None) == {}
+
+
+@pytest.mark.parametrize('status, headers, request_headers', [
+    (500, [('Cache-Control', 'max-age=60')], {}),
+    (200, [('Cache-Control', 'no-store, max-age=60')], {}),
+    (200, [('Cache-Control', 'private, max-age=60')], {}),
+    (200, [('Cache-Control', 'no-cache, max-age=60')], {}),
+    (200, [('Cache-Control', 'max-age=60'), ('Set-Cookie', 'a=1')], {}),
+    (200, [('Cache-Control', 'max-age=60'), ('Vary', '*')], {}),
+    (200, [('Cache-Control', 'max-age=0')], {}),
+    (200, [], {}),
+    (200, [('Cache-Control', 'max-age=60')], {'Authorization': 'Bearer x'}),
+])
+def test_not_storable(status, headers, request_headers):
+    assert make_cache().storable(status, headers, request_headers) is None
+
+
+def test_storable_lifetimes():
+    cache = make_cache(default_stale_while_revalidate=5)
+    assert cache.storable(200, [('Cache-Control', 'max-age=60')], {}) == (60, 5)
+    assert cache.storable(200, [('Cache-Control', 'max-age=60, s-maxage=10')], {}) == (10, 5)
+    assert cache.storable(200, [('Cache-Control', 'max-age=60, stale-while-revalidate=30')], {}) == (60, 30)
+    assert cache.storable(200, [('Cache-Control', 'max-age=60, must-revalidate')], {}) == (60, 0)
+    assert cache.storable(200, [('Cache-Control', 'max-age=60'), ('Age', '50')], {}) == (10, 5)
+    # Credentials only with an explicit shared-cache opt-in
+    assert cache.storable(200, [('Cache-Control', 'public, max-age=60')], {'Authorization': 'x'}) == (60, 5)
+
+
+def test_entries_are_keyed_by_vary_headers():
+    cache = make_cache()
+    headers = [('Cache-Control', 'max-age=60'), ('Vary', 'Accept-Language')]
+    cache.store('/p', {'Accept-Language': 'fr'}, 200, headers, b'bonjour', (60, 0))
+    cache.store('/p', {'Accept-Language': 'en'}, 200, headers, b'hello', (60, 0))
+
+    french = {'accept-language': 'fr'}
+    key = cache.key_for('/p', lambda name: french.get(name))
+    entry, freshness = cache.lookup(key, no_headers)
+    assert (entry.body, freshness) == (b'bonjour', FRESH)
+
+    cache.invalidate('/p', reason='test')
+    assert cache.lookup(key, no_headers) == (None, None)
+
+
+def test_request_no_cache_bypasses_the_cache():
+    cache = make_cache()
+    cache.store('/p', {}, 200, [], b'x', (60, 0))
+    assert cache.lookup(('/p',), lambda name: 'no-cache' if name == 'Cache-Control' else None) == (None, None)
+
+
+def test_lru_eviction_by_bytes():
+    cache = ResponseCache(1000, 1000, lambda path, headers: (200, [], b''))
+    for path in ('/a', '/b', '/c'):
+        cache.store(path, {}, 200, [], b'x' * 200, (60, 0))  # 456 bytes with overhead
+    assert cache.stats()['evictions'] == 1
+    assert cache.lookup(('/a',), no_headers) == (None, None)
+    assert cache.lookup(('/c',), no_headers)[1] == FRESH
+
+
+def test_revalidation_does_not_replay_per_request_headers():
+    seen = []
+    done = threading.Event()
+
+    def fetch(path, headers):
+        seen.append(headers)
+        done.set()
+        return 304, [('Cache-Control', 'max-age=60')], b''
+
+    cache = make_cache(fetch)
+    request_headers = {'X-Request-ID': 'client-1', 'Cookie': 'session=secret', 'Authorization': 'Bearer t',
+                       'Accept-Language': 'fr'}
+    response_headers = [('Cache-Control', 'public, max-age=0, stale-while-revalidate=60'), ('ETag', '"v1"')]
+    cache.store('/p', request_headers, 200, response_headers, b'body', (0, 60))
+    time.sleep(0.01)
+
+    entry, freshness = cache.lookup(('/p',), no_headers)
+    assert freshness == STALE
+    assert done.wait(2)
+    replayed = seen[0]
+    assert replayed['If-None-Match'] == '"v1"'
+    assert replayed['Accept-Language'] == 'fr'
+    assert not {'X-Request-ID', 'Cookie', 'Authorization'} & replayed.keys()
+
+
+def test_vary_on_cookie_keeps_the_cookie_for_revalidation():
+    cache = make_cache()
+    cache.store('/p', {'Cookie': 'theme=dark'}, 200, [('Vary', 'Cookie')], b'dark', (60, 0))
+    entry, _ = cache.lookup(('/p', 'theme=dark'), no_headers)
+    assert entry.request_headers == {'Cookie': 'theme=dark'}
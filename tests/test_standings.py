@@ -0,0 +1,87 @@
+import random
+
+from src.server.utils.standings import LeaderboardIndex, StandingsEngine, format_grade, grade_value
+
+USERS = [{'id': user_id, 'username': f'climber{user_id}'} for user_id in range(1, 9)]
+ROUTES = [{'id': route_id, 'gymId': 1 + route_id % 3, 'grade': f'5.{8 + route_id % 5}{"abcd"[route_id % 4]}'}
+          for route_id in range(1, 13)]
+
+
+def random_send(rng, send_id):
+    return {
+        'id': send_id,
+        'userId': rng.choice(USERS)['id'],
+        'routeId': rng.choice(ROUTES)['id'],
+        'points': rng.choice([0, 10, 25, 50]),  # Plenty of ties
+        'sent': rng.random() < 0.7,
+        'attempts': rng.randint(1, 5),
+    }
+
+
+def snapshot(engine):
+    return {
+        'overall': engine.leaderboard(limit=100),
+        'gyms': {gym_id: (engine.leaderboard(limit=100, gym_id=gym_id), engine.gym_totals(gym_id))
+                 for gym_id in (1, 2, 3)},
+        'users': {user['id']: engine.user_standing(user['id']) for user in USERS},
+    }
+
+
+def test_incremental_updates_match_rebuild():
+    rng = random.Random(19)
+    engine = StandingsEngine()
+    engine.rebuild(USERS, ROUTES, [])
+    sends = {}
+    next_id = 1
+    for _ in range(400):
+        action = rng.random()
+        if action < 0.55 or not sends:
+            send = random_send(rng, next_id)
+            next_id += 1
+        elif action < 0.8:
+            send = random_send(rng, rng.choice(list(sends)))  # An edit, possibly to another user or gym
+        else:
+            send_id = rng.choice(list(sends))
+            del sends[send_id]
+            engine.remove_send(send_id)
+            continue
+        sends[send['id']] = send
+        engine.apply_send(send)
+
+    rebuilt = StandingsEngine()
+    rebuilt.rebuild(USERS, ROUTES, list(sends.values()))
+    assert snapshot(engine) == snapshot(rebuilt)
+
+
+def test_removing_every_send_matches_an_empty_rebuild():
+    engine = StandingsEngine()
+    engine.rebuild(USERS, ROUTES, [])
+    engine.apply_send({'id': 1, 'userId': 1, 'routeId': 1, 'points': 10})
+    engine.remove_send(1)
+
+    empty = StandingsEngine()
+    empty.rebuild(USERS, ROUTES, [])
+    assert snapshot(engine) == snapshot(empty)
+
+
+def test_leaderboard_ties_are_ordered_by_id():
+    index = LeaderboardIndex()
+    for member_id, points in ((5, 10), (2, 30), (9, 10), (3, 10)):
+        index.set(member_id, points)
+    assert index.top(10) == [(2, 30), (3, 10), (5, 10), (9, 10)]
+    assert [index.rank(member_id) for member_id in (2, 3, 5, 9)] == [1, 2, 3, 4]
+
+    index.set(9, 30)
+    assert index.top(2) == [(2, 30), (9, 30)]
+    assert index.rank(5) == 4
+    index.discard(2)
+    assert index.rank(9) == 1
+    assert index.rank(2) is None
+    assert LeaderboardIndex.from_points({5: 10, 9: 30, 3: 10}).top(3) == index.top(3)
+
+
+def test_grades_round_trip():
+    assert grade_value('5.11c') == 11.5
+    assert grade_value('V4') is None
+    assert format_grade(11.5) == '5.11c'
+    assert format_grade(None) == 'N/A'
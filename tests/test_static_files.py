@@ -0,0 +1,97 @@
+from email.utils import parsedate_to_datetime
+
+from src.server.utils.static_files import (IMMUTABLE_CACHE_CONTROL, StaticEntry, _parse_range, etag_matches,
+                                           is_content_hashed, plan_static_response)
+
+ETAG = '"abc-100"'
+LAST_MODIFIED = 'Sun, 18 Oct 2026 10:00:00 GMT'
+
+
+MTIME = parsedate_to_datetime(LAST_MODIFIED).timestamp()
+
+
+def make_entry(size=100, mtime=MTIME):
+    return StaticEntry('/tmp/file.js', size, mtime, int(mtime * 1e9), ETAG, LAST_MODIFIED,
+                       'application/javascript', IMMUTABLE_CACHE_CONTROL)
+
+
+def plan(entry=None, **headers):
+    lookup = {name.replace('_', '-').lower(): value for name, value in headers.items()}
+    return plan_static_response(entry or make_entry(), lambda name: lookup.get(name.lower()))
+
+
+def header(response, name):
+    return dict(response.headers).get(name)
+
+
+def test_parse_range_forms():
+    assert _parse_range('bytes=0-9', 100) == (0, 9)
+    assert _parse_range('bytes=90-', 100) == (90, 99)
+    assert _parse_range('bytes=-10', 100) == (90, 99)
+    assert _parse_range('bytes=-500', 100) == (0, 99)
+    assert _parse_range('bytes=50-500', 100) == (50, 99)
+
+
+def test_parse_range_ignored_or_unsatisfiable():
+    assert _parse_range('items=0-9', 100) is None
+    assert _parse_range('bytes=0-1,5-6', 100) is None
+    assert _parse_range('bytes=abc', 100) is None
+    assert _parse_range('bytes=x-y', 100) is None
+    assert _parse_range('bytes=100-', 100) == 'unsatisfiable'
+    assert _parse_range('bytes=9-5', 100) == 'unsatisfiable'
+    assert _parse_range('bytes=-0', 100) == 'unsatisfiable'
+    assert _parse_range('bytes=-10', 0) == 'unsatisfiable'
+
+
+def test_whole_file():
+    response = plan()
+    assert (response.status, response.offset, response.length) == (200, 0, 100)
+    assert header(response, 'Content-Length') == '100'
+    assert header(response, 'Accept-Ranges') == 'bytes'
+
+
+def test_conditional_requests():
+    assert plan(if_none_match=ETAG).status == 304
+    assert plan(if_none_match=f'"other", W/{ETAG}').status == 304
+    assert plan(if_none_match='*').status == 304
+    assert plan(if_none_match='"other"').status == 200
+    assert plan(if_modified_since=LAST_MODIFIED).status == 304
+    assert plan(if_modified_since='Sat, 17 Oct 2026 10:00:00 GMT').status == 200
+    assert plan(if_modified_since='not a date').status == 200
+    # If-None-Match wins even when If-Modified-Since would match
+    assert plan(if_none_match='"other"', if_modified_since=LAST_MODIFIED).status == 200
+
+
+def test_ranges():
+    response = plan(range='bytes=10-19')
+    assert (response.status, response.offset, response.length) == (206, 10, 10)
+    assert header(response, 'Content-Range') == 'bytes 10-19/100'
+
+    response = plan(range='bytes=200-')
+    assert response.status == 416
+    assert header(response, 'Content-Range') == 'bytes */100'
+
+    assert plan(range='bytes=0-1,5-6').status == 200
+
+
+def test_if_range_only_honours_a_current_validator():
+    assert plan(range='bytes=0-9', if_range=ETAG).status == 206
+    assert plan(range='bytes=0-9', if_range=LAST_MODIFIED).status == 206
+    assert plan(range='bytes=0-9', if_range='"stale"').status == 200
+
+
+def test_content_hashed_names():
+    assert is_content_hashed('main.3f9a2b1c.js')
+    assert is_content_hashed('styles.a1b2c3d4e5.css')
+    assert not is_content_hashed('favicon.ico')
+    assert not is_content_hashed('solo-logo.png')
+    assert not is_content_hashed('background.abcdefgh.png')  # No digit, so probably a word
+
+
+def test_etag_matches_lists_weakly():
+    assert etag_matches('"a", "b-gzip"', '"b-gzip"')
+    assert etag_matches('W/"b"', '"b"')
+    assert etag_matches('"b"', 'W/"b"')
+    assert etag_matches('*', '"anything"')
+    assert not etag_matches('"a", "b"', '"b-gzip"')
+    assert not etag_matches('*', None)
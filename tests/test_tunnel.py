@@ -0,0 +1,87 @@
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from src.server.utils.metrics import TunnelStats
+from src.server.utils.tunnel import (body_framing, is_upgrade, parse_response_head, read_refusal_body,
+                                     read_refusal_body_async, read_response_head, refusal_response)
+
+REFUSED_HEAD = b'HTTP/1.1 404 Not Found\r\nContent-Type: text/html\r\nTransfer-Encoding: chunked\r\n\r\n'
+CHUNKED_BODY = b'5\r\nhello\r\n6;ext=1\r\n world\r\n0\r\n\r\n'
+
+
+def serve(data):
+    """A connected socket whose peer sends `data` and then waits"""
+    ours, theirs = socket.socketpair()
+    theirs.sendall(data)
+    return ours, theirs
+
+
+def test_is_upgrade():
+    headers = {'Connection': 'keep-alive, Upgrade', 'Upgrade': 'websocket'}
+    assert is_upgrade(headers.get)
+    assert not is_upgrade({'Upgrade': 'websocket'}.get)
+
+
+def test_body_framing():
+    assert body_framing(101, []) == (False, 0)
+    assert body_framing(304, [('Content-Length', '10')]) == (False, 0)
+    assert body_framing(200, [('Transfer-Encoding', 'chunked')]) == (True, None)
+    assert body_framing(200, [('content-length', '12')]) == (False, 12)
+    assert body_framing(200, []) == (False, None)
+
+
+def test_chunked_refusal_is_decoded_and_reframed():
+    ours, theirs = serve(REFUSED_HEAD + CHUNKED_BODY[:9])
+    with ours, theirs:
+        head, buffered = read_response_head(ours)
+        threading.Timer(0.01, theirs.sendall, [CHUNKED_BODY[9:]]).start()
+        body = read_refusal_body(ours, head, buffered)
+    assert body == b'hello world'
+
+    status, reason, headers = parse_response_head(refusal_response(head, body).split(b'\r\n\r\n')[0] + b'\r\n\r\n')
+    assert (status, reason) == (404, 'Not Found')
+    assert headers == [('Content-Type', 'text/html'), ('Content-Length', '11'), ('Connection', 'close')]
+    assert refusal_response(head, body).endswith(b'\r\n\r\nhello world')
+
+
+def test_refusal_with_content_length_leaves_the_connection_alone():
+    ours, theirs = serve(b'HTTP/1.1 426 Upgrade Required\r\nContent-Length: 3\r\n\r\nabc')
+    with ours, theirs:
+        head, buffered = read_response_head(ours)
+        assert read_refusal_body(ours, head, buffered) == b'abc'
+
+
+def test_truncated_refusal_is_an_error():
+    ours, theirs = serve(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 10\r\n\r\nabc')
+    with ours:
+        head, buffered = read_response_head(ours)
+        theirs.close()
+        with pytest.raises(ConnectionError):
+            read_refusal_body(ours, head, buffered)
+
+
+def test_async_refusal_body():
+    async def read(data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        head = await reader.readuntil(b'\r\n\r\n')
+        return await read_refusal_body_async(reader, head)
+
+    assert asyncio.run(read(REFUSED_HEAD + CHUNKED_BODY)) == b'hello world'
+    assert asyncio.run(read(b'HTTP/1.1 403 Forbidden\r\n\r\nuntil close')) == b'until close'
+
+
+def test_cancelled_tunnel_frees_its_slot_without_counting():
+    tunnels = TunnelStats(max_open=1)
+    assert tunnels.try_open('websocket')
+    assert not tunnels.try_open('websocket')
+    tunnels.cancel('websocket')
+    stats = tunnels.stats()
+    assert stats['open']['websocket'] == 0
+    assert stats['opened']['websocket'] == 0
+    assert sum(stats['closed'].values()) == 0
+    assert tunnels.try_open('websocket')
@@ -1,11 +1,182 @@
+import io
 import os
-from PIL import Image, ImageDraw
+import sys
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw, features
 import logging
 
 logger = logging.getLogger(__name__)
 
-def generate_pwa_icons():
-    """Generate various sized icons for PWA from the source favicon."""
+# Define the required sizes for different purposes
+ICON_SIZES = {
+    'favicon-16x16.png': 16,
+    'favicon-32x32.png': 32,
+    'apple-touch-icon.png': 180,
+    'android-chrome-96x96.png': 96,
+    'android-chrome-192x192.png': 192,
+    'android-chrome-512x512.png': 512,
+    'favicon.ico': 32
+}
+
+# Bump when the rendering below changes so every icon is rebuilt once
+ICON_BUILD_VERSION = 1
+ICON_MANIFEST = '.icon-manifest.json'
+
+# Responsive variants of the images under public/images: one per width bucket
+# narrower than the source, plus one at the source width, in each format below
+RESPONSIVE_WIDTHS = (320, 640, 960, 1280, 1920)
+RESPONSIVE_SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+RESPONSIVE_FORMATS = {
+    # name: (extension, content type, Pillow save options)
+    'webp': ('.webp', 'image/webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'avif': ('.avif', 'image/avif', {'format': 'AVIF', 'quality': 60, 'speed': 6}),
+}
+RESPONSIVE_DIR = '_variants'  # Inside public/images; skipped as a source
+RESPONSIVE_MANIFEST = 'manifest.json'  # Inside RESPONSIVE_DIR, read by the proxy
+RESPONSIVE_BUILD_VERSION = 1
+
+def fit_icon_size(width, height, target_size):
+    """Size of the logo inside a target_size icon: aspect ratio kept, 10% padding"""
+    aspect_ratio = width / height
+    if aspect_ratio > 1:
+        new_width = target_size
+        new_height = int(target_size / aspect_ratio)
+    else:
+        new_height = target_size
+        new_width = int(target_size * aspect_ratio)
+
+    # Add padding to prevent edge touching
+    padding = int(target_size * 0.1)  # 10% padding
+    return min(new_width, target_size - padding * 2), min(new_height, target_size - padding * 2)
+
+def render_icon(img, target_size, fit_size):
+    """
+    Render one icon from an RGBA image.
+
+    Args:
+        img: Source or pyramid level to resize from
+        target_size: Icon edge length
+        fit_size: (width, height) of the logo, from fit_icon_size() on the source
+    """
+    new_width, new_height = fit_size
+
+    # Resize the image with high-quality resampling
+    resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+    # Calculate position to center
+    x = (target_size - new_width) // 2
+    y = (target_size - new_height) // 2
+
+    # Create a square canvas with transparent background
+    output = Image.new('RGBA', (target_size, target_size), (255, 255, 255, 0))
+    output.paste(resized, (x, y), resized)
+
+    # For larger icons, create circular mask
+    if target_size >= 96:
+        mask = Image.new('L', (target_size, target_size), 0)
+        draw = ImageDraw.Draw(mask)
+        draw.ellipse((0, 0, target_size, target_size), fill=255)
+        output.putalpha(mask)
+    return output
+
+def build_resize_pyramid(img, smallest):
+    """
+    Successive LANCZOS halvings of img, largest first.
+
+    Stops before a level would drop below `smallest` pixels on an edge, so
+    every icon can be resized from a level at least twice its size instead
+    of from the full-resolution source.
+    """
+    levels = [img]
+    while min(levels[-1].size) // 2 >= smallest:
+        width, height = levels[-1].size
+        levels.append(levels[-1].resize((width // 2, height // 2), Image.Resampling.LANCZOS))
+    return levels
+
+def pick_pyramid_level(levels, fit_size):
+    """The smallest level with at least 2x oversampling for fit_size"""
+    for level in reversed(levels):
+        if level.width >= fit_size[0] * 2 and level.height >= fit_size[1] * 2:
+            return level
+    return levels[0]
+
+def atomic_write(output_path, data):
+    """Write bytes to a temporary file next to output_path and rename it into place"""
+    directory, filename = os.path.split(output_path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{filename}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)  # mkstemp creates files readable by the owner only
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+def encode_image(image, **save_options):
+    buffer = io.BytesIO()
+    image.save(buffer, **save_options)
+    return buffer.getvalue()
+
+def atomic_save(image, output_path, **save_options):
+    """Encode an image and write it atomically, so readers never see a partial file"""
+    atomic_write(output_path, encode_image(image, **save_options))
+
+def save_icon(icon, output_path):
+    # Save with high quality
+    if output_path.endswith('.ico'):
+        atomic_save(icon, output_path, format='ICO', quality=95)
+    else:
+        atomic_save(icon, output_path, format='PNG', quality=95, optimize=True)
+
+def _build_icon(level, target_size, fit_size, output_path):
+    # Runs in a pool worker; the level arrives pickled
+    save_icon(render_icon(level, target_size, fit_size), output_path)
+    return output_path
+
+def icon_build_key(source_digest, filename, target_size):
+    """Everything an output depends on; a changed key means it must be rebuilt"""
+    params = json.dumps([ICON_BUILD_VERSION, filename, target_size], separators=(',', ':'))
+    return hashlib.sha256(f'{source_digest}:{params}'.encode()).hexdigest()
+
+def load_icon_manifest(static_dir):
+    try:
+        with open(os.path.join(static_dir, ICON_MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_icon_manifest(static_dir, manifest):
+    atomic_write(os.path.join(static_dir, ICON_MANIFEST),
+                 json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+def icon_up_to_date(manifest_entry, output_path, key):
+    """True when the output was built from the same key and hasn't been touched since"""
+    if not manifest_entry or manifest_entry.get('key') != key:
+        return False
+    try:
+        st = os.stat(output_path)
+    except OSError:
+        return False
+    return st.st_size == manifest_entry.get('size') and st.st_mtime_ns == manifest_entry.get('mtime_ns')
+
+def generate_pwa_icons(force=False, workers=None):
+    """
+    Generate various sized icons for PWA from the source favicon.
+
+    Incremental: the source is hashed and icons whose source, size and build
+    version are unchanged since the last run (per the manifest in the output
+    directory) are skipped. Stale icons are rendered from a resize pyramid,
+    in parallel when there is more than one, and written atomically.
+
+    Args:
+        force: Rebuild every icon regardless of the manifest
+        workers: Process pool size; defaults to the CPU count, 1 renders inline
+    """
     try:
         # Get absolute paths
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -17,21 +188,27 @@ def generate_pwa_icons():
 
         os.makedirs(static_dir, exist_ok=True)
 
-        # Define the required sizes for different purposes
-        icon_sizes = {
-            'favicon-16x16.png': 16,
-            'favicon-32x32.png': 32,
-            'apple-touch-icon.png': 180,
-            'android-chrome-96x96.png': 96,
-            'android-chrome-192x192.png': 192,
-            'android-chrome-512x512.png': 512,
-            'favicon.ico': 32
-        }
-
         if not os.path.exists(source_path):
             logger.error(f"Source favicon not found at: {source_path}")
             return False
 
+        with open(source_path, 'rb') as f:
+            source_digest = hashlib.sha256(f.read()).hexdigest()
+
+        manifest = {} if force else load_icon_manifest(static_dir)
+        stale = {}
+        for filename, target_size in ICON_SIZES.items():
+            key = icon_build_key(source_digest, filename, target_size)
+            output_path = os.path.join(static_dir, filename)
+            if icon_up_to_date(manifest.get(filename), output_path, key):
+                logger.info(f"Up to date: {filename}")
+            else:
+                stale[filename] = (target_size, key, output_path)
+
+        if not stale:
+            logger.info("PWA icons already up to date")
+            return True
+
         # Open the source image
         with Image.open(source_path) as img:
             logger.info(f"Source image opened successfully: {img.size} {img.mode}")
@@ -41,65 +218,199 @@ def generate_pwa_icons():
                 img = img.convert('RGBA')
                 logger.info("Converted image to RGBA mode")
 
-            # Generate each size
-            for filename, target_size in icon_sizes.items():
-                logger.info(f"Generating {filename} ({target_size}x{target_size})")
+            fit_sizes = {filename: fit_icon_size(img.width, img.height, target_size)
+                         for filename, (target_size, _, _) in stale.items()}
+            smallest = min(min(fit_size) for fit_size in fit_sizes.values())
+            levels = build_resize_pyramid(img, max(smallest * 2, 1))
 
-                # Create a square canvas with transparent background
-                icon = Image.new('RGBA', (target_size, target_size), (255, 255, 255, 0))
+            jobs = []
+            for filename, (target_size, _, output_path) in stale.items():
+                level = pick_pyramid_level(levels, fit_sizes[filename])
+                logger.info(f"Generating {filename} ({target_size}x{target_size}) from {level.width}x{level.height}")
+                jobs.append((level, target_size, fit_sizes[filename], output_path))
 
-                # Calculate size to maintain aspect ratio
-                aspect_ratio = img.width / img.height
-                if aspect_ratio > 1:
-                    new_width = target_size
-                    new_height = int(target_size / aspect_ratio)
-                else:
-                    new_height = target_size
-                    new_width = int(target_size * aspect_ratio)
-
-                # Add padding to prevent edge touching
-                padding = int(target_size * 0.1)  # 10% padding
-                new_width = min(new_width, target_size - padding * 2)
-                new_height = min(new_height, target_size - padding * 2)
-
-                # Resize the image with high-quality resampling
-                resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-                # Calculate position to center
-                x = (target_size - new_width) // 2
-                y = (target_size - new_height) // 2
-
-                # For larger icons, create circular mask
-                if target_size >= 96:
-                    # Create circular mask
-                    mask = Image.new('L', (target_size, target_size), 0)
-                    draw = ImageDraw.Draw(mask)
-                    draw.ellipse((0, 0, target_size, target_size), fill=255)
-
-                    # Apply mask to resized image
-                    output = Image.new('RGBA', (target_size, target_size), (255, 255, 255, 0))
-                    output.paste(resized, (x, y), resized)
-                    output.putalpha(mask)
-                else:
-                    output = icon
-                    output.paste(resized, (x, y), resized)
+            workers = min(workers or os.cpu_count() or 1, len(jobs))
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    for output_path in pool.map(_build_icon, *zip(*jobs)):
+                        logger.info(f"Saved icon: {output_path}")
+            else:
+                for job in jobs:
+                    logger.info(f"Saved icon: {_build_icon(*job)}")
 
-                # Save with high quality
-                output_path = os.path.join(static_dir, filename)
-                if filename.endswith('.ico'):
-                    output.save(output_path, 'ICO', quality=95)
-                else:
-                    output.save(output_path, 'PNG', quality=95, optimize=True)
-                logger.info(f"Saved icon: {output_path}")
+        for filename, (_, key, output_path) in stale.items():
+            st = os.stat(output_path)
+            manifest[filename] = {'key': key, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        save_icon_manifest(static_dir, manifest)
 
-        logger.info("PWA icons generated successfully")
+        logger.info(f"PWA icons generated successfully ({len(stale)} rebuilt, "
+                    f"{len(ICON_SIZES) - len(stale)} up to date)")
         return True
     except Exception as e:
         logger.error(f"Error generating PWA icons: {str(e)}")
         return False
 
+def responsive_formats():
+    """The RESPONSIVE_FORMATS this Pillow can encode (AVIF needs a build with libavif)"""
+    return [name for name in RESPONSIVE_FORMATS if features.check(name)]
+
+def responsive_widths(source_width):
+    """Width buckets narrower than the source, then the source width itself"""
+    return [width for width in RESPONSIVE_WIDTHS if width < source_width] + [source_width]
+
+def responsive_build_key(source_digest, formats):
+    """Everything a source's variants depend on; a changed key means they must be rebuilt"""
+    params = json.dumps([RESPONSIVE_BUILD_VERSION, RESPONSIVE_WIDTHS,
+                         [[name, RESPONSIVE_FORMATS[name][2]] for name in formats]],
+                        sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{source_digest}:{params}'.encode()).hexdigest()
+
+def responsive_up_to_date(manifest_entry, output_root, key):
+    """True when the variants were built from the same key and are all still on disk"""
+    if not manifest_entry or manifest_entry.get('key') != key:
+        return False
+    for variant in manifest_entry['variants']:
+        try:
+            if os.path.getsize(os.path.join(output_root, variant['file'])) != variant['bytes']:
+                return False
+        except OSError:
+            return False
+    return True
+
+def _build_responsive_image(source_path, relative_path, output_root, formats):
+    """
+    Encode every width and format of one source; runs in a pool worker.
+
+    Variant files are named after a hash of their bytes, so an unchanged
+    encoding keeps its name (and the browser's cached copy) across rebuilds.
+    A variant at the source width that isn't smaller than the source is
+    dropped; the original is the better answer there.
+    """
+    source_bytes = os.path.getsize(source_path)
+    stem = os.path.splitext(relative_path)[0]
+    with Image.open(source_path) as img:
+        has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+
+    sizes = [(width, max(round(img.height * width / img.width), 1)) for width in responsive_widths(img.width)]
+    levels = build_resize_pyramid(img, max(min(sizes[0]) * 2, 1))
+
+    variants = []
+    for size in sizes:
+        level = pick_pyramid_level(levels, size)
+        resized = level if level.size == size else level.resize(size, Image.Resampling.LANCZOS)
+        for name in formats:
+            extension, content_type, save_options = RESPONSIVE_FORMATS[name]
+            data = encode_image(resized, **save_options)
+            if size[0] == img.width and len(data) >= source_bytes:
+                continue
+            filename = f'{stem}-{size[0]}w.{hashlib.sha256(data).hexdigest()[:10]}{extension}'
+            output_path = os.path.join(output_root, filename)
+            if not os.path.exists(output_path):
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                atomic_write(output_path, data)
+            variants.append({'file': filename.replace(os.sep, '/'), 'format': name, 'content_type': content_type,
+                             'width': size[0], 'height': size[1], 'bytes': len(data)})
+    return {'width': img.width, 'height': img.height, 'bytes': source_bytes, 'variants': variants}
+
+def generate_responsive_images(force=False, workers=None):
+    """
+    Build WebP (and, where Pillow supports it, AVIF) variants of the images in public/images.
+
+    Each source gets one variant per RESPONSIVE_WIDTHS bucket below its own
+    width plus one at full width, written under public/images/_variants with
+    content-hashed names. The manifest there maps every source URL to its
+    variants and is what the proxy negotiates from. Sources whose content and
+    build parameters are unchanged since the last run are skipped, and
+    variant files no longer in the manifest are removed.
+
+    Args:
+        force: Rebuild every source regardless of the manifest
+        workers: Process pool size; defaults to the CPU count, 1 encodes inline
+    """
+    try:
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        public_dir = os.path.join(current_dir, '..', 'public')
+        images_dir = os.path.join(public_dir, 'images')
+        output_root = os.path.join(images_dir, RESPONSIVE_DIR)
+        manifest_path = os.path.join(output_root, RESPONSIVE_MANIFEST)
+
+        formats = responsive_formats()
+        if not formats:
+            logger.error("This Pillow build can't encode WebP or AVIF")
+            return False
+        logger.info(f"Generating responsive images ({', '.join(formats)}) for {images_dir}")
+        os.makedirs(output_root, exist_ok=True)
+
+        try:
+            with open(manifest_path) as f:
+                previous = {} if force else json.load(f).get('images', {})
+        except (OSError, ValueError):
+            previous = {}
+
+        images, stale = {}, {}
+        for dirpath, dirnames, filenames in os.walk(images_dir):
+            if dirpath == images_dir and RESPONSIVE_DIR in dirnames:
+                dirnames.remove(RESPONSIVE_DIR)
+            for filename in sorted(filenames):
+                if not filename.lower().endswith(RESPONSIVE_SOURCE_EXTENSIONS):
+                    continue
+                source_path = os.path.join(dirpath, filename)
+                relative_path = os.path.relpath(source_path, images_dir)
+                url_path = '/' + os.path.relpath(source_path, public_dir).replace(os.sep, '/')
+                with open(source_path, 'rb') as f:
+                    key = responsive_build_key(hashlib.sha256(f.read()).hexdigest(), formats)
+                if responsive_up_to_date(previous.get(url_path), output_root, key):
+                    logger.info(f"Up to date: {url_path}")
+                    images[url_path] = previous[url_path]
+                else:
+                    stale[url_path] = (source_path, relative_path, key)
+
+        if stale:
+            jobs = [(source_path, relative_path, output_root, formats)
+                    for source_path, relative_path, _ in stale.values()]
+            workers = min(workers or os.cpu_count() or 1, len(jobs))
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    entries = list(pool.map(_build_responsive_image, *zip(*jobs)))
+            else:
+                entries = [_build_responsive_image(*job) for job in jobs]
+            for (url_path, (_, _, key)), entry in zip(stale.items(), entries):
+                entry['key'] = key
+                images[url_path] = entry
+                logger.info(f"Built {len(entry['variants'])} variants of {url_path} "
+                            f"({entry['bytes']} bytes -> smallest "
+                            f"{min((v['bytes'] for v in entry['variants']), default=entry['bytes'])})")
+
+        url_root = '/' + os.path.relpath(output_root, public_dir).replace(os.sep, '/') + '/'
+        atomic_write(manifest_path, json.dumps({
+            'version': RESPONSIVE_BUILD_VERSION,
+            'url_root': url_root,
+            'images': images,
+        }, indent=2, sort_keys=True).encode())
+
+        # Variants of removed or rebuilt sources, once the manifest no longer points at them
+        referenced = {os.path.normpath(variant['file']) for entry in images.values() for variant in entry['variants']}
+        for dirpath, _, filenames in os.walk(output_root):
+            for filename in filenames:
+                relative_path = os.path.relpath(os.path.join(dirpath, filename), output_root)
+                if relative_path != RESPONSIVE_MANIFEST and relative_path not in referenced:
+                    os.unlink(os.path.join(dirpath, filename))
+
+        logger.info(f"Responsive images generated successfully ({len(stale)} rebuilt, "
+                    f"{len(images) - len(stale)} up to date)")
+        return True
+    except Exception as e:
+        logger.error(f"Error generating responsive images: {str(e)}")
+        return False
+
 def generate_avatar_set():
-    """Generate the set of avatar images for the application."""
+    """
+    Generate the set of avatar images for the application.
+
+    Only the four files the frontend links to; the proxy renders any other
+    colour or size on request under /avatars/ (src/server/utils/avatars.py).
+    """
     try:
         # Get absolute paths
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -122,16 +433,16 @@ def generate_avatar_set():
             # Convert to RGBA
             img = img.convert('RGBA')
 
+            # Create circular mask, shared by every colour
+            mask = Image.new('L', img.size, 0)
+            draw = ImageDraw.Draw(mask)
+            draw.ellipse((0, 0) + img.size, fill=255)
+
             # Generate each color variant
             for color_name, color_rgb in colors.items():
                 # Create new image with desired color
                 colored = Image.new('RGBA', img.size, color_rgb + (255,))
 
-                # Create circular mask
-                mask = Image.new('L', img.size, 0)
-                draw = ImageDraw.Draw(mask)
-                draw.ellipse((0, 0) + img.size, fill=255)
-
                 # Apply mask to both images
                 output = Image.new('RGBA', img.size, (0, 0, 0, 0))
                 output.paste(colored, mask=mask)
@@ -148,5 +459,6 @@ def generate_avatar_set():
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
-    generate_pwa_icons()
-    generate_avatar_set()
\ No newline at end of file
+    generate_pwa_icons(force='--force' in sys.argv)
+    generate_avatar_set()
+    generate_responsive_images(force='--force' in sys.argv)
\ No newline at end of file